@@ -0,0 +1,249 @@
+"""
+Benchmark suite for koku_vector.Vector.
+
+Times each Vector method over a batch of random vector pairs for every
+combination of dimension, batch size and numeric backend, and writes the
+results as JSON so two runs can be compared.
+
+    # full run, results to a file
+    python koku_vector_bench.py --output bench.json
+
+    # quick smoke run
+    python koku_vector_bench.py --quick
+
+    # compare against an earlier run, exit 1 if anything got >10% slower
+    python koku_vector_bench.py --output new.json --compare bench.json --threshold 0.10
+
+    # check the suite itself (grid, skipping, regression flagging)
+    python koku_vector_bench.py --self-test
+
+Each timing is the best of --repeat passes over the whole batch. Vectors are
+rebuilt before every pass so memoized magnitudes/unit vectors from one pass
+do not leak into the next. Combinations holding more than --max-coords
+coordinates per operand list are skipped and listed under "skipped".
+"""
+import sys
+import os
+import gc
+import json
+import time
+import random
+import platform
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from koku_vector import Vector
+from koku_numeric import get_backend, using_backend
+
+METHODS = ['plus', 'dot_product', 'normalized', 'angle', 'cross_product',
+           'component_projected_to', 'is_parallel']
+DIMENSIONS = [2, 3, 10, 100]
+SIZES = [1, 10, 100, 1000, 10000, 100000]
+BACKENDS = ['float', 'decimal', 'fraction']
+
+QUICK = {'dims': [2, 3, 10], 'sizes': [1, 100], 'backends': ['float', 'decimal']}
+
+## cross product is only defined for 2 and 3 dimensions
+ONLY_DEFINED_IN_TWO_THREE_DIM = set(['cross_product'])
+
+CALLS = {
+    'plus': lambda v, w: v.plus(w),
+    'dot_product': lambda v, w: v.dot_product(w),
+    'normalized': lambda v, w: v.normalized(),
+    'angle': lambda v, w: v.angle(w),
+    'cross_product': lambda v, w: v.cross_product(w),
+    'component_projected_to': lambda v, w: v.component_projected_to(w),
+    'is_parallel': lambda v, w: v.is_parallel(w),
+}
+
+
+def make_coords(size, dim, rng):
+    ## nonzero coordinates so normalized/angle never hit the zero vector
+    return [[str(round(rng.uniform(0.1, 10.) * rng.choice((-1, 1)), 6)) for _ in xrange(dim)]
+            for _ in xrange(size)]
+
+
+def time_method(method, coords_v, coords_w, backend, repeat):
+    call = CALLS[method]
+    best = None
+    for _ in xrange(repeat):
+        vs = [Vector(c, backend) for c in coords_v]
+        ws = [Vector(c, backend) for c in coords_w]
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.time()
+            for v, w in zip(vs, ws):
+                call(v, w)
+            elapsed = time.time() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(methods, dims, sizes, backends, repeat, max_coords, seed):
+    results = []
+    skipped = []
+    for backend_name in backends:
+        backend = get_backend(backend_name)
+        with using_backend(backend):
+            for dim in dims:
+                for size in sizes:
+                    rng = random.Random(seed)
+                    if size*dim > max_coords:
+                        skipped.append({'backend': backend_name, 'dim': dim, 'size': size,
+                                        'reason': 'size*dim > max_coords'})
+                        continue
+                    coords_v = make_coords(size, dim, rng)
+                    coords_w = make_coords(size, dim, rng)
+                    for method in methods:
+                        if method in ONLY_DEFINED_IN_TWO_THREE_DIM and dim not in (2, 3):
+                            continue
+                        best = time_method(method, coords_v, coords_w, backend, repeat)
+                        results.append({
+                            'method': method,
+                            'backend': backend_name,
+                            'dim': dim,
+                            'size': size,
+                            'best_s': best,
+                            'per_op_us': best / size * 1e6,
+                        })
+                        sys.stderr.write('%-24s %-8s dim=%-4d size=%-7d %10.3f us/op\n' % (
+                            method, backend_name, dim, size, best / size * 1e6))
+    return results, skipped
+
+
+def result_key(r):
+    return (r['method'], r['backend'], r['dim'], r['size'])
+
+
+def compare(results, baseline, threshold, min_time):
+    ### Purpose: list entries whose per-op time grew by more than threshold
+    ### (0.10 == 10%) over the baseline. Entries faster than min_time in
+    ### both runs are too noisy to judge and are ignored.
+    base = dict((result_key(r), r) for r in baseline['results'])
+    regressions = []
+    for r in results:
+        b = base.get(result_key(r))
+        if b is None:
+            continue
+        if r['best_s'] < min_time and b['best_s'] < min_time:
+            continue
+        ratio = r['per_op_us'] / b['per_op_us'] if b['per_op_us'] else float('inf')
+        if ratio > 1. + threshold:
+            regressions.append({
+                'method': r['method'], 'backend': r['backend'],
+                'dim': r['dim'], 'size': r['size'],
+                'baseline_us': b['per_op_us'], 'current_us': r['per_op_us'],
+                'ratio': ratio,
+            })
+    return regressions
+
+
+def self_test():
+    ### Purpose: check the grid, skip rules and compare on a tiny run,
+    ### prints a line per failed case and returns the number of failures
+    failed = []
+    results, skipped = run(['plus', 'cross_product'], [3, 10], [1, 4], ['float'], 1, 30, 0)
+    ## cross_product only runs in 3d, dim 10 * size 4 is over max_coords
+    keys = sorted(result_key(r) for r in results)
+    if keys != [('cross_product', 'float', 3, 1), ('cross_product', 'float', 3, 4),
+                ('plus', 'float', 3, 1), ('plus', 'float', 3, 4), ('plus', 'float', 10, 1)]:
+        failed.append(1)
+    if [(s['dim'], s['size']) for s in skipped] != [(10, 4)]:
+        failed.append(2)
+    if not all(r['best_s'] >= 0. and abs(r['per_op_us'] - r['best_s']/r['size']*1e6) < 1e-9 for r in results):
+        failed.append(3)
+    ## the same seed gives the same operands
+    if make_coords(3, 2, random.Random(1)) != make_coords(3, 2, random.Random(1)):
+        failed.append(4)
+    ## compare flags only slowdowns past the threshold and above min_time
+    def entry(method, best):
+        return {'method': method, 'backend': 'float', 'dim': 3, 'size': 10,
+                'best_s': best, 'per_op_us': best/10*1e6}
+    baseline = {'results': [entry('plus', 1.), entry('angle', 1.), entry('normalized', 1e-5)]}
+    current = [entry('plus', 1.05), entry('angle', 1.5), entry('normalized', 1e-4), entry('is_parallel', 9.)]
+    regressions = compare(current, baseline, 0.10, 1e-3)
+    if [(r['method'], round(r['ratio'], 6)) for r in regressions] != [('angle', 1.5)]:
+        failed.append(5)
+    for case in failed:
+        print 'bench test case %d failed' % case
+    return len(failed)
+
+
+def parse_list(text, cast=str):
+    return [cast(t) for t in text.split(',') if t]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark koku_vector.Vector methods')
+    parser.add_argument('--methods', type=parse_list, default=METHODS)
+    parser.add_argument('--dims', type=lambda t: parse_list(t, int), default=DIMENSIONS)
+    parser.add_argument('--sizes', type=lambda t: parse_list(t, int), default=SIZES)
+    parser.add_argument('--backends', type=parse_list, default=BACKENDS)
+    parser.add_argument('--quick', action='store_true',
+                        help='small grid for a smoke run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-coords', type=int, default=2000000,
+                        help='skip combinations with more than this many coordinates per operand list')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results here (default stdout)')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown flagged as a regression')
+    parser.add_argument('--min-time', type=float, default=1e-3,
+                        help='ignore comparisons where both timings are below this (seconds)')
+    parser.add_argument('--self-test', action='store_true',
+                        help='check the suite itself and exit')
+    args = parser.parse_args(argv)
+
+    if args.self_test:
+        return 1 if self_test() else 0
+
+    if args.quick:
+        args.dims, args.sizes, args.backends = QUICK['dims'], QUICK['sizes'], QUICK['backends']
+    for m in args.methods:
+        if m not in CALLS:
+            parser.error('unknown method %r' % m)
+
+    results, skipped = run(args.methods, args.dims, args.sizes, args.backends,
+                           args.repeat, args.max_coords, args.seed)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report['regressions'] = compare(results, baseline, args.threshold, args.min_time)
+        report['threshold'] = args.threshold
+        for r in report['regressions']:
+            sys.stderr.write('REGRESSION %-24s %-8s dim=%-4d size=%-7d %.3f -> %.3f us/op (x%.2f)\n' % (
+                r['method'], r['backend'], r['dim'], r['size'],
+                r['baseline_us'], r['current_us'], r['ratio']))
+        if report['regressions']:
+            status = 1
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print text
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Exact fraction-free (Bareiss) elimination.
+
+The Decimal and float backends decide whether a pivot is zero with a
+tolerance, which can misjudge the rank of a system whose coefficients are
+very large or very small. For integer or rational input the exact answer
+is available: every equation is scaled to integer coefficients and reduced
+with Bareiss' fraction-free elimination, in which each update
+
+    M[i][j] = (M[r][c]*M[i][j] - M[i][c]*M[r][j]) / previous pivot
+
+divides exactly, so all intermediate values are integers no larger than
+minors of the input. Running the update on the rows above the pivot as
+well (the Gauss-Jordan form) leaves every pivot row with the same pivot
+value D, and the RREF is that matrix divided by D. No tolerance is used
+anywhere: zero means zero.
+
+Float and Decimal input is converted exactly with Fraction, so 0.1 is
+taken as the binary value it holds, not as 1/10; pass strings or
+Fractions for decimal values.
+"""
+from fractions import Fraction
+
+from koku_numeric import FRACTION
+
+try:
+    from fractions import gcd as _gcd
+except ImportError:
+    from math import gcd as _gcd
+
+
+def _lcm(a, b):
+    return a // _gcd(a, b) * b
+
+
+class BareissElimination(object):
+    """
+    Exact reduced row echelon form of an augmented matrix.
+    rows: coefficient rows, rhs: constant terms, any values Fraction
+    accepts. After construction:
+        rref_rows, rref_rhs - RREF as Fractions
+        pivot_indices       - pivot column of each row, -1 for zero rows
+        rank                - number of pivots
+        consistent          - False if some row reads 0 = k with k != 0
+        determinant         - for square coefficient matrices, else None
+    """
+    ALL_ROWS_MUST_HAVE_SAME_LENGTH_MSG = 'All rows should have the same number of coefficients'
+
+    def __init__(self, rows, rhs):
+        convert = FRACTION.convert
+        m = len(rows)
+        n = len(rows[0]) if rows else 0
+        for row in rows:
+            if len(row) != n:
+                raise Exception(self.ALL_ROWS_MUST_HAVE_SAME_LENGTH_MSG)
+        self.num_rows, self.num_cols = m, n
+
+        ## Scale every equation to integers, remembering the scale for
+        ## the determinant
+        M = []
+        scale = Fraction(1)
+        for row, c in zip(rows, rhs):
+            values = [convert(x) for x in row] + [convert(c)]
+            den = 1
+            for v in values:
+                den = _lcm(den, v.denominator)
+            M.append([int(v.numerator * (den // v.denominator)) for v in values])
+            scale *= den
+
+        ## Fraction-free Gauss-Jordan
+        prev = 1
+        swaps = 0
+        pivots = []
+        r = 0
+        for c in xrange(n):
+            if r == m:
+                break
+            p = r
+            while p < m and M[p][c] == 0:
+                p += 1
+            if p == m:
+                continue
+            if p != r:
+                M[r], M[p] = M[p], M[r]
+                swaps += 1
+            pivot_row = M[r]
+            pivot = pivot_row[c]
+            for i in xrange(m):
+                if i == r:
+                    continue
+                row = M[i]
+                f = row[c]
+                ## every entry of the row is updated, rows with f == 0
+                ## are still rescaled by pivot/prev. Rows below are zero
+                ## left of c; rows above keep an earlier pivot (which
+                ## becomes the new pivot value) and free columns there.
+                start = c+1 if i > r else 0
+                for j in xrange(start, n+1):
+                    row[j] = (pivot*row[j] - f*pivot_row[j]) // prev
+                row[c] = 0
+            pivots.append(c)
+            prev = pivot
+            r += 1
+
+        self.rank = r
+        self.pivot_indices = pivots + [-1]*(m - r)
+        D = prev
+        self.rref_rows = [[Fraction(x, D) for x in row[:n]] for row in M]
+        self.rref_rhs = [Fraction(row[n], D) for row in M]
+        self.consistent = all(row[n] == 0 for row in M[r:])
+        if m == n:
+            if r < n:
+                self.determinant = Fraction(0)
+            else:
+                self.determinant = (-D if swaps % 2 else D) / scale
+        else:
+            self.determinant = None
+
+
+if __name__ == '__main__':
+
+    ## Bareiss tests against the Fraction backend RREF
+    import random
+    from koku_vector import Vector
+    from koku_hyperplane import Hyperplane
+    from koku_linear_system import LinearSystem
+    from koku_matrix import LUDecomposition
+    random.seed(16)
+
+    def fraction_rref(rows, rhs):
+        system = LinearSystem([Hyperplane(Vector(r,'fraction'), c) for r, c in zip(rows, rhs)], 'fraction')
+        r = system.compute_rref()
+        return ([list(p.normal_vector.coord) for p in r.planes], [p.constant_term for p in r.planes],
+                r.indices_of_first_nonzero_terms_in_each_row())
+
+    for case in range(60):
+        m = random.randint(1, 5)
+        n = random.randint(1, 5)
+        rows = [[random.randint(-9, 9)*random.choice((1, 1, 10**12)) for _ in range(n)] for _ in range(m)]
+        if case % 3 == 0 and m > 1:
+            ## dependent rows: rank deficient
+            rows[-1] = [3*a - 2*b for a, b in zip(rows[0], rows[1 % m])]
+        if case % 4 == 0:
+            ## zero first column in the first row forces a row swap
+            rows[0][0] = 0
+        rhs = [Fraction(random.randint(-9, 9), random.randint(1, 4)) for _ in range(m)]
+        ## rational coefficients too
+        if case % 5 == 0:
+            rows = [[Fraction(a, random.randint(1, 7)) for a in row] for row in rows]
+        e = BareissElimination(rows, rhs)
+        rref_rows, rref_rhs, pivots = fraction_rref(rows, rhs)
+        ## pivot rows match exactly; a zero row reads 0 = k for some
+        ## multiple k of the same constant, only k == 0 matters
+        r = e.rank
+        if not (e.rref_rows == rref_rows and e.rref_rhs[:r] == rref_rhs[:r] and
+                [c == 0 for c in e.rref_rhs[r:]] == [c == 0 for c in rref_rhs[r:]]):
+            print 'bareiss test case 1 failed (case %d)' % case
+        if not (e.pivot_indices == pivots and e.rank == len([p for p in pivots if p >= 0])):
+            print 'bareiss test case 2 failed (case %d)' % case
+        ## consistent: no row reads 0 = k
+        expected = all(c == 0 for p, c in zip(pivots, rref_rhs) if p < 0)
+        if e.consistent != expected:
+            print 'bareiss test case 3 failed (case %d)' % case
+        if m == n:
+            lu = LUDecomposition(rows, FRACTION)
+            if e.determinant != lu.determinant():
+                print 'bareiss test case 4 failed (case %d)' % case
+        elif e.determinant is not None:
+            print 'bareiss test case 4 failed (case %d)' % case
+
+    ## exactness where a tolerance misjudges: a pivot of 1e-30
+    e = BareissElimination([[Fraction(1, 10**30), 1], [1, 1]], [1, 2])
+    if not (e.rank == 2 and e.rref_rhs == [Fraction(10**30, 10**30 - 1), Fraction(10**30 - 2, 10**30 - 1)]):
+        print 'bareiss test case 5 failed'
+    ## row swap needed at the first column, determinant changes sign
+    e = BareissElimination([[0, 2], [3, 0]], [4, 6])
+    if not (e.rref_rows == [[1, 0], [0, 1]] and e.rref_rhs == [2, 2] and e.determinant == -6):
+        print 'bareiss test case 6 failed'
+    try:
+        BareissElimination([[1, 2], [1]], [0, 0])
+        print 'bareiss test case 7 failed'
+    except Exception as err:
+        if BareissElimination.ALL_ROWS_MUST_HAVE_SAME_LENGTH_MSG not in err.args:
+            print 'bareiss test case 7 failed'
@@ -0,0 +1,128 @@
+"""
+Factorize once, solve many.
+
+LinearSystem.compute_solution reduces the whole augmented matrix to RREF
+every time, O(n^3), even when only the constant terms have changed.
+LinearSystem.factorize reduces the coefficients once and records every row
+operation that elimination applied to the constant terms. A new set of
+constant terms is then solved by replaying that record, O(n^2), and
+reading the basepoint off the pivot columns; the direction vectors depend
+only on the coefficients and are computed once.
+
+    f = LinearSystem(planes).factorize()
+    for constants in frames:
+        sol = f.solve(constants)
+
+The replay does the same arithmetic in the same order as compute_rref, so
+f.solve(constants) gives the same Parametrization as solving the system
+with those constant terms, for any system: square or not, singular or not.
+
+The same record gives the rank, the determinant (the row operations take
+A to the identity, so det A = (-1)^swaps / product of the scalings), a
+nullspace basis (the direction vectors) and the inverse (the record
+replayed on each unit vector gives a column of it).
+"""
+from koku_vector import Vector
+from koku_parametrization import Parametrization
+from koku_matrix import AugmentedMatrix, FIRST_NONZERO_PIVOTING, SWAP_OP, SCALE_OP
+
+
+class RREFFactorization(object):
+    """
+    Row operations that take a system's coefficients to RREF, plus what
+    solve needs from the result: the pivot column of each row and the
+    direction vectors.
+    """
+    WRONG_NUMBER_OF_CONSTANTS_MSG = 'Need one constant term per equation'
+    NO_SOLUTIONS_MSG = 'No solutions'
+    MATRIX_MUST_BE_SQUARE_MSG = 'Need as many equations as unknowns'
+    MATRIX_IS_SINGULAR_MSG = 'Matrix is singular'
+
+    def __init__(self, system, pivoting=FIRST_NONZERO_PIVOTING):
+        self.backend = system.backend
+        self.dimension = system.dimension
+        self.num_equations = len(system)
+        with self.backend.activate():
+            matrix = AugmentedMatrix.from_system(system)
+            matrix.log = []
+            matrix.rref(pivoting)
+            self.log = matrix.log
+            self.pivot_indices = list(matrix.pivots)
+            self.direction_vectors = matrix.to_system().get_direction_vectors()
+        self.rank = len([p for p in self.pivot_indices if p >= 0])
+
+    def transform(self, constant_terms):
+        ### Purpose: constant terms of the RREF system for new constant
+        ### terms of the original system
+        if isinstance(constant_terms, Vector):
+            constant_terms = constant_terms.coord
+        convert = self.backend.convert
+        rhs = [convert(c) for c in constant_terms]
+        if len(rhs) != self.num_equations:
+            raise Exception(self.WRONG_NUMBER_OF_CONSTANTS_MSG)
+        with self.backend.activate():
+            return AugmentedMatrix.apply_log(self.log, rhs)
+
+    def solve(self, constant_terms):
+        ### Purpose: solution of the system with these constant terms
+        ### constant_terms: one number per equation (or a Vector)
+        ### -> Parametrization, raises NO_SOLUTIONS_MSG like compute_solution
+        rhs = self.transform(constant_terms)
+        backend = self.backend
+        basept = [backend.zero] * self.dimension
+        for pivot_index, c in zip(self.pivot_indices, rhs):
+            if pivot_index >= 0:
+                basept[pivot_index] = c
+            elif not backend.is_near_zero(c):
+                # 0 = k, no solution
+                raise Exception(self.NO_SOLUTIONS_MSG)
+        return Parametrization(Vector._from_trusted(tuple(basept), backend),
+                               list(self.direction_vectors))
+
+    def solve_many(self, constant_terms_list):
+        ### Purpose: solve for each set of constant terms in turn
+        ### -> list of Parametrization, in order
+        return [self.solve(c) for c in constant_terms_list]
+
+    def nullspace(self):
+        ### Purpose: basis of the solutions of the system with all
+        ### constant terms zero, one Vector per free variable
+        return list(self.direction_vectors)
+
+    def _check_square(self):
+        if self.num_equations != self.dimension:
+            raise Exception(self.MATRIX_MUST_BE_SQUARE_MSG)
+
+    def determinant(self):
+        ### Purpose: determinant of the coefficient matrix
+        self._check_square()
+        backend = self.backend
+        if self.rank < self.dimension:
+            return backend.zero
+        with backend.activate():
+            scale = backend.one
+            swaps = 0
+            for op, coefficient, a, b in self.log:
+                if op == SWAP_OP:
+                    swaps += 1
+                elif op == SCALE_OP:
+                    scale = scale*coefficient
+            det = backend.one/scale
+        return -det if swaps % 2 else det
+
+    def inverse(self):
+        ### Purpose: inverse of the coefficient matrix, as a list of row
+        ### Vectors
+        self._check_square()
+        if self.rank < self.dimension:
+            raise Exception(self.MATRIX_IS_SINGULAR_MSG)
+        backend = self.backend
+        n = self.dimension
+        columns = []
+        for j in xrange(n):
+            unit = [backend.zero]*n
+            unit[j] = backend.one
+            ## rows of the RREF are already in pivot column order
+            columns.append(self.transform(unit))
+        return [Vector._from_trusted(tuple(col[i] for col in columns), backend)
+                for i in xrange(n)]
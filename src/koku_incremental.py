@@ -0,0 +1,360 @@
+"""
+Linear system that keeps its RREF up to date as equations come and go.
+
+LinearSystem.compute_solution reduces every equation from scratch. An
+IncrementalLinearSystem instead holds the reduced row echelon form of the
+equations added so far and updates it per change:
+
+add     - the new equation is reduced against the pivot rows (O(rank*n)).
+          If anything is left it becomes a new pivot row and its pivot
+          column is cleared from the other rows; otherwise it is recorded
+          as a relation, a combination of equations whose coefficients
+          cancel, and its leftover constant term says whether the system
+          is still consistent.
+
+remove  - every pivot row and relation remembers which combination of
+          the original equations it is (its transform, T). If some
+          relation uses the removed equation, that equation was redundant:
+          the relation is used to write it out of every other transform
+          and the RREF coefficients do not change. Otherwise the rank
+          drops by one: one pivot row using the equation is subtracted
+          from the other rows that use it and then dropped, and those
+          other rows are taken out and re-inserted with add's reduction.
+
+rank, consistent and compute_solution read the current form directly.
+compute_solution gives the same Parametrization as LinearSystem.compute_ge
+on the same equations, since the RREF of a system is unique.
+"""
+from koku_vector import Vector
+from koku_hyperplane import Hyperplane
+from koku_parametrization import Parametrization
+from koku_numeric import get_backend
+
+
+class _ReducedRow(object):
+    ### One row of the reduced form: coefficients, constant term and the
+    ### transform {equation id: multiplier} that produced it. pivot is
+    ### its pivot column, or -1 for a relation (all coefficients zero).
+    __slots__ = ('pivot', 'coeffs', 'rhs', 'transform')
+
+    def __init__(self, pivot, coeffs, rhs, transform):
+        self.pivot = pivot
+        self.coeffs = coeffs
+        self.rhs = rhs
+        self.transform = transform
+
+    def subtract(self, f, other):
+        ### Purpose: self = self - f*other, coefficients, constant term
+        ### and transform together
+        self.coeffs = [a - f*b for a, b in zip(self.coeffs, other.coeffs)]
+        self.rhs = self.rhs - f*other.rhs
+        transform = self.transform
+        for eq, t in other.transform.iteritems():
+            transform[eq] = transform.get(eq, 0) - f*t
+
+    def scale(self, f):
+        self.coeffs = [a*f for a in self.coeffs]
+        self.rhs = self.rhs*f
+        for eq in self.transform:
+            self.transform[eq] = self.transform[eq]*f
+
+
+class IncrementalLinearSystem(object):
+    """
+    Linear system in dimension unknowns whose RREF is updated on every
+    add/remove. add returns a handle to pass to remove.
+    """
+    ALL_PLANES_MUST_BE_IN_SAME_DIM_MSG = 'All planes in the system should live in the same dimension'
+    NO_SOLUTIONS_MSG = 'No solutions'
+    UNKNOWN_EQUATION_MSG = 'No such equation in the system'
+
+    def __init__(self, dimension, backend=None):
+        self.dimension = dimension
+        self.backend = get_backend(backend)
+        self._equations = {}
+        self._next_id = 0
+        ## pivot rows, kept sorted by pivot column
+        self._rows = []
+        self._relations = []
+        self._solution = None
+
+    @classmethod
+    def from_system(cls, system):
+        ### Purpose: incremental system with the equations of a LinearSystem
+        incremental = cls(system.dimension, system.backend)
+        for p in system.planes:
+            incremental.add(p)
+        return incremental
+
+    def __len__(self):
+        return len(self._equations)
+
+    def __repr__(self):
+        return 'IncrementalLinearSystem: %d equations, rank %d, %s' % (
+            len(self), self.rank, 'consistent' if self.consistent else 'inconsistent')
+
+    def equations(self):
+        ### Purpose: {handle: Hyperplane} of the equations in the system
+        return dict(self._equations)
+
+    @property
+    def rank(self):
+        return len(self._rows)
+
+    @property
+    def consistent(self):
+        is_near_zero = self.backend.is_near_zero
+        return all(is_near_zero(r.rhs) for r in self._relations)
+
+    def add(self, plane):
+        ### Purpose: add one equation and update the reduced form
+        ### plane -> handle of the equation
+        if plane.dimension != self.dimension:
+            raise Exception(self.ALL_PLANES_MUST_BE_IN_SAME_DIM_MSG)
+        plane = plane.to_backend(self.backend)
+        eq = self._next_id
+        self._next_id += 1
+        self._equations[eq] = plane
+        with self.backend.activate():
+            self._insert(_ReducedRow(-1, list(plane.normal_vector.coord),
+                                     plane.constant_term, {eq: self.backend.one}))
+        return eq
+
+    def remove(self, eq):
+        ### Purpose: take out the equation with handle eq and downdate the
+        ### reduced form
+        if eq not in self._equations:
+            raise Exception(self.UNKNOWN_EQUATION_MSG)
+        del self._equations[eq]
+        self._solution = None
+        backend = self.backend
+        with backend.activate():
+            def weight(r):
+                return abs(backend.to_float(r.transform.get(eq, 0)))
+            ## A relation using eq: eq is a combination of the others
+            relation = max(self._relations, key=weight) if self._relations else None
+            if relation is not None and not backend.is_near_zero(relation.transform.get(eq, 0)):
+                self._relations.remove(relation)
+                u = relation.transform[eq]
+                for r in self._rows + self._relations:
+                    t = r.transform.get(eq, 0)
+                    if t != 0:
+                        ## relation has all-zero coefficients, so only the
+                        ## constant term and transform change
+                        r.rhs = r.rhs - (t/u)*relation.rhs
+                        for other, v in relation.transform.iteritems():
+                            r.transform[other] = r.transform.get(other, 0) - (t/u)*v
+                        del r.transform[eq]
+                return
+            for r in self._relations:
+                r.transform.pop(eq, None)
+            ## Otherwise the rank drops: subtract the pivot row using eq the
+            ## most from the other rows using it, drop it, and re-insert
+            ## the rows that changed
+            using = [r for r in self._rows if not backend.is_near_zero(r.transform.get(eq, 0))]
+            if not using:
+                for r in self._rows:
+                    r.transform.pop(eq, None)
+                return
+            drop = max(using, key=weight)
+            broken = [r for r in using if r is not drop]
+            for r in broken:
+                r.subtract(r.transform[eq]/drop.transform[eq], drop)
+                del r.transform[eq]
+            self._rows = [r for r in self._rows if r is not drop and r not in broken]
+            for r in self._rows:
+                r.transform.pop(eq, None)
+            for r in broken:
+                r.pivot = -1
+                self._insert(r)
+
+    def _insert(self, new):
+        ### Purpose: reduce new against the pivot rows and add it to the
+        ### reduced form as a pivot row or a relation
+        backend = self.backend
+        zero = backend.zero
+        is_near_zero = backend.is_near_zero
+        self._solution = None
+        for row in self._rows:
+            f = new.coeffs[row.pivot]
+            if f != zero:
+                new.subtract(f, row)
+                new.coeffs[row.pivot] = zero
+        pivot = -1
+        for k, a in enumerate(new.coeffs):
+            if not is_near_zero(a):
+                pivot = k
+                break
+        if pivot < 0:
+            new.coeffs = [zero]*self.dimension
+            self._relations.append(new)
+            return
+        ## entries before the pivot are rounding residue
+        new.coeffs[:pivot] = [zero]*pivot
+        new.pivot = pivot
+        if new.coeffs[pivot] != backend.one:
+            new.scale(backend.one/new.coeffs[pivot])
+            new.coeffs[pivot] = backend.one
+        for row in self._rows:
+            g = row.coeffs[pivot]
+            if g != zero:
+                row.subtract(g, new)
+                row.coeffs[pivot] = zero
+        self._rows.append(new)
+        self._rows.sort(key=lambda r: r.pivot)
+
+    def compute_solution(self):
+        ### Purpose: current solution set, raises NO_SOLUTIONS_MSG like
+        ### LinearSystem.compute_solution
+        ### Cached until the next add/remove.
+        if not self.consistent:
+            raise Exception(self.NO_SOLUTIONS_MSG)
+        if self._solution is None:
+            backend = self.backend
+            num_variables = self.dimension
+            basept = [backend.zero]*num_variables
+            for row in self._rows:
+                basept[row.pivot] = row.rhs
+            pivots = set(row.pivot for row in self._rows)
+            dir_vectors = []
+            for param_index in xrange(num_variables):
+                if param_index in pivots:
+                    continue
+                vector = [backend.zero]*num_variables
+                for row in self._rows:
+                    vector[row.pivot] = -1 * row.coeffs[param_index]
+                vector[param_index] = backend.one
+                dir_vectors.append(Vector._from_trusted(tuple(vector), backend))
+            self._solution = Parametrization(Vector._from_trusted(tuple(basept), backend), dir_vectors)
+        return self._solution
+
+    def compute_rref(self):
+        ### Purpose: current RREF as a LinearSystem, pivot rows first and
+        ### then one 0 = k row per relation
+        ## imported here, koku_linear_system is the heavier module
+        from koku_linear_system import LinearSystem
+        backend = self.backend
+        planes = [Hyperplane(Vector._from_trusted(tuple(r.coeffs), backend), r.rhs)
+                  for r in self._rows + self._relations]
+        if not planes:
+            planes = [Hyperplane(dimension=self.dimension, constant_term=backend.zero, backend=backend)]
+        return LinearSystem(planes, backend)
+
+
+if __name__ == '__main__':
+
+    ## Add/remove sequences against a from-scratch RREF of the same planes
+    import random
+    from fractions import Fraction
+    from koku_linear_system import LinearSystem
+    random.seed(19)
+
+    def plane(coefficients, constant):
+        return Hyperplane(Vector([Fraction(a) for a in coefficients], 'fraction'), Fraction(constant))
+
+    def pivot_rows(system):
+        ### -> [(coefficients, constant term)] of the nonzero RREF rows
+        return [(list(p.normal_vector.coord), p.constant_term) for p in system.planes
+                if any(p.normal_vector.coord)]
+
+    def matches(incremental):
+        ### -> True if rank, consistency, RREF and solution all agree
+        ### with the dense LinearSystem on the remaining equations
+        planes = incremental.equations().values()
+        if not planes:
+            return incremental.rank == 0 and incremental.consistent
+        dense = LinearSystem(planes, 'fraction')
+        expected = pivot_rows(dense.compute_rref())
+        got = pivot_rows(incremental.compute_rref())
+        if len(got) != incremental.rank or [c for c, _ in got] != [c for c, _ in expected]:
+            return False
+        try:
+            solution = dense.compute_solution()
+        except Exception as e:
+            if str(e) != LinearSystem.NO_SOLUTIONS_MSG:
+                raise
+            return not incremental.consistent
+        ## pivot row constants are unique once the system is consistent
+        mine = incremental.compute_solution()
+        return (incremental.consistent and got == expected and
+                mine.base_pt == solution.base_pt and mine.lst_dir_vec == solution.lst_dir_vec)
+
+    for case in xrange(40):
+        n = random.randint(1, 5)
+        incremental = IncrementalLinearSystem(n, 'fraction')
+        handles = []
+        for step in xrange(25):
+            if handles and random.random() < 0.4:
+                eq = random.choice(handles)
+                handles.remove(eq)
+                incremental.remove(eq)
+            else:
+                current = incremental.equations().values()
+                if current and random.random() < 0.3:
+                    ## a combination of equations already in: redundant
+                    ## (or inconsistent if the constant is off)
+                    a, b = random.choice(current), random.choice(current)
+                    p = Hyperplane(a.normal_vector.plus(b.normal_vector.times_scalar(2)),
+                                   a.constant_term + 2*b.constant_term + random.choice([0, 0, 1]))
+                else:
+                    p = plane([random.randint(-2, 2) for _ in xrange(n)], random.randint(-3, 3))
+                handles.append(incremental.add(p))
+            if not matches(incremental):
+                print 'incremental test case 1 failed (case %d, step %d)' % (case, step)
+                break
+
+    ## removing a pivot row drops the rank
+    incremental = IncrementalLinearSystem(3, 'fraction')
+    x = incremental.add(plane([1, 0, 0], 1))
+    y = incremental.add(plane([1, 1, 0], 3))
+    z = incremental.add(plane([0, 1, 1], 5))
+    if incremental.rank != 3 or incremental.compute_solution().base_pt != Vector([1, 2, 3], 'fraction'):
+        print 'incremental test case 2 failed'
+    incremental.remove(x)
+    if incremental.rank != 2 or not matches(incremental):
+        print 'incremental test case 3 failed'
+    ## removing a redundant equation keeps the rank
+    w = incremental.add(plane([1, 2, 1], 8))
+    if incremental.rank != 2 or not incremental.consistent:
+        print 'incremental test case 4 failed'
+    incremental.remove(y)
+    if incremental.rank != 2 or not matches(incremental):
+        print 'incremental test case 5 failed'
+    ## an inconsistent equation, then removing it restores consistency
+    bad = incremental.add(plane([1, 2, 1], 9))
+    if incremental.consistent:
+        print 'incremental test case 6 failed'
+    try:
+        incremental.compute_solution()
+        print 'incremental test case 7 failed'
+    except Exception as e:
+        if str(e) != IncrementalLinearSystem.NO_SOLUTIONS_MSG:
+            print 'incremental test case 7 failed'
+    incremental.remove(bad)
+    if not (incremental.consistent and matches(incremental)):
+        print 'incremental test case 8 failed'
+    ## down to nothing
+    incremental.remove(z)
+    incremental.remove(w)
+    if incremental.rank != 0 or len(incremental) != 0 or incremental.compute_solution().lst_dir_vec != \
+            [Vector([1, 0, 0], 'fraction'), Vector([0, 1, 0], 'fraction'), Vector([0, 0, 1], 'fraction')]:
+        print 'incremental test case 9 failed'
+
+    ## errors
+    try:
+        incremental.remove(x)
+        print 'incremental test case 10 failed'
+    except Exception as e:
+        if str(e) != IncrementalLinearSystem.UNKNOWN_EQUATION_MSG:
+            print 'incremental test case 10 failed'
+    try:
+        incremental.add(plane([1, 2], 0))
+        print 'incremental test case 11 failed'
+    except Exception as e:
+        if str(e) != IncrementalLinearSystem.ALL_PLANES_MUST_BE_IN_SAME_DIM_MSG:
+            print 'incremental test case 11 failed'
+    ## float backend, from_system
+    system = LinearSystem([Hyperplane(Vector([1., 1.], 'float'), 2.), Hyperplane(Vector([1., -1.], 'float'), 0.)], 'float')
+    incremental = IncrementalLinearSystem.from_system(system)
+    if incremental.compute_solution().base_pt != system.compute_solution().base_pt:
+        print 'incremental test case 12 failed'
@@ -0,0 +1,323 @@
+"""
+Iterative solvers for large square systems.
+
+Direct elimination (compute_rref) costs O(n^3) however close the answer
+already is. The solvers here improve a guess x step by step instead and
+stop once the residual ||b - A x|| is small enough relative to ||b||:
+
+    conjugate_gradient - symmetric positive definite A, raises
+                         NOT_SYMMETRIC_MSG or NOT_POSITIVE_DEFINITE_MSG
+    gauss_seidel       - diagonally dominant (or SPD) A
+    sor                - Gauss-Seidel with over-relaxation factor omega
+
+Each takes a LinearSystem, a SparseLinearSystem or an AugmentedMatrix,
+only reads the nonzero coefficients, and works in float64. x0 warm-starts
+from a previous solution, which is what makes repeated solves of slowly
+changing systems cheap. The result reports whether the tolerance was met,
+the number of iterations and the residual norm after each one; callback,
+if given, is called as callback(iteration, residual_norm) and may return
+True to stop early.
+"""
+from math import sqrt
+
+from koku_vector import Vector
+from koku_numeric import FLOAT
+
+SYSTEM_MUST_BE_SQUARE_MSG = 'Iterative solvers need as many equations as unknowns'
+ZERO_DIAGONAL_MSG = 'Gauss-Seidel needs a nonzero diagonal'
+OMEGA_OUT_OF_RANGE_MSG = 'SOR needs 0 < omega < 2'
+WRONG_GUESS_DIMENSION_MSG = 'Initial guess has the wrong dimension'
+NOT_SYMMETRIC_MSG = 'Conjugate gradient needs a symmetric matrix'
+NOT_POSITIVE_DEFINITE_MSG = 'Conjugate gradient needs a positive definite matrix'
+
+## Relative difference of a_ij and a_ji above which A counts as not
+## symmetric
+SYMMETRY_TOLERANCE = 1E-12
+
+
+class IterativeResult(object):
+    """
+    Outcome of an iterative solve.
+    x: last iterate as a float Vector, converged: tolerance was met,
+    iterations: iterations done, residual_norm: ||b - A x|| for x,
+    history: residual norm after each iteration (history[0] is for x0),
+    between residual checks sor and gauss_seidel record their cheaper
+    estimate, see sor. history[-1] is always the true residual.
+    """
+    def __init__(self, x, converged, iterations, residual_norm, history):
+        self.x = x
+        self.converged = converged
+        self.iterations = iterations
+        self.residual_norm = residual_norm
+        self.history = history
+
+    def __repr__(self):
+        return 'IterativeResult: %s after %d iterations, residual %.3g' % (
+            'converged' if self.converged else 'not converged',
+            self.iterations, self.residual_norm)
+
+
+def _sparse_rows(system):
+    ### Purpose: float (columns, values) of the nonzeros of each row and
+    ### the float constant terms, from any of the system types
+    if hasattr(system, 'indptr'):
+        ## SparseLinearSystem
+        rows = []
+        for i in xrange(len(system)):
+            start, stop = system.indptr[i], system.indptr[i+1]
+            rows.append((system.indices[start:stop], map(float, system.data[start:stop])))
+        return rows, map(float, system.constant_terms), system.dimension
+    if hasattr(system, 'planes'):
+        ## LinearSystem
+        coords = [p.normal_vector.coord for p in system.planes]
+        rhs = [p.constant_term for p in system.planes]
+        n = system.dimension
+    else:
+        ## AugmentedMatrix
+        coords, rhs, n = system.rows, system.rhs, system.num_cols
+    rows = []
+    for coord in coords:
+        cols = [j for j, a in enumerate(coord) if a]
+        rows.append((cols, [float(coord[j]) for j in cols]))
+    return rows, map(float, rhs), n
+
+
+def _prepare(system, x0):
+    rows, b, n = _sparse_rows(system)
+    if len(rows) != n:
+        raise Exception(SYSTEM_MUST_BE_SQUARE_MSG)
+    if x0 is None:
+        x = [0.]*n
+    else:
+        if isinstance(x0, Vector):
+            x0 = x0.coord
+        x = map(float, x0)
+        if len(x) != n:
+            raise Exception(WRONG_GUESS_DIMENSION_MSG)
+    return rows, b, n, x
+
+
+def _residual(rows, b, x):
+    ### Purpose: r = b - A x
+    return [bi - sum([a*x[j] for j, a in zip(cols, vals)])
+            for (cols, vals), bi in zip(rows, b)]
+
+
+def _check_symmetric(rows):
+    ### Purpose: raise NOT_SYMMETRIC_MSG unless a_ij = a_ji, O(nnz)
+    entries = {}
+    for i, (cols, vals) in enumerate(rows):
+        for j, a in zip(cols, vals):
+            entries[i, j] = a
+    for (i, j), a in entries.iteritems():
+        if i < j:
+            b = entries.get((j, i), 0.)
+            if abs(a - b) > SYMMETRY_TOLERANCE*max(abs(a), abs(b)):
+                raise Exception(NOT_SYMMETRIC_MSG)
+    for (i, j) in entries:
+        if i > j and (j, i) not in entries:
+            raise Exception(NOT_SYMMETRIC_MSG)
+
+
+def _norm(v):
+    return sqrt(sum([a*a for a in v]))
+
+
+def _result(x, converged, iterations, history):
+    return IterativeResult(Vector._from_trusted(tuple(x), FLOAT), converged,
+                           iterations, history[-1], history)
+
+
+def conjugate_gradient(system, x0=None, tolerance=1E-10, max_iterations=1000, callback=None):
+    ### Purpose: solve A x = b for symmetric positive definite A
+    ### Stops when ||r|| <= tolerance * ||b|| (or tolerance if b = 0).
+    ### Raises NOT_SYMMETRIC_MSG before starting if A is not symmetric,
+    ### and NOT_POSITIVE_DEFINITE_MSG on a search direction p with
+    ### p^T A p <= 0, where the iteration would diverge.
+    ### -> IterativeResult
+    rows, b, n, x = _prepare(system, x0)
+    _check_symmetric(rows)
+    goal = tolerance*(_norm(b) or 1.)
+    r = _residual(rows, b, x)
+    p = list(r)
+    rr = sum([a*a for a in r])
+    history = [sqrt(rr)]
+    iterations = 0
+    while history[-1] > goal and iterations < max_iterations:
+        Ap = [sum([a*p[j] for j, a in zip(cols, vals)]) for cols, vals in rows]
+        pAp = sum([a*c for a, c in zip(p, Ap)])
+        if pAp <= 0.:
+            raise Exception(NOT_POSITIVE_DEFINITE_MSG)
+        alpha = rr/pAp
+        x = [xi + alpha*pi for xi, pi in zip(x, p)]
+        r = [ri - alpha*api for ri, api in zip(r, Ap)]
+        rr_new = sum([a*a for a in r])
+        p = [ri + (rr_new/rr)*pi for ri, pi in zip(r, p)]
+        rr = rr_new
+        iterations += 1
+        history.append(sqrt(rr))
+        if callback is not None and callback(iterations, history[-1]):
+            break
+    ## the recurred residual drifts from the true one, report the true one
+    history[-1] = _norm(_residual(rows, b, x))
+    return _result(x, history[-1] <= goal, iterations, history)
+
+
+def sor(system, omega=1.5, x0=None, tolerance=1E-10, max_iterations=1000, callback=None,
+        check_every=10):
+    ### Purpose: successive over-relaxation, each sweep updates
+    ### x[i] = (1-omega)*x[i] + omega*(b[i] - sum_{j!=i} a_ij x[j])/a_ii
+    ### in place, row by row. omega = 1 is Gauss-Seidel.
+    ### Stops when ||r|| <= tolerance * ||b|| (or tolerance if b = 0).
+    ### The residual of row i just before its update comes free with the
+    ### sweep; their norm estimates ||r|| without another pass over A.
+    ### The true residual is computed every check_every sweeps and once
+    ### the estimate meets the tolerance, and only it decides convergence.
+    ### -> IterativeResult
+    if not 0. < omega < 2.:
+        raise ValueError(OMEGA_OUT_OF_RANGE_MSG)
+    rows, b, n, x = _prepare(system, x0)
+    ## split each row into its diagonal and off-diagonal parts
+    split = []
+    for i, (cols, vals) in enumerate(rows):
+        diag = 0.
+        off = []
+        for j, a in zip(cols, vals):
+            if j == i:
+                diag = a
+            else:
+                off.append((j, a))
+        if not diag:
+            raise Exception(ZERO_DIAGONAL_MSG)
+        split.append((diag, off))
+    goal = tolerance*(_norm(b) or 1.)
+    history = [_norm(_residual(rows, b, x))]
+    iterations = 0
+    check_every = max(1, check_every)
+    checked = True
+    while history[-1] > goal and iterations < max_iterations:
+        change = 0.
+        for i, (diag, off) in enumerate(split):
+            r = b[i] - diag*x[i]
+            for j, a in off:
+                r -= a*x[j]
+            change += r*r
+            x[i] += omega*r/diag
+        iterations += 1
+        estimate = sqrt(change)
+        checked = estimate <= goal or iterations % check_every == 0
+        if checked:
+            estimate = _norm(_residual(rows, b, x))
+        history.append(estimate)
+        if callback is not None and callback(iterations, history[-1]):
+            break
+    if not checked:
+        history[-1] = _norm(_residual(rows, b, x))
+    return _result(x, history[-1] <= goal, iterations, history)
+
+
+def gauss_seidel(system, x0=None, tolerance=1E-10, max_iterations=1000, callback=None,
+                 check_every=10):
+    ### Purpose: Gauss-Seidel iteration, sor with omega = 1
+    return sor(system, 1., x0, tolerance, max_iterations, callback, check_every)
+
+
+if __name__ == '__main__':
+
+    ## Iterative solver tests against the dense solution
+    import random
+    from koku_hyperplane import Hyperplane
+    from koku_linear_system import LinearSystem
+    from koku_sparse import SparseLinearSystem
+    from koku_matrix import AugmentedMatrix
+    random.seed(18)
+
+    def make_system(coefficients, constants):
+        return LinearSystem([Hyperplane(Vector(row, 'float'), c)
+                             for row, c in zip(coefficients, constants)], 'float')
+
+    def true_residual(system, x):
+        rows, b, n = _sparse_rows(system)
+        return _norm(_residual(rows, b, x))
+
+    def close(x, y, eps=1e-8):
+        return all(abs(a - b) <= eps for a, b in zip(x, y))
+
+    def spd(n):
+        ### B^T B + n I, symmetric positive definite
+        m = [[random.uniform(-1, 1) for _ in xrange(n)] for _ in xrange(n)]
+        return [[sum(m[k][i]*m[k][j] for k in xrange(n)) + (n if i == j else 0.)
+                 for j in xrange(n)] for i in xrange(n)]
+
+    for case in xrange(10):
+        n = random.randint(2, 12)
+        a = spd(n)
+        b = [random.uniform(-1, 1) for _ in xrange(n)]
+        system = make_system(a, b)
+        expected = system.compute_solution(pivoting='partial').base_pt.coord
+        for name, result in (('cg', conjugate_gradient(system)),
+                             ('gauss_seidel', gauss_seidel(system, max_iterations=5000)),
+                             ('sor', sor(system, 1.2, max_iterations=5000))):
+            if not (result.converged and close(result.x.coord, expected)):
+                print 'iterative test case 1 failed (%s, case %d)' % (name, case)
+            ## the last history entry is the true residual
+            if abs(result.history[-1] - true_residual(system, result.x.coord)) > 1e-12:
+                print 'iterative test case 2 failed (%s, case %d)' % (name, case)
+
+    ## same answers from a SparseLinearSystem and an AugmentedMatrix
+    a = [[4., -1., 0.], [-1., 4., -1.], [0., -1., 4.]]
+    b = [1., 2., 3.]
+    system = make_system(a, b)
+    expected = system.compute_solution().base_pt.coord
+    for source in (SparseLinearSystem.from_system(system), AugmentedMatrix(a, b, 'float')):
+        if not close(conjugate_gradient(source).x.coord, expected):
+            print 'iterative test case 3 failed'
+        if not close(gauss_seidel(source).x.coord, expected):
+            print 'iterative test case 4 failed'
+
+    ## the residual is only computed every check_every sweeps, or when the
+    ## cheap estimate meets the tolerance; convergence is decided on it
+    for check_every in (1, 3, 10):
+        result = gauss_seidel(system, check_every=check_every)
+        if not (result.converged and len(result.history) == result.iterations + 1):
+            print 'iterative test case 5 failed'
+        if not result.history[-1] <= 1E-10*_norm(b):
+            print 'iterative test case 6 failed'
+    result = sor(system, 1.1, max_iterations=3, check_every=10)
+    if result.converged or result.iterations != 3 or \
+       abs(result.history[-1] - true_residual(system, result.x.coord)) > 1e-12:
+        print 'iterative test case 7 failed'
+
+    ## warm start from the answer needs no iterations, callback stops early
+    if gauss_seidel(system, x0=Vector(expected, 'float'), tolerance=1e-6).iterations != 0:
+        print 'iterative test case 8 failed'
+    seen = []
+    result = conjugate_gradient(system, callback=lambda k, r: seen.append(k) or k == 1)
+    if seen != [1] or result.iterations != 1:
+        print 'iterative test case 9 failed'
+
+    ## CG refuses non-symmetric and indefinite matrices
+    try:
+        conjugate_gradient(make_system([[4., 1.], [0., 4.]], [1., 1.]))
+        print 'iterative test case 10 failed'
+    except Exception as e:
+        if str(e) != NOT_SYMMETRIC_MSG:
+            print 'iterative test case 10 failed'
+    try:
+        conjugate_gradient(make_system([[1., 0.], [0., -1.]], [1., 1.]))
+        print 'iterative test case 11 failed'
+    except Exception as e:
+        if str(e) != NOT_POSITIVE_DEFINITE_MSG:
+            print 'iterative test case 11 failed'
+
+    ## input checks
+    for call, msg in ((lambda: sor(system, 2.), OMEGA_OUT_OF_RANGE_MSG),
+                      (lambda: gauss_seidel(make_system([[0., 1.], [1., 0.]], b[:2])), ZERO_DIAGONAL_MSG),
+                      (lambda: gauss_seidel(make_system([[1., 1.]], [1.])), SYSTEM_MUST_BE_SQUARE_MSG),
+                      (lambda: conjugate_gradient(system, x0=[0., 0.]), WRONG_GUESS_DIMENSION_MSG)):
+        try:
+            call()
+            print 'iterative test case 12 failed'
+        except Exception as e:
+            if str(e) != msg:
+                print 'iterative test case 12 failed'
@@ -0,0 +1,264 @@
+"""
+k-d tree spatial index over n-dimensional point sets.
+
+Finding nearby points by pairwise minus(...).magnitude() is O(N^2) with
+Decimal arithmetic. KDTree builds once in O(N log N) over float copies of
+the coordinates and answers k-nearest-neighbour, radius and axis-aligned
+box queries by pruning whole subtrees.
+
+Points can be a list of Vectors (any dim), a VectorBatch or a list of
+coordinate tuples. Query results refer to points by their index in the
+input, so tree.points[i] gives back the original object.
+"""
+import heapq
+from math import sqrt
+
+from koku_vector import Vector, VectorBatch
+
+
+class KDTree(object):
+    """
+    Balanced k-d tree stored as flat node lists. Each node splits on the
+    axis with the largest spread at the median point; nodes holding
+    leafsize points or fewer are leaves scanned directly.
+    """
+    NO_POINTS_MSG = 'KDTree needs at least one point'
+    ALL_POINTS_MUST_BE_IN_SAME_DIM_MSG = 'All points should live in the same dimension'
+    K_MUST_BE_POSITIVE_MSG = 'k must be at least 1'
+
+    def __init__(self, points, leafsize=16):
+        ### Purpose: bulk build the tree from all points at once
+        if isinstance(points, VectorBatch):
+            coords = [points.coord(i) for i in xrange(points.size)]
+            self.points = points
+        else:
+            self.points = list(points)
+            coords = [tuple(map(float, p.coord if isinstance(p, Vector) else p))
+                      for p in self.points]
+        if not coords:
+            raise ValueError(self.NO_POINTS_MSG)
+        self.dim = len(coords[0])
+        for c in coords:
+            if len(c) != self.dim:
+                raise Exception(self.ALL_POINTS_MUST_BE_IN_SAME_DIM_MSG)
+        self._coords = coords
+        self.leafsize = max(1, leafsize)
+        self._build()
+
+    def __len__(self):
+        return len(self._coords)
+
+    def _build(self):
+        ### Node i covers self._index[lo[i]:hi[i]]. Inner nodes split on
+        ### axis[i] at value split[i] with children left[i], right[i];
+        ### leaves have left[i] == -1.
+        coords = self._coords
+        index = range(len(coords))
+        lo, hi, axis, split, left, right = [], [], [], [], [], []
+        stack = [(0, len(index), None, None)]
+        while stack:
+            start, stop, parent, is_left = stack.pop()
+            node = len(lo)
+            lo.append(start)
+            hi.append(stop)
+            axis.append(-1)
+            split.append(0.)
+            left.append(-1)
+            right.append(-1)
+            if parent is not None:
+                if is_left:
+                    left[parent] = node
+                else:
+                    right[parent] = node
+            if stop - start <= self.leafsize:
+                continue
+            ## Split on the axis with the widest spread
+            best_axis, best_spread = 0, -1.
+            for d in xrange(self.dim):
+                values = [coords[j][d] for j in index[start:stop]]
+                spread = max(values) - min(values)
+                if spread > best_spread:
+                    best_axis, best_spread = d, spread
+            if best_spread <= 0.:
+                ## All points coincide, keep them in one leaf
+                continue
+            index[start:stop] = sorted(index[start:stop], key=lambda j: coords[j][best_axis])
+            mid = (start + stop) // 2
+            axis[node] = best_axis
+            split[node] = coords[index[mid]][best_axis]
+            stack.append((mid, stop, node, False))
+            stack.append((start, mid, node, True))
+        self._index = index
+        self._lo, self._hi = lo, hi
+        self._axis, self._split = axis, split
+        self._left, self._right = left, right
+
+    def _as_coords(self, point):
+        if isinstance(point, Vector):
+            point = point.coord
+        point = tuple(map(float, point))
+        if len(point) != self.dim:
+            raise Exception(self.ALL_POINTS_MUST_BE_IN_SAME_DIM_MSG)
+        return point
+
+    def _dist2(self, j, q):
+        c = self._coords[j]
+        return sum([(c[d]-q[d])**2 for d in xrange(self.dim)])
+
+    def query_knn(self, point, k=1):
+        ### Purpose: the k points closest to point
+        ### returns a list of (index, distance), nearest first; points at
+        ### the same distance come in index order
+        if k < 1:
+            raise ValueError(self.K_MUST_BE_POSITIVE_MSG)
+        q = self._as_coords(point)
+        k = min(k, len(self._coords))
+        ## max-heap of the best k as (-dist2, -index)
+        heap = []
+        self._knn(0, q, k, heap)
+        return [(-j, sqrt(-d2)) for d2, j in sorted(heap, reverse=True)]
+
+    def _knn(self, node, q, k, heap):
+        if self._left[node] < 0:
+            for j in self._index[self._lo[node]:self._hi[node]]:
+                d2 = self._dist2(j, q)
+                if len(heap) < k:
+                    heapq.heappush(heap, (-d2, -j))
+                elif (-d2, -j) > heap[0]:
+                    ## closer, or as close with a lower index
+                    heapq.heapreplace(heap, (-d2, -j))
+            return
+        diff = q[self._axis[node]] - self._split[node]
+        if diff < 0:
+            near, far = self._left[node], self._right[node]
+        else:
+            near, far = self._right[node], self._left[node]
+        self._knn(near, q, k, heap)
+        ## Only visit the far side if the splitting plane is closer
+        ## than the current k-th best
+        if len(heap) < k or diff*diff <= -heap[0][0]:
+            self._knn(far, q, k, heap)
+
+    def query_radius(self, point, radius):
+        ### Purpose: every point within radius of point (inclusive)
+        ### returns a list of indices in ascending order
+        q = self._as_coords(point)
+        found = []
+        self._radius(0, q, float(radius)**2, found)
+        found.sort()
+        return found
+
+    def _radius(self, node, q, r2, found):
+        if self._left[node] < 0:
+            for j in self._index[self._lo[node]:self._hi[node]]:
+                if self._dist2(j, q) <= r2:
+                    found.append(j)
+            return
+        diff = q[self._axis[node]] - self._split[node]
+        if diff < 0:
+            near, far = self._left[node], self._right[node]
+        else:
+            near, far = self._right[node], self._left[node]
+        self._radius(near, q, r2, found)
+        if diff*diff <= r2:
+            self._radius(far, q, r2, found)
+
+    def query_box(self, lower, upper):
+        ### Purpose: every point p with lower <= p <= upper on every axis
+        ### returns a list of indices in ascending order
+        lower = self._as_coords(lower)
+        upper = self._as_coords(upper)
+        found = []
+        self._box(0, lower, upper, found)
+        found.sort()
+        return found
+
+    def _box(self, node, lower, upper, found):
+        if self._left[node] < 0:
+            coords = self._coords
+            rng = xrange(self.dim)
+            for j in self._index[self._lo[node]:self._hi[node]]:
+                c = coords[j]
+                for d in rng:
+                    if not lower[d] <= c[d] <= upper[d]:
+                        break
+                else:
+                    found.append(j)
+            return
+        a = self._axis[node]
+        s = self._split[node]
+        ## left holds coordinates <= split, right holds >= split
+        if lower[a] <= s:
+            self._box(self._left[node], lower, upper, found)
+        if upper[a] >= s:
+            self._box(self._right[node], lower, upper, found)
+
+    def _query_points(self, points):
+        if isinstance(points, VectorBatch):
+            return [points.coord(i) for i in xrange(points.size)]
+        return points
+
+    def query_knn_many(self, points, k=1):
+        ### Purpose: query_knn for every point in a list or VectorBatch
+        return [self.query_knn(p, k) for p in self._query_points(points)]
+
+    def query_radius_many(self, points, radius):
+        ### Purpose: query_radius for every point in a list or VectorBatch
+        return [self.query_radius(p, radius) for p in self._query_points(points)]
+
+    def query_box_many(self, boxes):
+        ### Purpose: query_box for every (lower, upper) pair
+        return [self.query_box(lower, upper) for lower, upper in boxes]
+
+
+if __name__ == '__main__':
+
+    ## KDTree tests against a brute-force scan
+    import random
+    random.seed(6)
+
+    def brute_knn(coords, q, k):
+        ranked = sorted((sum([(a-b)**2 for a, b in zip(c, q)]), j) for j, c in enumerate(coords))
+        return [(j, sqrt(d2)) for d2, j in ranked[:k]]
+
+    def brute_radius(coords, q, r):
+        return [j for j, c in enumerate(coords) if sum([(a-b)**2 for a, b in zip(c, q)]) <= r*r]
+
+    ## integer grid points, so many duplicates and equal distances
+    coords = [tuple(float(random.randint(0, 4)) for _ in range(3)) for _ in range(300)]
+    coords += coords[:50]
+    tree = KDTree([Vector(c,'float') for c in coords], leafsize=4)
+    queries = [tuple(random.uniform(-1, 5) for _ in range(3)) for _ in range(40)] + coords[:10]
+    for q in queries:
+        for k in (1, 7, 60):
+            if tree.query_knn(q, k) != brute_knn(coords, q, k):
+                print 'kdtree test case 1 failed'
+        for r in (0., 1., 2.5):
+            if tree.query_radius(q, r) != brute_radius(coords, q, r):
+                print 'kdtree test case 2 failed'
+    ## every copy of a duplicated point is found at distance zero
+    if not [j for j, d in tree.query_knn(coords[0], 400) if d == 0.] == brute_radius(coords, coords[0], 0.):
+        print 'kdtree test case 3 failed'
+    ## all points identical: one leaf, still answers
+    same = KDTree([(1., 1.)]*40, leafsize=2)
+    if not (same.query_radius((1., 1.), 0.) == range(40) and same.query_knn((0., 0.), 3) == [(0, sqrt(2.)), (1, sqrt(2.)), (2, sqrt(2.))]):
+        print 'kdtree test case 4 failed'
+    ## box queries
+    box = tree.query_box((1., 0., 2.), (3., 2., 4.))
+    if not box == [j for j, c in enumerate(coords) if 1. <= c[0] <= 3. and 0. <= c[1] <= 2. and 2. <= c[2] <= 4.]:
+        print 'kdtree test case 5 failed'
+    ## k larger than the tree returns every point
+    if not len(tree.query_knn((0., 0., 0.), 10000)) == len(coords):
+        print 'kdtree test case 6 failed'
+    ## an empty point set is rejected
+    try:
+        KDTree([])
+        print 'kdtree test case 7 failed'
+    except ValueError as e:
+        if str(e) != KDTree.NO_POINTS_MSG:
+            print 'kdtree test case 7 failed'
+    try:
+        tree.query_knn((0., 0., 0.), 0)
+        print 'kdtree test case 8 failed'
+    except ValueError:
+        pass
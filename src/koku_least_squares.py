@@ -0,0 +1,303 @@
+"""
+Least-squares solutions of overdetermined systems.
+
+A system with more equations than unknowns and noisy coefficients has no
+exact solution, and compute_solution raises NO_SOLUTIONS_MSG. The least-
+squares solution is the x that minimises ||A x - b|| instead.
+
+StreamingLeastSquares reads the equations once, in any number of calls,
+and keeps only the (n+1) x (n+1) upper triangle R of the augmented matrix
+[A | b]. Equations are buffered block_size at a time and each full block
+is folded into R by Householder QR of [R; block], so memory stays
+O(n^2 + block_size*n) however many equations there are:
+
+    fit = StreamingLeastSquares(3)
+    for x, y, z in points:
+        fit.add([x, y, 1.], z)
+    result = fit.solve()
+
+With R = [[R0, z], [0, rho]], the least-squares problem becomes
+||R0 x - z||^2 + rho^2. solve reduces R0 once more by Householder QR with
+column pivoting (Businger and Golub), which reveals the rank: a column
+whose remaining norm is below tolerance times the largest column norm
+counts as dependent. For a rank deficient system the result is the basic
+solution, with the variables of the dependent columns set to zero.
+
+Works in float64, like the iterative solvers.
+"""
+from math import sqrt
+
+from koku_vector import Vector
+from koku_numeric import FLOAT
+
+WRONG_NUMBER_OF_COEFFICIENTS_MSG = 'Equation has the wrong number of coefficients'
+NO_EQUATIONS_MSG = 'Least squares needs at least one equation to tell the dimension'
+
+
+class LeastSquaresResult(object):
+    """
+    Outcome of a least-squares solve.
+    x: best-fit solution as a float Vector, residual_norm: ||A x - b||,
+    rank: numerical rank of A, num_equations: equations read.
+    """
+    def __init__(self, x, residual_norm, rank, num_equations):
+        self.x = x
+        self.residual_norm = residual_norm
+        self.rank = rank
+        self.num_equations = num_equations
+
+    def __repr__(self):
+        return 'LeastSquaresResult: rank %d of %d, residual %.3g over %d equations' % (
+            self.rank, self.x.dim, self.residual_norm, self.num_equations)
+
+
+def _householder(x):
+    ### Purpose: reflection taking x to (alpha, 0, ..., 0)
+    ### -> alpha, v and beta with H = I - beta v v^T, or None if x = 0
+    norm = sqrt(sum([a*a for a in x]))
+    if norm == 0.:
+        return None
+    alpha = -norm if x[0] >= 0. else norm
+    v = list(x)
+    v[0] -= alpha
+    return alpha, v, 2./sum([a*a for a in v])
+
+
+class StreamingLeastSquares(object):
+    """
+    Accumulates equations a . x = b one pass at a time and solves for the
+    x that minimises the sum of squared residuals, see the module
+    docstring.
+    """
+    DEFAULT_BLOCK_SIZE = 64
+
+    def __init__(self, dimension, block_size=None):
+        self.dimension = dimension
+        self.block_size = max(1, block_size or self.DEFAULT_BLOCK_SIZE)
+        self.num_equations = 0
+        ## augmented upper triangle, row k holds columns k..n
+        self.r = [[0.]*(dimension + 1 - k) for k in xrange(dimension + 1)]
+        self._buffer = []
+
+    def add(self, coefficients, constant_term):
+        ### Purpose: read one equation
+        ### coefficients: one number per unknown (or a Vector)
+        if isinstance(coefficients, Vector):
+            coefficients = coefficients.coord
+        row = [float(a) for a in coefficients]
+        if len(row) != self.dimension:
+            raise Exception(WRONG_NUMBER_OF_COEFFICIENTS_MSG)
+        row.append(float(constant_term))
+        self._buffer.append(row)
+        self.num_equations += 1
+        if len(self._buffer) >= self.block_size:
+            self._fold()
+
+    def add_planes(self, planes):
+        ### Purpose: read the equations of any iterable of Hyperplanes
+        ### (or Planes), i.e. a generator over scanned points
+        for p in planes:
+            self.add(p.normal_vector.coord, p.constant_term)
+
+    def _fold(self):
+        ### Purpose: Householder QR of [R; buffer], keeping the new R
+        ### Below the diagonal R is zero, so column k only involves row k
+        ### of R and column k of the buffer rows
+        block = self._buffer
+        self._buffer = []
+        r = self.r
+        for k in xrange(self.dimension + 1):
+            tail = [row[k] for row in block]
+            if not any(tail):
+                continue
+            alpha, v, beta = _householder([r[k][0]] + tail)
+            ## s = v^T [R row k; block] over columns k+1..n
+            rk = r[k]
+            s = [v[0]*a for a in rk[1:]]
+            for vi, row in zip(v[1:], block):
+                if vi:
+                    s = [a + vi*b for a, b in zip(s, row[k+1:])]
+            s = [beta*a for a in s]
+            rk[0] = alpha
+            rk[1:] = [a - v[0]*b for a, b in zip(rk[1:], s)]
+            for vi, row in zip(v[1:], block):
+                row[k] = 0.
+                if vi:
+                    row[k+1:] = [a - vi*b for a, b in zip(row[k+1:], s)]
+
+    def solve(self, tolerance=None):
+        ### Purpose: least-squares solution of the equations read so far
+        ### tolerance: relative column norm below which a column counts as
+        ### dependent, defaults to the float backend's near-zero tolerance
+        ### -> LeastSquaresResult
+        if self._buffer:
+            self._fold()
+        n = self.dimension
+        ## dense copies of R0 and z, rho from the corner
+        a = [[0.]*k + list(row[:-1]) for k, row in enumerate(self.r[:n])]
+        c = [row[-1] for row in self.r[:n]]
+        rho = self.r[n][0]
+        perm = range(n)
+        norms = [sum([a[i][j]**2 for i in xrange(n)]) for j in xrange(n)]
+        largest = sqrt(max(norms)) if n else 0.
+        rank = 0
+        for k in xrange(n):
+            ## pivot: the remaining column of largest norm
+            p = max(xrange(k, n), key=lambda j: norms[j])
+            if largest == 0. or FLOAT.is_near_zero(sqrt(norms[p])/largest, tolerance):
+                break
+            if p != k:
+                for row in a:
+                    row[k], row[p] = row[p], row[k]
+                norms[k], norms[p] = norms[p], norms[k]
+                perm[k], perm[p] = perm[p], perm[k]
+            alpha, v, beta = _householder([a[i][k] for i in xrange(k, n)])
+            for j in xrange(k+1, n):
+                s = beta*sum([vi*a[i][j] for vi, i in zip(v, xrange(k, n))])
+                for vi, i in zip(v, xrange(k, n)):
+                    a[i][j] -= vi*s
+            s = beta*sum([vi*c[i] for vi, i in zip(v, xrange(k, n))])
+            for vi, i in zip(v, xrange(k, n)):
+                c[i] -= vi*s
+            a[k][k] = alpha
+            for i in xrange(k+1, n):
+                a[i][k] = 0.
+            ## norms of what is left of each column, recomputed rather
+            ## than downdated to avoid cancellation
+            for j in xrange(k+1, n):
+                norms[j] = sum([a[i][j]**2 for i in xrange(k+1, n)])
+            rank += 1
+        ## back substitution on the leading rank x rank triangle
+        y = [0.]*rank
+        for i in xrange(rank-1, -1, -1):
+            y[i] = (c[i] - sum([a[i][j]*y[j] for j in xrange(i+1, rank)]))/a[i][i]
+        x = [0.]*n
+        for j in xrange(rank):
+            x[perm[j]] = y[j]
+        residual = sqrt(rho*rho + sum([ci*ci for ci in c[rank:]]))
+        return LeastSquaresResult(Vector._from_trusted(tuple(x), FLOAT), residual,
+                                  rank, self.num_equations)
+
+
+def least_squares(planes, dimension=None, block_size=None, tolerance=None):
+    ### Purpose: least-squares solution over an iterable of Hyperplanes,
+    ### read in one pass
+    ### dimension: number of unknowns, taken from the first plane if not
+    ### given (then planes only needs to be iterable once anyway), raises
+    ### NO_EQUATIONS_MSG if there is no first plane
+    ### -> LeastSquaresResult
+    planes = iter(planes)
+    if dimension is None:
+        try:
+            first = next(planes)
+        except StopIteration:
+            raise Exception(NO_EQUATIONS_MSG)
+        fit = StreamingLeastSquares(first.dimension, block_size)
+        fit.add(first.normal_vector.coord, first.constant_term)
+    else:
+        fit = StreamingLeastSquares(dimension, block_size)
+    fit.add_planes(planes)
+    return fit.solve(tolerance)
+
+
+if __name__ == '__main__':
+
+    ## Least-squares tests against known fits and the normal equations
+    import random
+    from koku_hyperplane import Hyperplane
+    from koku_linear_system import LinearSystem
+    from koku_matrix import PARTIAL_PIVOTING
+    random.seed(24)
+
+    def planes_for(a, b):
+        return [Hyperplane(Vector(row, 'float'), c) for row, c in zip(a, b)]
+
+    def residual(a, b, x):
+        return sqrt(sum([(sum([p*q for p, q in zip(row, x)]) - c)**2 for row, c in zip(a, b)]))
+
+    def normal_equations(a, b):
+        ### x solving A^T A x = A^T b
+        n = len(a[0])
+        ata = [[sum([row[i]*row[j] for row in a]) for j in xrange(n)] for i in xrange(n)]
+        atb = [sum([row[i]*c for row, c in zip(a, b)]) for i in xrange(n)]
+        system = LinearSystem(planes_for(ata, atb), 'float')
+        return system.compute_solution(pivoting=PARTIAL_PIVOTING).base_pt.coord
+
+    def close(x, y, eps=1e-9):
+        return all(abs(p - q) <= eps for p, q in zip(x, y))
+
+    ## exact fit: points on z = 2x - 3y + 1
+    points = [(random.uniform(-5, 5), random.uniform(-5, 5)) for _ in xrange(30)]
+    a = [[x, y, 1.] for x, y in points]
+    b = [2*x - 3*y + 1 for x, y in points]
+    result = least_squares(planes_for(a, b))
+    if not (close(result.x.coord, [2., -3., 1.]) and result.residual_norm < 1e-9 and
+            result.rank == 3 and result.num_equations == 30):
+        print 'least squares test case 1 failed'
+
+    ## noisy fits agree with the normal equations and report ||A x - b||
+    for case in xrange(10):
+        m, n = random.randint(5, 40), random.randint(1, 5)
+        a = [[random.uniform(-1, 1) for _ in xrange(n)] for _ in xrange(m)]
+        b = [random.uniform(-1, 1) for _ in xrange(m)]
+        result = least_squares(planes_for(a, b))
+        if not close(result.x.coord, normal_equations(a, b), 1e-8):
+            print 'least squares test case 2 failed (case %d)' % case
+        if abs(result.residual_norm - residual(a, b, result.x.coord)) > 1e-9:
+            print 'least squares test case 3 failed (case %d)' % case
+
+    ## block_size: one row at a time, exact multiples, a remainder and more
+    ## than there are equations all give the same fit
+    m = 24
+    a = [[random.uniform(-1, 1) for _ in xrange(3)] for _ in xrange(m)]
+    b = [random.uniform(-1, 1) for _ in xrange(m)]
+    reference = least_squares(planes_for(a, b), block_size=m).x.coord
+    for block_size in (1, 2, 5, 8, 23, 25, 100):
+        if not close(least_squares(planes_for(a, b), block_size=block_size).x.coord, reference, 1e-12):
+            print 'least squares test case 4 failed (block size %d)' % block_size
+    ## streaming in several calls, with a solve in between
+    fit = StreamingLeastSquares(3, block_size=5)
+    for row, c in zip(a[:11], b[:11]):
+        fit.add(row, c)
+    fit.solve()
+    fit.add_planes(planes_for(a[11:], b[11:]))
+    if not (close(fit.solve().x.coord, reference, 1e-12) and fit.num_equations == m):
+        print 'least squares test case 5 failed'
+
+    ## rank deficient: the second column is twice the first, so the best
+    ## fit is the one over columns 1 and 3 with one of the first two zero
+    a = [[x, 2*x, 1.] for x in [random.uniform(-1, 1) for _ in xrange(20)]]
+    b = [random.uniform(-1, 1) for _ in xrange(20)]
+    result = least_squares(planes_for(a, b))
+    reduced = normal_equations([[row[0], row[2]] for row in a], b)
+    x = result.x.coord
+    if not (result.rank == 2 and (x[0] == 0. or x[1] == 0.) and
+            abs(x[0] + 2*x[1] - reduced[0]) < 1e-9 and abs(x[2] - reduced[1]) < 1e-9):
+        print 'least squares test case 6 failed'
+    if abs(result.residual_norm - residual(a, b, x)) > 1e-9:
+        print 'least squares test case 7 failed'
+    ## all-zero coefficients: rank 0
+    result = least_squares(planes_for([[0., 0.]]*3, [1., 2., 2.]))
+    if not (result.rank == 0 and result.x.coord == (0., 0.) and abs(result.residual_norm - 3.) < 1e-12):
+        print 'least squares test case 8 failed'
+
+    ## a consistent square system gives the exact solution
+    system = LinearSystem(planes_for([[1., 1.], [1., -1.]], [3., 1.]), 'float')
+    if not close(system.compute_least_squares().x.coord, system.compute_solution().base_pt.coord):
+        print 'least squares test case 9 failed'
+
+    ## errors
+    try:
+        least_squares(iter([]))
+        print 'least squares test case 10 failed'
+    except Exception as e:
+        if NO_EQUATIONS_MSG not in e.args:
+            print 'least squares test case 10 failed'
+    if least_squares([], dimension=2).rank != 0:
+        print 'least squares test case 11 failed'
+    try:
+        StreamingLeastSquares(3).add([1., 2.], 0.)
+        print 'least squares test case 12 failed'
+    except Exception as e:
+        if WRONG_NUMBER_OF_COEFFICIENTS_MSG not in e.args:
+            print 'least squares test case 12 failed'
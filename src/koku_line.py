@@ -6,17 +6,15 @@ Created on Jun 7, 2016
 Created on Jun 6, 2016
 #author: Saeran Vasanthakumar
 '''
-from decimal import Decimal, getcontext
+from decimal import Decimal
 from koku_vector import Vector
+from koku_numeric import get_backend, DECIMAL
 import sys
 
-## Set the decimal precision to 30 places.
-getcontext().prec = 30
-
 class Line(object):
 
     NO_NONZERO_ELTS_FOUND_MSG = 'No nonzero elements found'
-    def __init__(self, normal_vector=None, constant_term=None):
+    def __init__(self, normal_vector=None, constant_term=None, backend=None):
         """
         ### Purpose: generates line object
         ### Inputs normal vector and constant term
@@ -31,44 +29,69 @@ class Line(object):
         ## The direction vector is [-B,A] 
         if not normal_vector:
             all_zeros = ['0']*self.dimension
-            normal_vector = Vector(all_zeros)
+            normal_vector = Vector(all_zeros,backend)
+        elif backend is not None:
+            normal_vector = normal_vector.to_backend(backend)
         self.normal_vector = normal_vector
+        self.backend = normal_vector.backend
 
         if not constant_term:
-            constant_term = Decimal('0')
-        self.constant_term = Decimal(constant_term)
+            constant_term = self.backend.zero
+        self.constant_term = self.backend.convert(constant_term)
         
-        ## Sets the basepoint by setting one of the
+        ## The basepoint is found by setting one of the
         ## coordinates to zero
         ## Formula: y = c/B or x = c/A
-        self.set_basepoint()
+        ## It is computed on first access, see basepoint
     def set_basepoint(self):
         """
         The basepoint is the y or x or z intercept:
         [0,k/B] iff B!=0
         [k/A,0] iff A!=0
         """
+        n = self.normal_vector.coord
+        c = self.constant_term
+        ## Find the first scalar coefficient that is not zero
+        ## to use as divisor to find the value of x,y,z of
+        ## of basepoint
+        ## Ax + By = C
+        ## if A != 0; x = C/A, y = 0
+        ## if B != 0; x = 0, y = C/B
+        initial_index = self.pivot_index
+        if initial_index < 0:
+            self.basepoint = None
+            return
+        basepoint_coords = [self.backend.zero]*self.dimension
+        basepoint_coords[initial_index] = c/n[initial_index]
+        self.basepoint = Vector._from_trusted(tuple(basepoint_coords),self.backend)
+
+    @property
+    def basepoint(self):
+        ### Computed by set_basepoint on first access, then cached
         try:
-            n = self.normal_vector.coord
-            c = self.constant_term
-            basepoint_coords = ['0']*self.dimension
-            
-            ## Find the first scalar coefficient that is not zero
-            ## to use as divisor to find the value of x,y,z of
-            ## of basepoint
-            ## Ax + By = C
-            ## if A != 0; x = C/A, y = 0
-            ## if B != 0; x = 0, y = C/B
-            initial_index = Line.first_nonzero_index(n)
-            initial_coefficient = n[initial_index]
-            basepoint_coords[initial_index] = c/initial_coefficient
-            self.basepoint = Vector(basepoint_coords)
+            return self._basepoint
+        except AttributeError:
+            self.set_basepoint()
+            return self._basepoint
+    @basepoint.setter
+    def basepoint(self, value):
+        self._basepoint = value
 
-        except Exception as e:
-            if str(e) == Line.NO_NONZERO_ELTS_FOUND_MSG:
-                self.basepoint = None
-            else:
-                raise e
+    @property
+    def pivot_index(self):
+        ### Index of the first nonzero coefficient of the normal vector,
+        ### -1 if there is none. Computed on first access, then cached.
+        try:
+            return self._pivot_index
+        except AttributeError:
+            try:
+                index = Line.first_nonzero_index(self.normal_vector.coord,self.backend)
+            except Exception as e:
+                if str(e) != Line.NO_NONZERO_ELTS_FOUND_MSG:
+                    raise e
+                index = -1
+            self._pivot_index = index
+            return index
     def __repr__(self):
         num_decimal_places = 3
         def write_coefficient(coefficient, is_initial_term=False):
@@ -91,7 +114,7 @@ class Line(object):
         n = self.normal_vector.coord
         try:
             
-            initial_index = Line.first_nonzero_index(n)
+            initial_index = Line.first_nonzero_index(n,self.backend)
             terms = []
             for i in range(self.dimension):
                 ## If normal A,B,C... is not equal to zero
@@ -120,13 +143,24 @@ class Line(object):
 
         return output
     @staticmethod
-    def first_nonzero_index(iterable):
+    def first_nonzero_index(iterable, backend=None):
+        ### backend decides what counts as zero, defaults to the
+        ### 1e-10 tolerance of MyDecimal
+        is_near_zero = (backend or DECIMAL).is_near_zero
         for k, item in enumerate(iterable):
-            if not MyDecimal(item).is_near_zero():
+            if not is_near_zero(item):
                 return k
         #print Line.NO_NONZERO_ELTS_FOUND_MSG
         raise Exception(Line.NO_NONZERO_ELTS_FOUND_MSG)
     
+    def to_backend(self, backend):
+        ### Purpose: return this line in another numeric backend
+        backend = get_backend(backend)
+        if backend is self.backend:
+            return self
+        return Line(self.normal_vector.to_backend(backend),
+                  backend.convert(self.constant_term))
+    
     def is_parallel(self,line):
         """
         Input line and self. Checks if the normal vectors 
@@ -155,7 +189,7 @@ class Line(object):
                 # Check equality of constant terms??
                 else:
                     diff = self.constant_term - line.constant_term
-                    return MyDecimal(diff).is_near_zero()
+                    return self.backend.is_near_zero(diff)
             elif line.normal_vector.is_zero():
                 return False
 
@@ -186,7 +220,7 @@ class Line(object):
                 C,D,m = ln[0], ln[1],line.constant_term
                 y = (A*m - k*C)/(A*D - B*C)
                 x = (m - D*y)/C
-                return Vector([x,y])
+                return Vector([x,y],self.backend)
         except ZeroDivisionError:
             # the case when lines are equal
             if self == line:
@@ -224,4 +258,24 @@ print "intersection:", line_0.get_intersection(line_1)
 line_0 = Line(Vector([1.182,5.562]),6.744)
 line_1 = Line(Vector([1.773,8.343]),9.525)
 print "intersection:", line_0.get_intersection(line_1)
-"""
\ No newline at end of file
+"""
+
+if __name__ == '__main__':
+
+    ## Lazy basepoint tests
+    line_0 = Line(Vector(['3','4']),'8')
+    if '_basepoint' in line_0.__dict__:
+        print 'basepoint test case 1 failed'
+    if not (line_0.pivot_index == 0 and line_0.basepoint == Vector([Decimal(8)/3,'0'])):
+        print 'basepoint test case 2 failed'
+    if not (Line(Vector(['0','2']),'4').basepoint == Vector(['0','2']) and Line().basepoint is None):
+        print 'basepoint test case 3 failed'
+    ## parallel and equal lines compare their basepoints on demand
+    line_0 = Line(Vector(['4.046','2.836']),'1.21')
+    line_1 = Line(Vector(['10.115','7.09']),'3.025')
+    if not (line_0.is_parallel(line_1) and line_0 == line_1):
+        print 'basepoint test case 4 failed'
+    line_0 = Line(Vector(['1.182','5.562']),'6.744')
+    line_1 = Line(Vector(['1.773','8.343']),'9.525')
+    if not (line_0.is_parallel(line_1) and not line_0 == line_1):
+        print 'basepoint test case 5 failed'
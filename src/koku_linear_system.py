@@ -1,10 +1,16 @@
-from decimal import Decimal, getcontext
-from copy import deepcopy
+from decimal import Decimal
+from math import log10
 
 from koku_vector import Vector
 from koku_hyperplane import Hyperplane
 from koku_parametrization import Parametrization
-getcontext().prec = 30
+from koku_matrix import AugmentedMatrix, LUDecomposition, BlockedLUDecomposition, SingularMatrixError, FIRST_NONZERO_PIVOTING, PARTIAL_PIVOTING
+from koku_factorization import RREFFactorization
+from koku_bareiss import BareissElimination
+import koku_iterative
+from koku_least_squares import least_squares
+from koku_profiling import phase
+from koku_numeric import get_backend, using_backend, DecimalBackend, FLOAT, FRACTION, DEFAULT_DECIMAL_PRECISION
 
 class MyDecimal(Decimal):
     def is_near_zero(self, eps=1E-10):
@@ -16,19 +22,60 @@ class LinearSystem(object):
     NO_SOLUTIONS_MSG = 'No solutions'
     INF_SOLUTIONS_MSG = 'Infinitely many solutions'
 
-    def __init__(self, planes):
+    ## float64 unit roundoff, used to judge condition estimates
+    FLOAT_EPSILON = 2.0**-52
+
+    ## compute_solution methods: elimination to RREF, or the cache-blocked
+    ## LU of compute_solution_blocked
+    RREF_METHOD = 'rref'
+    BLOCKED_METHOD = 'blocked'
+    UNKNOWN_METHOD_MSG = 'Unknown solution method'
+    BLOCKED_IS_FLOAT_PARTIAL_MSG = "method='blocked' solves in float with partial pivoting"
+
+    def __init__(self, planes, backend=None):
         ### Takes list of planes
         ### Checks if all planes are in the same dimension
         ### adds planes and dimension to class
+        ### backend: koku_numeric backend to solve in. Defaults to the
+        ### backend of the first plane; planes in another backend are
+        ### converted.
         try:
             d = planes[0].dimension
             for p in planes:
                 assert p.dimension == d
 
+            if backend is None:
+                backend = planes[0].backend
+            self.backend = get_backend(backend)
+            if any(p.backend is not self.backend for p in planes):
+                planes = [p.to_backend(self.backend) for p in planes]
             self.planes = planes
             self.dimension = d
+            self._invalidate()
         except AssertionError:
             raise Exception(self.ALL_PLANES_MUST_BE_IN_SAME_DIM_MSG)
+    def _invalidate(self):
+        ### Drops the cached elimination used by rank, determinant,
+        ### nullspace, inverse and solution. Every method that changes a
+        ### plane calls this; code assigning to self.planes directly must
+        ### too.
+        self._factorization = None
+        self._solution = None
+        self._pivot_indices = None
+        self.row_permutation = None
+    def set_elimination_info(self, pivot_indices, row_permutation):
+        ### Record what the elimination that produced this system already
+        ### knows: the pivot column of each row and, for each row, the
+        ### index of the equation it came from in the original system.
+        ### Kept until a plane changes.
+        self._pivot_indices = list(pivot_indices)
+        self.row_permutation = list(row_permutation)
+    def copy(self):
+        ### Purpose: cheap snapshot of the system
+        ### Only the list of planes is copied. Row operations replace
+        ### whole planes instead of changing them, so the snapshot and
+        ### the original can be modified independently.
+        return LinearSystem(list(self.planes), self.backend)
     def __len__(self):
         return len(self.planes)
     def __getitem__(self, i):
@@ -38,7 +85,8 @@ class LinearSystem(object):
         ### with plane[i]
         try:
             assert x.dimension == self.dimension
-            self.planes[i] = x
+            self.planes[i] = x.to_backend(self.backend)
+            self._invalidate()
         except AssertionError:
             raise Exception(self.ALL_PLANES_MUST_BE_IN_SAME_DIM_MSG)
     def __repr__(self):
@@ -55,6 +103,7 @@ class LinearSystem(object):
         #or you can use this, which accounts for the temp storage
         #Mutate
         self.planes[row0],self.planes[row1] = self.planes[row1],self.planes[row0]
+        self._invalidate()
     def multiply_coefficient_and_row(self, coefficient, row):
         #Multiples normal vector and constant by scalar coefficient
         #Makes a NEW normal vector and NEW scalar coefficient and then
@@ -67,6 +116,7 @@ class LinearSystem(object):
         new_normal_vector = self.planes[row].normal_vector.times_scalar(coefficient)
         new_constant_term = self.planes[row].constant_term * coefficient
         self.planes[row] = Hyperplane(normal_vector=new_normal_vector, constant_term=new_constant_term)
+        self._invalidate()
     def add_multiple_times_row_to_row(self, coefficient, row_index_to_add, row_index):
         # Multiples the row_index_to_add with coefficient and then
         # adds it to the row_index
@@ -85,6 +135,7 @@ class LinearSystem(object):
         
         #Create new plane
         self.planes[row_index] = Hyperplane(normal_vector=sum_normal_vector,constant_term=sum_constant_term)
+        self._invalidate()
         #print 'new rows'
         #print self[row_index], 'row index'
         #print self[row_index_to_add], 'row index to add'
@@ -95,23 +146,45 @@ class LinearSystem(object):
         ### Finds the first nonzezo index in normal of plane (coefficient)
         ### If no nonzero, index is -1, and continues iteration at next plane
         ### Returns list of indices
-        num_equations = len(self)
-        num_variables = self.dimension
-        indices = [-1] * num_equations
-
-        for i,p in enumerate(self.planes):
-            try:
-                indices[i] = p.first_nonzero_index(p.normal_vector.coord)
-            except Exception as e:
-                if str(e) == Hyperplane.NO_NONZERO_ELTS_FOUND_MSG:
-                    continue
-                else:
-                    raise e
-        return indices
+        ### Each plane caches its own pivot_index, so asking again is cheap,
+        ### and a system made by elimination has the list already
+        if self._pivot_indices is None:
+            self._pivot_indices = [p.pivot_index for p in self.planes]
+        return list(self._pivot_indices)
       
-    def compute_solution(self):
+    def compute_solution(self, backend=None, pivoting=FIRST_NONZERO_PIVOTING, profile=None,
+                         method=RREF_METHOD):
+        ### backend: solve in this koku_numeric backend instead of the
+        ### system's own, i.e. 'float' for speed or 'fraction' for exact
+        ### pivoting: 'first' pivots on the first nonzero row, 'partial'
+        ### on the largest coefficient (stable in float)
+        ### profile: optional EliminationProfile to fill in, see
+        ### koku_profiling
+        ### method: 'rref' (default) for any system, whatever its size,
+        ### or 'blocked' to ask for compute_solution_blocked, which needs pivoting='partial' (and
+        ### backend None or 'float'), a square nonsingular system, and
+        ### raises SingularMatrixError otherwise
+        if method == self.BLOCKED_METHOD:
+            if pivoting != PARTIAL_PIVOTING or backend not in (None, FLOAT, FLOAT.name):
+                raise Exception(self.BLOCKED_IS_FLOAT_PARTIAL_MSG)
+            return self.compute_solution_blocked(profile=profile)
+        if method != self.RREF_METHOD:
+            raise Exception(self.UNKNOWN_METHOD_MSG + ': ' + repr(method))
+        if backend is not None:
+            backend = get_backend(backend)
+            with using_backend(backend):
+                with phase(profile, 'convert'):
+                    system = LinearSystem(self.planes, backend)
+                    if profile is not None:
+                        ## one new Hyperplane and normal Vector per plane
+                        ## to_backend had to convert
+                        converted = sum(1 for old, new in zip(self.planes, system.planes) if old is not new)
+                        profile.hyperplanes += converted
+                        profile.vectors += converted
+                return system.compute_solution(pivoting=pivoting, profile=profile)
         #try:
-        return self.compute_ge()
+        with self.backend.activate():
+            return self.compute_ge(pivoting, profile)
         #except Exception as e:
         #    if str(e)==self.NO_SOLUTIONS_MSG:
         #        return str(e)
@@ -119,17 +192,189 @@ class LinearSystem(object):
         #        print str(e)
         #        raise e
         
+    def compute_solution_blocked(self, block_size=None, profile=None):
+        ### Purpose: float solution of a large dense square system by
+        ### blocked LU with partial pivoting, see BlockedLUDecomposition
+        ### Only used on request (also as compute_solution(method=
+        ### 'blocked')), never picked automatically. About twice as fast
+        ### as compute_solution at 300 unknowns, but only for a unique
+        ### solution: raises
+        ### SingularMatrixError for a singular system, which needs
+        ### compute_solution to tell no solutions from infinitely many
+        ### profile: only swaps, allocations, growth and time are
+        ### recorded, the LU does no separate row scalings or additions
+        ### self -> Parametrization
+        rows = [p.normal_vector.coord for p in self.planes]
+        with phase(profile, 'blocked_lu'):
+            lu = BlockedLUDecomposition(rows, block_size, self.dimension*self.FLOAT_EPSILON)
+        if profile is not None:
+            n = lu.size
+            profile.num_rows = profile.num_cols = n
+            profile.backend = FLOAT.name
+            profile.pivoting = PARTIAL_PIVOTING
+            profile.swaps += lu.swaps
+            largest = max([max(map(abs, row)) for row in rows] or [0.])
+            profile.initial_max = max(profile.initial_max, largest)
+            profile.max_entry = max(profile.max_entry, largest)
+            ## U is the upper triangle of lu
+            profile.observe([max(map(abs, lu.lu[i*n + i:(i+1)*n])) for i in xrange(n)])
+        if lu.singular:
+            raise SingularMatrixError(lu.MATRIX_IS_SINGULAR_MSG)
+        with phase(profile, 'solution'):
+            x = lu.solve([p.constant_term for p in self.planes])
+            result = Parametrization(Vector._from_trusted(tuple(x), FLOAT), [])
+        if profile is not None:
+            profile.vectors += 1
+        return result
+
     def raise_exception_if_no_solution(self):
         #Iterates backwards through planes
         pivot_indices = self.indices_of_first_nonzero_terms_in_each_row()
         for i in range(len(self))[::-1]:
             j = pivot_indices[i]
             constant_term = self[i].constant_term
-            if j < 0. and not MyDecimal(constant_term).is_near_zero():
+            if j < 0. and not self.backend.is_near_zero(constant_term):
                 # 0 = k, no solution
                 raise Exception(self.NO_SOLUTIONS_MSG)
             
-    def compute_ge(self):
+    def compute_solution_adaptive(self, relative_accuracy=1E-10, max_precision=200, return_info=False):
+        ### Purpose: solve in float64 with partial pivoting, and only
+        ### re-solve in higher precision Decimal when float is not enough
+        ### For a square system, an LU decomposition with partial pivoting
+        ### gives the solution plus an estimate of the condition number
+        ### cond. The float answer is expected to be good to about
+        ### cond * 2^-52 relative error; if that is worse than
+        ### relative_accuracy, or the system is singular or not square,
+        ### the system is solved again by partial pivoting in Decimal with
+        ### enough digits to cover cond (at least the default 30, at most
+        ### max_precision). When cond is unknown (singular or not square)
+        ### the Decimal solve uses the default 30 digits and tolerance.
+        ### return_info: also return a dict with the condition estimate,
+        ### the backend used and whether the solve escalated
+        ### self -> Parametrization (, info)
+        info = {'condition': None, 'backend': FLOAT.name, 'precision': None, 'escalated': False}
+        num_variables = self.dimension
+        if len(self) == num_variables:
+            rows = [p.normal_vector.coord for p in self.planes]
+            ## only call it singular when float cannot tell it apart from
+            ## singular, anything short of that is left to the estimate
+            lu = LUDecomposition(rows, FLOAT, num_variables*self.FLOAT_EPSILON)
+            cond = lu.condition_estimate()
+            info['condition'] = cond
+            if not lu.singular and cond*self.FLOAT_EPSILON <= relative_accuracy:
+                x = lu.solve([p.constant_term for p in self.planes])
+                result = Parametrization(Vector._from_trusted(tuple(x), FLOAT), [])
+                return (result, info) if return_info else result
+        else:
+            cond = float('inf')
+
+        ## Escalate: digits to cover the conditioning, plus the digits
+        ## asked for, plus a few guard digits. The near-zero tolerance
+        ## shrinks with the precision so small but real pivots of an
+        ## ill-conditioned system are not mistaken for zeros.
+        if cond == float('inf'):
+            prec = DEFAULT_DECIMAL_PRECISION
+            backend = DecimalBackend(prec)
+        else:
+            prec = int(log10(max(cond, 1.))) - int(log10(relative_accuracy)) + 5
+            prec = min(max(prec, DEFAULT_DECIMAL_PRECISION), max_precision)
+            backend = DecimalBackend(prec, tolerance=10.**-(prec-5))
+        info.update({'backend': 'decimal', 'precision': prec, 'escalated': True})
+        result = self.compute_solution(backend, PARTIAL_PIVOTING)
+        return (result, info) if return_info else result
+
+    def compute_exact(self):
+        ### Purpose: exact elimination with no tolerance, for integer or
+        ### rational coefficients (see koku_bareiss)
+        ### self -> BareissElimination, with rank, pivot_indices,
+        ### consistent and determinant
+        return BareissElimination([p.normal_vector.coord for p in self.planes],
+                                  [p.constant_term for p in self.planes])
+
+    def compute_rref_exact(self):
+        ### Purpose: exact RREF, as a LinearSystem in the fraction backend
+        elimination = self.compute_exact()
+        planes = [Hyperplane(Vector._from_trusted(tuple(row), FRACTION), c)
+                  for row, c in zip(elimination.rref_rows, elimination.rref_rhs)]
+        return LinearSystem(planes, FRACTION)
+
+    def compute_solution_exact(self):
+        ### Purpose: exact solution, as a Parametrization of Fractions
+        ### Raises NO_SOLUTIONS_MSG like compute_solution
+        system = self.compute_rref_exact()
+        system.raise_exception_if_no_solution()
+        return Parametrization(system.get_base_point(), system.get_direction_vectors())
+
+    ITERATIVE_METHODS = {
+        'cg': koku_iterative.conjugate_gradient,
+        'gauss_seidel': koku_iterative.gauss_seidel,
+        'sor': koku_iterative.sor,
+    }
+    UNKNOWN_ITERATIVE_METHOD_MSG = 'Unknown iterative method'
+
+    def compute_solution_iterative(self, method='cg', **options):
+        ### Purpose: approximate float solution of a large square system
+        ### method: 'cg' (symmetric positive definite), 'gauss_seidel' or
+        ### 'sor' (diagonally dominant); options such as x0, tolerance,
+        ### max_iterations, omega and callback go to the solver
+        ### self -> IterativeResult, see koku_iterative
+        try:
+            solver = self.ITERATIVE_METHODS[method]
+        except KeyError:
+            raise Exception(self.UNKNOWN_ITERATIVE_METHOD_MSG + ': ' + repr(method))
+        return solver(self, **options)
+
+    def compute_least_squares(self, block_size=None, tolerance=None):
+        ### Purpose: best-fit float solution of an overdetermined (or any)
+        ### system, minimising ||A x - b||, for when compute_solution
+        ### raises NO_SOLUTIONS_MSG on noisy equations
+        ### self -> LeastSquaresResult with x, residual_norm and rank,
+        ### see koku_least_squares
+        return least_squares(self.planes, self.dimension, block_size, tolerance)
+
+    ## Cached accessors: one elimination (see factorize) serves all of them
+    ## until a plane changes
+
+    def _eliminated(self):
+        if self._factorization is None:
+            self._factorization = self.factorize()
+        return self._factorization
+    def rank(self):
+        return self._eliminated().rank
+    def determinant(self):
+        ### Square systems only
+        return self._eliminated().determinant()
+    def nullspace(self):
+        ### Basis of the solutions with all constant terms zero,
+        ### one Vector per free variable
+        return self._eliminated().nullspace()
+    def inverse(self):
+        ### Inverse of the coefficient matrix as a list of row Vectors,
+        ### raises if it is singular or not square
+        return self._eliminated().inverse()
+    def solution(self):
+        ### compute_solution(), cached
+        ### Raises NO_SOLUTIONS_MSG like compute_solution
+        if self._solution is None:
+            try:
+                self._solution = self._eliminated().solve([p.constant_term for p in self.planes])
+            except Exception as e:
+                if self.NO_SOLUTIONS_MSG not in e.args:
+                    raise
+                ## cache the message, not the exception: re-raising one
+                ## instance appends to its traceback every time
+                self._solution = self.NO_SOLUTIONS_MSG
+        if self._solution is self.NO_SOLUTIONS_MSG:
+            raise Exception(self.NO_SOLUTIONS_MSG)
+        return self._solution
+
+    def factorize(self, pivoting=FIRST_NONZERO_PIVOTING):
+        ### Purpose: eliminate the coefficients once, to solve for many
+        ### sets of constant terms in O(n^2) each
+        ### self -> RREFFactorization, see koku_factorization
+        return RREFFactorization(self, pivoting)
+
+    def compute_ge(self, pivoting=FIRST_NONZERO_PIVOTING, profile=None):
         #Takes matrix and outputs gaussian_elimination
         #and parametrization if infinite solutions
         #(a) Unique solution to matrix as vector
@@ -139,11 +384,14 @@ class LinearSystem(object):
         # Check: if unique then add to vector
         # Check: if parameter present then not unique
         # Check: if 0 = k then no solution 
-        system = self.compute_rref()
-        system.raise_exception_if_no_solution()
-        
-        base_point = system.get_base_point()
-        direction_vectors = system.get_direction_vectors()
+        system = self.compute_rref(pivoting, profile)
+        with phase(profile, 'solution'):
+            system.raise_exception_if_no_solution()
+
+            base_point = system.get_base_point()
+            direction_vectors = system.get_direction_vectors()
+        if profile is not None:
+            profile.vectors += 1 + len(direction_vectors)
             
         return Parametrization(base_point,direction_vectors)
         
@@ -189,7 +437,7 @@ class LinearSystem(object):
         
         #Get direction vectors
         for param_index in param_indices:
-            vector = [0] * num_variables
+            vector = [self.backend.zero] * num_variables
             for i in xrange(len(self.planes)):
                 #The param row j, in col i == param coeff
                 #Except when col i == param row j
@@ -201,16 +449,18 @@ class LinearSystem(object):
                     #are zeros therefore they correspond 
                     #to parameters = 1
                     break
-                vector[i] = -1 * plane.normal_vector[param_index]
-            vector[param_index] = 1   
-            dir_vectors.append(Vector(vector))
+                #The coefficient belongs to the pivot variable of row i,
+                #which is only variable i when every earlier column has a pivot
+                vector[pivot_index] = -1 * plane.normal_vector[param_index]
+            vector[param_index] = self.backend.one
+            dir_vectors.append(Vector._from_trusted(tuple(vector),self.backend))
         return dir_vectors
     def get_base_point(self):
         #Purpose: Inputs RREF system and outputs basept
         
         num_variables = self.dimension
         pivot_indices = self.indices_of_first_nonzero_terms_in_each_row()
-        basept = [0] * num_variables
+        basept = [self.backend.zero] * num_variables
     
         #Get basept: Not clever, but clear and correct
         #The pivot index j in basept corresponds to where you 
@@ -224,34 +474,22 @@ class LinearSystem(object):
             if pivot_index < 0:
                 break
             basept[pivot_index] = self.planes[i].constant_term
-        return Vector(basept)
-    def compute_rref(self):
+        return Vector._from_trusted(tuple(basept),self.backend)
+    def compute_rref(self, pivoting=FIRST_NONZERO_PIVOTING, profile=None):
         #RREF:
         #1. Triangular form
         #2. Each pivot variable has coefficient of 1
         #3. Each pivot variable is in its own column
         #4. Any non-single pivots are a parameter
-        system = self.compute_triangular_form()
-        numofplanes = len(system)
-        nonzero_indices = system.indices_of_first_nonzero_terms_in_each_row()
-        
-        #Iterate up through system of planes
-        for i in range(numofplanes)[::-1]:
-            coeff_index = nonzero_indices[i]
-            
-            if coeff_index < 0:
-                #no pivot index, everything is zero
-                #move up
-                continue
-            
-            factor2one = Decimal('1.')/system[i].normal_vector[coeff_index]
-            system.multiply_coefficient_and_row(factor2one,i)
-            #because we are adding bottom to top, we don't mess
-            #up the pivot coefficients becaues of triangular form
-            system.clear_all_terms_above(i,coeff_index)                
-        return system
+        #The row operations run in place on a dense AugmentedMatrix,
+        #Hyperplanes are only built for the rows of the result
+        #profile: optional EliminationProfile, see koku_profiling
+        matrix = AugmentedMatrix.from_system(self)
+        matrix.profile = profile
+        matrix.rref(pivoting)
+        return matrix.to_system()
     
-    def compute_triangular_form(self):
+    def compute_triangular_form(self, pivoting=FIRST_NONZERO_PIVOTING, profile=None):
         # Compute triangular form, i.e
         # 2 1 1 = 4
         # 0 3 1 = 5
@@ -261,40 +499,18 @@ class LinearSystem(object):
         # 1. Swap with current row with topmost row below current row
         # 2. Don't multiply rows by numbers
         # 3. Only add a multiple of a row to rows underneat row underneath.
-    
-        system = deepcopy(self)
-        #print 'orig', system
-        lstofplanes = system.planes
-        # define system variables
-        numofeqn = len(lstofplanes)
-        numofcoord = system.dimension
-        col_i = 0 #the column/coordinate
-        # Iterate down through each row
-        for row_i in xrange(numofeqn):
-            # Iterate through each column of each row
-            roweqn = lstofplanes[row_i]
-            while col_i < numofcoord:
-                coef = MyDecimal(roweqn.normal_vector.coord[col_i])
-                #Check if coeff == 0
-                if coef.is_near_zero():
-                    #swap rows with one below
-                    IsSwap = system.swap_first_nonzero_row(row_i,col_i)
-                    if not IsSwap:
-                        #then all zero, so move to next column
-                        col_i += 1
-                        continue # this continues to next iterative loop
-                system.clear_all_terms_below(row_i,col_i)
-                col_i += 1
-                break #break b/c done all terms below, move to next
-            col_i = 0
-            #print '---'
-        #print 'rref', system
-        return system
+        # See AugmentedMatrix.triangular_form
+        # pivoting='partial' swaps in the row with the largest coefficient
+        # profile: optional EliminationProfile, see koku_profiling
+        matrix = AugmentedMatrix.from_system(self)
+        matrix.profile = profile
+        matrix.triangular_form(pivoting)
+        return matrix.to_system()
 
     def clear_all_terms_above(self,row,coli):
         for row2badded2 in range(row)[::-1]:
             coeff_ref = self[row2badded2].normal_vector[coli]
-            alpha = Decimal('-1') * coeff_ref
+            alpha = -coeff_ref
             self.add_multiple_times_row_to_row(alpha,row,row2badded2)
     def clear_all_terms_below(self,rowi,coli):
         #check not last row
@@ -311,7 +527,7 @@ class LinearSystem(object):
             for i,eqn in enumerate(self.planes[rowi+1:]):
                 index = rowi + 1 + i
                 coef2chk = eqn.normal_vector.coord[coli]
-                if not MyDecimal(coef2chk).is_near_zero():
+                if not self.backend.is_near_zero(coef2chk):
                     self.swap_rows(rowi,index)
                     return True
         return False
@@ -560,4 +776,332 @@ p3 = Hyperplane(Vector(['-0.561','-1.056','5.619']),'5.973')
 s = LinearSystem([p0,p1,p2,p3])
 sol = s.compute_solution()
 print sol
-"""
\ No newline at end of file
+"""
+
+if __name__ == '__main__':
+
+    ## AugmentedMatrix elimination tests
+    ## The in-place matrix gives the same triangular form and RREF as the
+    ## expected results of Test 3 and Test 4 above
+    p1 = Hyperplane(normal_vector=Vector(['1','1','1']), constant_term='1')
+    p2 = Hyperplane(normal_vector=Vector(['0','1','0']), constant_term='2')
+    p3 = Hyperplane(normal_vector=Vector(['1','1','-1']), constant_term='3')
+    p4 = Hyperplane(normal_vector=Vector(['1','0','-2']), constant_term='2')
+    s = LinearSystem([p1,p2,p3,p4])
+    t = s.compute_triangular_form()
+    if not (t[0] == p1 and
+            t[1] == p2 and
+            t[2] == Hyperplane(normal_vector=Vector(['0','0','-2']), constant_term='2') and
+            t[3] == Hyperplane(dimension=3)):
+        print 'matrix test case 1 failed'
+    r = s.compute_rref()
+    if not (r[0] == Hyperplane(normal_vector=Vector(['1','0','0']), constant_term='0') and
+            r[1] == p2 and
+            r[2] == Hyperplane(normal_vector=Vector(['0','0','-2']), constant_term='2') and
+            r[3] == Hyperplane(dimension=3)):
+        print 'matrix test case 2 failed'
+
+    p1 = Hyperplane(normal_vector=Vector(['0','1','1']), constant_term='1')
+    p2 = Hyperplane(normal_vector=Vector(['1','-1','1']), constant_term='2')
+    p3 = Hyperplane(normal_vector=Vector(['1','2','-5']), constant_term='3')
+    s = LinearSystem([p1,p2,p3])
+    t = s.compute_triangular_form()
+    if not (t[0] == p2 and
+            t[1] == p1 and
+            t[2] == Hyperplane(normal_vector=Vector(['0','0','-9']), constant_term='-2')):
+        print 'matrix test case 3 failed'
+    r = s.compute_rref()
+    if not (r[0] == Hyperplane(normal_vector=Vector(['1','0','0']), constant_term=Decimal('23')/Decimal('9')) and
+            r[1] == Hyperplane(normal_vector=Vector(['0','1','0']), constant_term=Decimal('7')/Decimal('9')) and
+            r[2] == Hyperplane(normal_vector=Vector(['0','0','1']), constant_term=Decimal('2')/Decimal('9'))):
+        print 'matrix test case 4 failed'
+    ## eliminated entries are exact zeros, and the input is untouched
+    if not (r[1].normal_vector.coord[0] == 0 and r[2].normal_vector.coord[:2] == (0, 0) and
+            s[0] is p1 and s[0].normal_vector == Vector(['0','1','1'])):
+        print 'matrix test case 5 failed'
+
+    ## the matrix works in place on row lists
+    rows = [[2., 1.], [4., 5.]]
+    m = AugmentedMatrix(rows, [3., 6.], 'float')
+    m.rref()
+    if not (m.rows is rows and rows == [[1., 0.], [0., 1.]] and m.rhs == [1.5, 0.] and m.pivots == [0, 1]):
+        print 'matrix test case 6 failed'
+    try:
+        AugmentedMatrix([[1., 2.], [1.]], [0., 0.])
+        print 'matrix test case 7 failed'
+    except Exception as e:
+        if AugmentedMatrix.ALL_ROWS_MUST_HAVE_SAME_LENGTH_MSG not in e.args:
+            print 'matrix test case 7 failed'
+    ## no solution / infinitely many
+    s = LinearSystem([Hyperplane(Vector(['1','1','1']),'1'), Hyperplane(Vector(['1','1','1']),'2')])
+    try:
+        s.compute_solution()
+        print 'matrix test case 8 failed'
+    except Exception as e:
+        if str(e) != LinearSystem.NO_SOLUTIONS_MSG:
+            print 'matrix test case 8 failed'
+    sol = LinearSystem([Hyperplane(Vector(['1','1','1']),'5')]).compute_solution()
+    if not (sol.base_pt == Vector(['5','0','0']) and sol.lst_dir_vec == [Vector(['-1','1','0']), Vector(['-1','0','1'])]):
+        print 'matrix test case 9 failed'
+
+    ## Copy-on-write tests
+    p1 = Hyperplane(Vector(['1','0','0']),'1')
+    p2 = Hyperplane(Vector(['0','0','2']),'4')
+    p3 = Hyperplane(Vector(['0','1','0']),'3')
+    s = LinearSystem([p1,p2,p3])
+    r = s.compute_rref()
+    ## p1 and p3 are never written to and come back as the same objects,
+    ## p2 was scaled and is a new Hyperplane; the input is untouched
+    if not (r[0] is p1 and r[1] is p3 and r[2] is not p2 and r[2] == Hyperplane(Vector(['0','0','1']),'2')):
+        print 'copy-on-write test case 1 failed'
+    if not (s.planes == [p1,p2,p3] and p2.normal_vector.coord == (0,0,2)):
+        print 'copy-on-write test case 2 failed'
+    if not (r.row_permutation == [0,2,1] and r.indices_of_first_nonzero_terms_in_each_row() == [0,1,2]):
+        print 'copy-on-write test case 3 failed'
+    ## copy shares the planes but not the list
+    c = s.copy()
+    c.swap_rows(0,2)
+    c.multiply_coefficient_and_row(2,1)
+    if not (s.planes == [p1,p2,p3] and s[0] is p1 and c[2] is p1 and c[1] == Hyperplane(Vector(['0','0','4']),'8')):
+        print 'copy-on-write test case 4 failed'
+    m = AugmentedMatrix.from_system(s)
+    m.swap_rows(0,1)
+    if not (m.copied == [False,False,False] and m.rows[0] is p2.normal_vector.coord):
+        print 'copy-on-write test case 5 failed'
+    m.scale_row(2,2)
+    if not (m.copied[2] and m.rows[2] == [0,2,0] and p3.normal_vector.coord == (0,1,0)):
+        print 'copy-on-write test case 6 failed'
+
+    ## Partial pivoting and adaptive precision tests
+    from fractions import Fraction
+    ## partial pivoting swaps the larger coefficient up, first-nonzero
+    ## keeps the first row
+    s = LinearSystem([Hyperplane(Vector([1E-3,1.],'float'),1.), Hyperplane(Vector([1.,1.],'float'),2.)])
+    if not (s.compute_triangular_form(PARTIAL_PIVOTING)[0].normal_vector.coord == (1.,1.) and
+            s.compute_triangular_form()[0] is s[0]):
+        print 'adaptive test case 1 failed'
+    x = s.compute_solution(pivoting=PARTIAL_PIVOTING).base_pt.coord
+    if not (abs(x[0] - 1./.999) < 1e-12 and abs(x[1] - (1. - 1E-3/.999)) < 1e-12):
+        print 'adaptive test case 2 failed'
+    ## LU: solve, determinant and an exact condition number for a diagonal
+    lu = LUDecomposition([[2.,0.],[0.,8.]])
+    if not (lu.solve([2.,4.]) == [1.,.5] and lu.determinant() == 16. and abs(lu.condition_estimate() - 4.) < 1e-12):
+        print 'adaptive test case 3 failed'
+    lu = LUDecomposition([[0.,1.],[1.,0.]])
+    if not (lu.determinant() == -1. and lu.solve([3.,5.]) == [5.,3.] and lu.solve_transpose([3.,5.]) == [5.,3.]):
+        print 'adaptive test case 4 failed'
+    ## well conditioned: stays in float
+    s = LinearSystem([Hyperplane(Vector([4.,1.],'float'),1.), Hyperplane(Vector([1.,3.],'float'),2.)])
+    sol, info = s.compute_solution_adaptive(return_info=True)
+    if not (info['escalated'] is False and info['backend'] == 'float' and
+            abs(sol.base_pt.coord[0] - 1./11) < 1e-15 and abs(sol.base_pt.coord[1] - 7./11) < 1e-15):
+        print 'adaptive test case 5 failed'
+    ## Hilbert matrix, cond ~ 1e10: escalates to Decimal and matches the
+    ## exact rational solution
+    n = 8
+    hilbert = [[Fraction(1, i+j+1) for j in range(n)] for i in range(n)]
+    rhs = [sum(row) for row in hilbert]   # x = (1, ..., 1)
+    s = LinearSystem([Hyperplane(Vector([float(a) for a in row],'float'), float(c)) for row, c in zip(hilbert, rhs)])
+    sol, info = s.compute_solution_adaptive(relative_accuracy=1E-8, return_info=True)
+    if not (info['escalated'] and info['backend'] == 'decimal' and info['condition'] > 1E9 and info['precision'] >= DEFAULT_DECIMAL_PRECISION):
+        print 'adaptive test case 6 failed'
+    ## the float inputs are not exactly Hilbert, so compare with the exact
+    ## solution of the float system
+    exact = LinearSystem([Hyperplane(Vector([Fraction(a) for a in p.normal_vector.coord],'fraction'), Fraction(p.constant_term))
+                          for p in s.planes]).compute_solution_exact().base_pt.coord
+    if not all(abs(float(a) - float(b)) <= 1E-8*abs(float(b)) for a, b in zip(sol.base_pt.coord, exact)):
+        print 'adaptive test case 7 failed'
+    ## singular and non-square systems go straight to Decimal
+    s = LinearSystem([Hyperplane(Vector([1.,2.],'float'),3.), Hyperplane(Vector([2.,4.],'float'),6.)])
+    sol, info = s.compute_solution_adaptive(return_info=True)
+    if not (info['escalated'] and info['condition'] == float('inf') and len(sol.lst_dir_vec) == 1):
+        print 'adaptive test case 8 failed'
+    ## asking for more digits than float and default Decimal can cover
+    ## raises the precision with the conditioning
+    sol, info = LinearSystem(s.planes[:1] + [Hyperplane(Vector([2.,4.000001],'float'),6.)]).compute_solution_adaptive(
+        relative_accuracy=1E-25, return_info=True)
+    if not (info['escalated'] and info['precision'] > DEFAULT_DECIMAL_PRECISION):
+        print 'adaptive test case 9 failed'
+
+    ## Factorize-once, solve-many tests
+    def with_constants(system, constants):
+        return LinearSystem([Hyperplane(p.normal_vector, c) for p, c in zip(system.planes, constants)], system.backend)
+    ## replaying the recorded row operations gives exactly what a full
+    ## solve with the new constant terms gives, square or not
+    coefficient_sets = [
+        [['1','2','0'], ['3','1','1'], ['0','1','4']],
+        [['0','1','1'], ['1','-1','1'], ['1','2','-5']],
+        [['1','1','1'], ['2','2','2'], ['1','0','1']],     # rank 2
+        [['1','2','3','4'], ['2','4','7','9']],            # 2 x 4
+    ]
+    for case, coefficients in enumerate(coefficient_sets):
+        s = LinearSystem([Hyperplane(Vector(row), '1') for row in coefficients])
+        f = s.factorize()
+        for constants in (['1']*len(coefficients), ['2','4','-1','0'][:len(coefficients)], ['0.5','1','1.5'][:len(coefficients)]):
+            try:
+                expected = with_constants(s, constants).compute_solution()
+            except Exception as e:
+                expected = str(e)
+            try:
+                got = f.solve(constants)
+                same = (not isinstance(expected, str) and got.base_pt == expected.base_pt and
+                        got.lst_dir_vec == expected.lst_dir_vec)
+            except Exception as e:
+                same = str(e) == expected
+            if not same:
+                print 'factorization test case %d failed' % (case + 1)
+    f = LinearSystem([Hyperplane(Vector(['1','1']),'0'), Hyperplane(Vector(['1','-1']),'0')]).factorize()
+    if not [sol.base_pt for sol in f.solve_many([['2','0'], Vector(['4','2'])])] == [Vector(['1','1']), Vector(['3','1'])]:
+        print 'factorization test case 5 failed'
+    try:
+        f.solve(['1'])
+        print 'factorization test case 6 failed'
+    except Exception as e:
+        if RREFFactorization.WRONG_NUMBER_OF_CONSTANTS_MSG not in e.args:
+            print 'factorization test case 6 failed'
+
+    ## Direction vectors when a free variable comes before a pivot
+    ## y + 2z = 1 in three unknowns: x and z free, y the pivot of row 0
+    s = LinearSystem([Hyperplane(Vector(['0','1','2']),'1')])
+    sol = s.compute_solution()
+    if not (sol.base_pt == Vector(['0','1','0']) and
+            sol.lst_dir_vec == [Vector(['1','0','0']), Vector(['0','-2','1'])]):
+        print 'direction vector test case 1 failed'
+    ## x + w = 1, z - w = 2: y and w free, rows 0 and 1 pivot on x and z
+    s = LinearSystem([Hyperplane(Vector(['1','0','0','1']),'1'),
+                      Hyperplane(Vector(['0','0','1','-1']),'2')])
+    if not s.compute_rref().get_direction_vectors() == [Vector(['0','1','0','0']), Vector(['-1','0','1','1'])]:
+        print 'direction vector test case 2 failed'
+
+    ## Cached accessors: one elimination until a plane changes
+    s = LinearSystem([Hyperplane(Vector(['2','1']),'3'), Hyperplane(Vector(['1','-1']),'0')])
+    if not (s.rank() == 2 and MyDecimal(s.determinant() + 3).is_near_zero() and s.nullspace() == [] and
+            s.solution().base_pt == Vector(['1','1'])):
+        print 'cached accessor test case 1 failed'
+    inverse = s.inverse()
+    product = [[sum(inverse[i][k]*s[k].normal_vector[j] for k in range(2)) for j in range(2)] for i in range(2)]
+    if not all(MyDecimal(product[i][j] - (1 if i == j else 0)).is_near_zero() for i in range(2) for j in range(2)):
+        print 'cached accessor test case 2 failed'
+    f = s._eliminated()
+    if s._eliminated() is not f or s.solution() is not s.solution():
+        print 'cached accessor test case 3 failed'
+    ## changing a plane drops the cache: now rank 1 and inconsistent
+    s[1] = Hyperplane(Vector(['4','2']),'7')
+    if s._eliminated() is f or s.rank() != 1 or not MyDecimal(s.determinant()).is_near_zero():
+        print 'cached accessor test case 4 failed'
+    if not s.nullspace() == [Vector(['-0.5','1'])]:
+        print 'cached accessor test case 5 failed'
+    ## no solutions: a fresh exception per call, so tracebacks do not grow
+    raised = []
+    for attempt in range(2):
+        try:
+            s.solution()
+        except Exception as e:
+            raised.append(e)
+    if not (len(raised) == 2 and raised[0] is not raised[1] and
+            all(LinearSystem.NO_SOLUTIONS_MSG in e.args for e in raised)):
+        print 'cached accessor test case 6 failed'
+    try:
+        s.inverse()
+        print 'cached accessor test case 7 failed'
+    except Exception as e:
+        if RREFFactorization.MATRIX_IS_SINGULAR_MSG not in e.args:
+            print 'cached accessor test case 7 failed'
+
+    ## Pivot tracking: the recorded pivots and row permutation match a rescan
+    import random
+    random.seed(22)
+
+    def rescan(system):
+        ### first nonzero column of each row, -1 for zero rows
+        is_near_zero = system.backend.is_near_zero
+        return [next((k for k, a in enumerate(p.normal_vector.coord) if not is_near_zero(a)), -1)
+                for p in system.planes]
+
+    for case in range(60):
+        n, m = random.randint(1, 5), random.randint(1, 5)
+        backend = ('fraction', 'float', None)[case % 3]
+        rows = [[random.randint(-2, 2) for _ in range(n)] for _ in range(m)]
+        if case % 4 == 0 and m > 1:
+            rows[1] = [2*a for a in rows[0]]   # rank deficient
+        s = LinearSystem([Hyperplane(Vector(map(str, row), backend), str(random.randint(-3, 3)))
+                          for row in rows], backend)
+        for pivoting in (FIRST_NONZERO_PIVOTING, PARTIAL_PIVOTING):
+            for t in (s.compute_triangular_form(pivoting), s.compute_rref(pivoting)):
+                if t.indices_of_first_nonzero_terms_in_each_row() != rescan(t):
+                    print 'pivot tracking test case 1 failed (case %d)' % case
+                if [p.pivot_index for p in t.planes] != rescan(t):
+                    print 'pivot tracking test case 2 failed (case %d)' % case
+                if t.row_permutation is not None and sorted(t.row_permutation) != range(m):
+                    print 'pivot tracking test case 3 failed (case %d)' % case
+    ## row_permutation follows the swaps: row i of the result came from
+    ## equation row_permutation[i]
+    s = LinearSystem([Hyperplane(Vector(['0','1']),'1'), Hyperplane(Vector(['2','0']),'4')])
+    t = s.compute_triangular_form()
+    if not (t.row_permutation == [1, 0] and t.indices_of_first_nonzero_terms_in_each_row() == [0, 1]):
+        print 'pivot tracking test case 4 failed'
+    m = AugmentedMatrix.from_system(s)
+    m.rref()
+    if not (m.pivots == m.pivot_columns() == [0, 1]):
+        print 'pivot tracking test case 5 failed'
+    ## changing a plane drops the record
+    t[0] = Hyperplane(Vector(['0','0']),'0')
+    if not (t.indices_of_first_nonzero_terms_in_each_row() == [-1, 1] and t.row_permutation is None):
+        print 'pivot tracking test case 6 failed'
+
+    ## Blocked LU is opt-in and matches compute_ge
+    from koku_profiling import EliminationProfile
+    random.seed(23)
+    n = 200
+    rows = [[random.uniform(-1, 1) + (n if i == j else 0.) for j in range(n)] for i in range(n)]
+    constants = [random.uniform(-1, 1) for _ in range(n)]
+    s = LinearSystem([Hyperplane(Vector(row, 'float'), c) for row, c in zip(rows, constants)], 'float')
+    expected = s.compute_ge(PARTIAL_PIVOTING).base_pt.coord
+    got = s.compute_solution(pivoting=PARTIAL_PIVOTING, method='blocked')
+    if got.lst_dir_vec or not all(abs(a - b) < 1e-12 for a, b in zip(got.base_pt.coord, expected)):
+        print 'blocked LU test case 1 failed'
+    ## not used unless asked for: the default is the RREF path
+    profile = EliminationProfile()
+    s.compute_solution(profile=profile)
+    if 'blocked_lu' in profile.timings or 'rref' not in profile.timings:
+        print 'blocked LU test case 2 failed'
+    ## singular: raises SingularMatrixError, no fallback
+    singular = LinearSystem(s.planes[:-1] + [s.planes[0]], 'float')
+    try:
+        singular.compute_solution(pivoting=PARTIAL_PIVOTING, method='blocked')
+        print 'blocked LU test case 3 failed'
+    except SingularMatrixError as e:
+        if BlockedLUDecomposition.MATRIX_IS_SINGULAR_MSG not in e.args:
+            print 'blocked LU test case 3 failed'
+    ## the RREF path tells what a singular system has: here a repeated
+    ## equation, so one free variable
+    if len(singular.compute_solution(pivoting=PARTIAL_PIVOTING).lst_dir_vec) != 1:
+        print 'blocked LU test case 4 failed'
+    ## other pivoting or backends are refused rather than ignored
+    for kwargs in ({}, {'pivoting': PARTIAL_PIVOTING, 'backend': 'fraction'}):
+        try:
+            s.compute_solution(method='blocked', **kwargs)
+            print 'blocked LU test case 5 failed'
+        except Exception as e:
+            if LinearSystem.BLOCKED_IS_FLOAT_PARTIAL_MSG not in e.args:
+                print 'blocked LU test case 5 failed'
+    try:
+        s.compute_solution(method='cholesky')
+        print 'blocked LU test case 6 failed'
+    except Exception as e:
+        if not str(e).startswith(LinearSystem.UNKNOWN_METHOD_MSG):
+            print 'blocked LU test case 6 failed'
+    ## block sizes around the matrix size agree with the unblocked LU
+    small = [row[:9] for row in rows[:9]]
+    reference = LUDecomposition(small)
+    for block_size in (1, 2, 3, 8, 9, 10):
+        lu = BlockedLUDecomposition(small, block_size)
+        if not (lu.perm == reference.perm and
+                all(abs(lu.lu[i*9 + j] - reference.lu[i][j]) < 1e-12 for i in range(9) for j in range(9))):
+            print 'blocked LU test case 7 failed (block size %d)' % block_size
+    try:
+        BlockedLUDecomposition([[1., 2.]])
+        print 'blocked LU test case 8 failed'
+    except Exception as e:
+        if BlockedLUDecomposition.MATRIX_MUST_BE_SQUARE_MSG not in e.args:
+            print 'blocked LU test case 8 failed'
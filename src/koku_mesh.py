@@ -0,0 +1,132 @@
+"""
+Bulk triangle-mesh kernels.
+
+Vector.cross_product and area_of_triangle work one pair of vectors at a
+time. The functions here take a whole mesh - a vertex array plus a
+triangle index array - and compute per-face normals and areas in a single
+loop over flat floats, without building a Vector per face.
+
+Vertices can be a VectorBatch (dim 2 or 3), a list of coordinate tuples,
+or a flat sequence of floats. 2d vertices are taken to lie in the z = 0
+plane, same as Vector.cross_product. Triangles are vertex indices, either
+flat [a0,b0,c0, a1,b1,c1, ...] or a list of (a,b,c) tuples.
+"""
+from array import array
+from math import sqrt, fsum
+
+from koku_vector import VectorBatch
+
+ONLY_DEFINED_IN_TWO_THREE_DIM_MSG = 'Mesh vertices must be 2 or 3 dimensional'
+TRIANGLES_MUST_HAVE_THREE_INDICES_MSG = 'Each triangle must have three vertex indices'
+
+
+def _as_batch(vertices, dim=None):
+    ### Purpose: accept a VectorBatch, a list of coordinate tuples or
+    ### a flat sequence of floats (which then needs dim)
+    if isinstance(vertices, VectorBatch):
+        batch = vertices
+    elif dim is not None:
+        batch = VectorBatch(vertices, dim)
+    else:
+        batch = VectorBatch.from_coords(vertices)
+    if batch.dim not in (2, 3):
+        raise ValueError(ONLY_DEFINED_IN_TWO_THREE_DIM_MSG)
+    return batch
+
+
+def _flat_indices(triangles):
+    ### Purpose: flatten [(a,b,c), ...] into [a,b,c, ...]
+    triangles = list(triangles)
+    if triangles and not isinstance(triangles[0], (int, long)):
+        flat = []
+        for t in triangles:
+            if len(t) != 3:
+                raise ValueError(TRIANGLES_MUST_HAVE_THREE_INDICES_MSG)
+            flat.extend(t)
+        triangles = flat
+    if len(triangles) % 3:
+        raise ValueError(TRIANGLES_MUST_HAVE_THREE_INDICES_MSG)
+    return triangles
+
+
+def triangle_normals_and_areas(vertices, triangles, dim=None):
+    ### Purpose: per-face unit normals, per-face areas and the total area
+    ### of a triangle mesh in one pass
+    ### For face (a,b,c) with e1 = b - a and e2 = c - a:
+    ### n = e1 x e2, area = ||n||/2, unit normal = n/||n||
+    ### Degenerate (zero area) faces get a zero normal.
+    ### vertices, triangles -> (VectorBatch of normals, array of areas, total)
+    batch = _as_batch(vertices, dim)
+    tris = _flat_indices(triangles)
+    d = batch.dim
+    data = batch.data
+    X = data[0::d].tolist()
+    Y = data[1::d].tolist()
+    if d == 3:
+        Z = data[2::d].tolist()
+    else:
+        Z = [0.]*batch.size
+
+    normals = array('d')
+    areas = array('d')
+    push_normal = normals.extend
+    push_area = areas.append
+    for a, b, c in zip(tris[0::3], tris[1::3], tris[2::3]):
+        ax, ay, az = X[a], Y[a], Z[a]
+        ux, uy, uz = X[b]-ax, Y[b]-ay, Z[b]-az
+        vx, vy, vz = X[c]-ax, Y[c]-ay, Z[c]-az
+        nx = uy*vz - uz*vy
+        ny = uz*vx - ux*vz
+        nz = ux*vy - uy*vx
+        mag = sqrt(nx*nx + ny*ny + nz*nz)
+        push_area(0.5*mag)
+        if mag:
+            push_normal((nx/mag, ny/mag, nz/mag))
+        else:
+            push_normal((0., 0., 0.))
+    return VectorBatch(normals, 3), areas, fsum(areas)
+
+
+
+if __name__ == '__main__':
+
+    ## Mesh kernel tests
+    import random
+    from koku_vector import Vector
+    random.seed(5)
+    points = [(random.uniform(-5,5), random.uniform(-5,5), random.uniform(-5,5)) for _ in range(30)]
+    faces = [tuple(random.sample(range(30), 3)) for _ in range(40)]
+    normals, areas, total = triangle_normals_and_areas(points, faces)
+    ## per face, the same as Vector.cross_product/area_of_triangle
+    for i, (a, b, c) in enumerate(faces):
+        u = Vector(points[b],'float').minus(Vector(points[a],'float'))
+        v = Vector(points[c],'float').minus(Vector(points[a],'float'))
+        n = u.cross_product(v).normalized()
+        if not (abs(areas[i] - u.area_of_triangle(v)) < 1e-12 and
+                all(abs(x - y) < 1e-12 for x, y in zip(normals.coord(i), n.coord))):
+            print 'mesh test case 1 failed'
+            break
+    if not abs(total - sum(areas)) < 1e-9:
+        print 'mesh test case 2 failed'
+    ## 2d unit square as two counter-clockwise triangles, flat indices
+    square = [0.,0., 1.,0., 1.,1., 0.,1.]
+    normals, areas, total = triangle_normals_and_areas(square, [0,1,2, 0,2,3], dim=2)
+    if not (list(areas) == [0.5, 0.5] and total == 1. and normals.coord(0) == (0.,0.,1.)):
+        print 'mesh test case 3 failed'
+    ## a degenerate face has zero area and a zero normal
+    normals, areas, total = triangle_normals_and_areas([(0,0,0),(1,1,1),(2,2,2)], [(0,1,2)])
+    if not (areas[0] == 0. and normals.coord(0) == (0.,0.,0.)):
+        print 'mesh test case 4 failed'
+    try:
+        triangle_normals_and_areas(points, [0,1])
+        print 'mesh test case 5 failed'
+    except ValueError:
+        pass
+    try:
+        triangle_normals_and_areas([(0,0,0,0)], [])
+        print 'mesh test case 6 failed'
+    except ValueError:
+        pass
+    ## 2d vectors cross in the z = 0 plane
+    if not Vector([1,0],'float').cross_product(Vector([0,2],'float')).coord == (0.,0.,2.):
+        print 'mesh test case 7 failed'
@@ -0,0 +1,257 @@
+"""
+Numeric backends for the koku classes.
+
+Every Vector, Hyperplane and LinearSystem does its arithmetic in one of
+three number types:
+
+    FLOAT    - python float (float64), fastest
+    DECIMAL  - decimal.Decimal, 30 significant digits by default
+    FRACTION - fractions.Fraction, exact rational arithmetic
+
+The backend is picked per object (Vector(coord, backend='float')) or per
+block of code:
+
+    with using_backend('float'):
+        sol = LinearSystem(planes).compute_solution()
+
+Objects derived from an existing object (sums, row operations, etc.) keep
+the backend of the object they came from.
+"""
+import math
+import threading
+from contextlib import contextmanager
+from decimal import Decimal, getcontext, localcontext
+from fractions import Fraction
+
+## Default precision of the Decimal backend. Set once here rather than in
+## every module.
+DEFAULT_DECIMAL_PRECISION = 30
+getcontext().prec = DEFAULT_DECIMAL_PRECISION
+
+
+class NumericBackend(object):
+    """
+    Base class for a number type. Subclasses must define convert (input
+    value -> number type) and sqrt, and may override is_near_zero.
+    tolerance is the default near-zero threshold of is_near_zero.
+    angle_tolerance is the default angle, in radians, below which
+    Vector.is_parallel counts two directions as parallel; it sits above
+    the rounding noise of the number type.
+    """
+    name = None
+    exact = False
+    tolerance = 1E-10
+    angle_tolerance = 1E-10
+
+    MUST_DEFINE_MSG = 'Numeric backends must define %s'
+
+    def convert(self, x):
+        raise NotImplementedError(self.MUST_DEFINE_MSG % 'convert')
+    def sqrt(self, x):
+        raise NotImplementedError(self.MUST_DEFINE_MSG % 'sqrt')
+    def is_near_zero(self, x, eps=None):
+        if eps is None:
+            eps = self.tolerance
+        return abs(float(x)) < eps
+    def to_float(self, x):
+        return float(x)
+    @contextmanager
+    def activate(self):
+        ### Purpose: set up any global state the number type needs
+        ### (i.e. the decimal context) for the duration of a with block
+        yield self
+    def __repr__(self):
+        return '<%s backend>' % self.name
+    def __reduce__(self):
+        return (get_backend, (self.name,))
+
+
+class FloatBackend(NumericBackend):
+    name = 'float'
+    zero = 0.
+    one = 1.
+    ## float64 rounding leaves sin(theta) of parallel vectors at ~1e-8
+    angle_tolerance = 1E-7
+
+    def convert(self, x):
+        if isinstance(x, Fraction):
+            return x.numerator / float(x.denominator)
+        return float(x)
+    def sqrt(self, x):
+        return math.sqrt(x)
+
+
+class DecimalBackend(NumericBackend):
+    name = 'decimal'
+    zero = Decimal('0')
+    one = Decimal('1')
+
+    def __init__(self, prec=None, tolerance=None):
+        ### prec: significant digits, None keeps the current context's
+        ### tolerance: near-zero threshold, defaults to 1e-10
+        self.prec = prec
+        if tolerance is not None:
+            self.tolerance = tolerance
+    def convert(self, x):
+        if isinstance(x, Decimal):
+            return x
+        if isinstance(x, Fraction):
+            return Decimal(x.numerator) / Decimal(x.denominator)
+        return Decimal(x)
+    def sqrt(self, x):
+        return x.sqrt()
+    @contextmanager
+    def activate(self):
+        if self.prec is None:
+            yield self
+        else:
+            with localcontext() as ctx:
+                ctx.prec = self.prec
+                yield self
+    def __reduce__(self):
+        if self.prec is None and self.tolerance == NumericBackend.tolerance:
+            return (get_backend, (self.name,))
+        return (DecimalBackend, (self.prec, self.tolerance))
+
+
+class FractionBackend(NumericBackend):
+    name = 'fraction'
+    exact = True
+    zero = Fraction(0)
+    one = Fraction(1)
+
+    def convert(self, x):
+        if isinstance(x, Fraction):
+            return x
+        if isinstance(x, Decimal):
+            ## Fraction(Decimal) is not accepted by every runtime,
+            ## the string form always is
+            return Fraction(str(x))
+        return Fraction(x)
+    def sqrt(self, x):
+        ### Purpose: exact square root when numerator and denominator
+        ### are both perfect squares, otherwise the closest float
+        x = Fraction(x)
+        if x < 0:
+            raise ValueError('math domain error')
+        num = _isqrt(x.numerator)
+        den = _isqrt(x.denominator)
+        if num*num == x.numerator and den*den == x.denominator:
+            return Fraction(num, den)
+        return Fraction(math.sqrt(x.numerator / float(x.denominator)))
+    def is_near_zero(self, x, eps=None):
+        ## Exact arithmetic: zero means zero
+        return x == 0
+
+
+def _isqrt(n):
+    ### Purpose: integer square root by Newton's method
+    if n < 2:
+        return n
+    x = int(math.sqrt(n))
+    while x*x > n:
+        x = (x + n // x) // 2
+    while (x+1)*(x+1) <= n:
+        x += 1
+    return x
+
+
+FLOAT = FloatBackend()
+DECIMAL = DecimalBackend()
+FRACTION = FractionBackend()
+
+_BACKENDS = {
+    'float': FLOAT,
+    'decimal': DECIMAL,
+    'fraction': FRACTION,
+}
+
+UNKNOWN_BACKEND_MSG = 'Unknown numeric backend'
+
+_state = threading.local()
+
+
+def get_backend(backend=None):
+    ### Purpose: resolve a backend name or instance, None gives the
+    ### backend currently in use
+    if backend is None:
+        return current_backend()
+    if isinstance(backend, NumericBackend):
+        return backend
+    try:
+        return _BACKENDS[backend]
+    except (KeyError, TypeError):
+        raise ValueError(UNKNOWN_BACKEND_MSG + ': ' + repr(backend))
+
+
+def current_backend():
+    stack = getattr(_state, 'stack', None)
+    if stack:
+        return stack[-1]
+    return _default[0]
+
+
+_default = [DECIMAL]
+
+
+def set_default_backend(backend):
+    ### Purpose: change the backend used outside of any using_backend block
+    _default[0] = get_backend(backend)
+
+
+@contextmanager
+def using_backend(backend):
+    ### Purpose: run a block of code with the given backend as the default
+    ### for every new Vector/Hyperplane/LinearSystem created inside it
+    backend = get_backend(backend)
+    stack = getattr(_state, 'stack', None)
+    if stack is None:
+        stack = _state.stack = []
+    stack.append(backend)
+    try:
+        with backend.activate():
+            yield backend
+    finally:
+        stack.pop()
+
+
+if __name__ == '__main__':
+
+    ## Backend tests
+    if not (FLOAT.convert(Fraction(1, 4)) == 0.25 and type(FLOAT.convert('2')) is float):
+        print 'backend test case 1 failed'
+    if not (DECIMAL.convert(Fraction(1, 4)) == Decimal('0.25') and FRACTION.convert(Decimal('0.1')) == Fraction(1, 10)):
+        print 'backend test case 2 failed'
+    if not (FRACTION.sqrt(Fraction(9, 4)) == Fraction(3, 2) and FRACTION.is_near_zero(Fraction(1, 10**30)) is False):
+        print 'backend test case 3 failed'
+    if not (FLOAT.is_near_zero(1E-11) and not FLOAT.is_near_zero(1E-9) and FLOAT.is_near_zero(1E-9, 1E-8)):
+        print 'backend test case 4 failed'
+    ## names resolve to the shared instances, unknown names say so
+    if not (get_backend('float') is FLOAT and get_backend(FRACTION) is FRACTION):
+        print 'backend test case 5 failed'
+    try:
+        get_backend('quad')
+        print 'backend test case 6 failed'
+    except ValueError as e:
+        if UNKNOWN_BACKEND_MSG not in str(e):
+            print 'backend test case 6 failed'
+    ## the base class names the method a backend forgot to define
+    try:
+        NumericBackend().sqrt(4)
+        print 'backend test case 7 failed'
+    except NotImplementedError as e:
+        if str(e) != NumericBackend.MUST_DEFINE_MSG % 'sqrt':
+            print 'backend test case 7 failed'
+    ## using_backend nests and restores the default
+    before = current_backend()
+    with using_backend('float'):
+        with using_backend('fraction'):
+            inner = current_backend()
+        outer = current_backend()
+    if not (inner is FRACTION and outer is FLOAT and current_backend() is before):
+        print 'backend test case 8 failed'
+    ## DecimalBackend(prec) only changes the precision inside activate
+    with DecimalBackend(50).activate():
+        long_third = Decimal(1)/Decimal(3)
+    if not (len(str(long_third)) == 52 and len(str(Decimal(1)/Decimal(3))) == 2 + DEFAULT_DECIMAL_PRECISION):
+        print 'backend test case 9 failed'
@@ -0,0 +1,239 @@
+"""
+Solve many independent linear systems on a pool of worker processes.
+
+Sending LinearSystems to other processes pickles a whole graph of
+Hyperplanes and Vectors per system, and the Decimal precision is process
+state that workers do not inherit. So each system is packed as raw data
+instead, (coefficient rows, constant terms, backend), where the backend
+pickles as its name or its precision and tolerance. Workers rebuild and
+solve the systems a chunk at a time inside backend.activate(), and send
+back plain coordinate tuples.
+
+    for sol in iter_solve(systems):          # in input order
+        ...
+    for i, sol in iter_solve_unordered(systems):   # as chunks finish
+        ...
+    solutions = solve_many(systems)          # list, in input order
+
+systems can be LinearSystems or (rows, constant_terms[, backend]) tuples
+and can be a generator: it is read one chunk at a time, with at most a
+few chunks per worker in flight. A system that has no solution gives an
+Exception carrying NO_SOLUTIONS_MSG in its place instead of stopping the
+whole batch; any other error in a worker is raised here.
+
+The workers are a multiprocessing.Pool. With max_workers=0 the chunks are
+solved one after another in this process with the same results, which is
+also the only mode where multiprocessing is missing (i.e. IronPython):
+asking for workers there raises NO_MULTIPROCESSING_MSG.
+"""
+from itertools import islice
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from koku_vector import Vector
+from koku_hyperplane import Hyperplane
+from koku_parametrization import Parametrization
+from koku_matrix import FIRST_NONZERO_PIVOTING
+from koku_numeric import get_backend
+
+DEFAULT_CHUNKSIZE = 64
+## chunks submitted per worker ahead of the results being read
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+## seconds between checks for a finished chunk when reading unordered
+POLL_INTERVAL = 0.01
+
+NO_MULTIPROCESSING_MSG = 'multiprocessing is not available, pass max_workers=0 to solve serially'
+
+
+def pack_system(system):
+    ### Purpose: LinearSystem or (rows, constant_terms[, backend]) tuple
+    ### -> (rows, constant_terms, backend) of plain values
+    if hasattr(system, 'planes'):
+        return (tuple(p.normal_vector.coord for p in system.planes),
+                tuple(p.constant_term for p in system.planes),
+                system.backend)
+    if len(system) == 2:
+        rows, constants = system
+        backend = None
+    else:
+        rows, constants, backend = system
+    return (tuple(map(tuple, rows)), tuple(constants), get_backend(backend))
+
+
+def _solve_packed(packed, pivoting):
+    ### Purpose: solve one packed system
+    ### -> (True, basepoint coord, [direction coords]) or (False, message)
+    ## imported here so the module loads quickly in each worker
+    from koku_linear_system import LinearSystem
+    rows, constants, backend = packed
+    with backend.activate():
+        planes = [Hyperplane(Vector(row, backend), c) for row, c in zip(rows, constants)]
+        try:
+            sol = LinearSystem(planes, backend).compute_solution(pivoting=pivoting)
+        except Exception as e:
+            ## only an answer about the system, anything else is a bug
+            ## and goes back to the caller (infinitely many solutions
+            ## come back as a Parametrization, not an exception)
+            if LinearSystem.NO_SOLUTIONS_MSG in e.args:
+                return (False, str(e))
+            raise
+    return (True, sol.base_pt.coord, [v.coord for v in sol.lst_dir_vec])
+
+
+def _solve_chunk(chunk, pivoting):
+    return [_solve_packed(packed, pivoting) for packed in chunk]
+
+
+def _unpack_result(result, backend):
+    if not result[0]:
+        return Exception(result[1])
+    basept = Vector._from_trusted(result[1], backend)
+    return Parametrization(basept, [Vector._from_trusted(d, backend) for d in result[2]])
+
+
+def _chunks(systems, chunksize):
+    ### Purpose: (start index, [packed systems]) for consecutive chunks
+    systems = iter(systems)
+    start = 0
+    while True:
+        chunk = [pack_system(s) for s in islice(systems, chunksize)]
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def _run(systems, max_workers, chunksize, pivoting, ordered):
+    ### Purpose: yield (start index, chunk, results) per chunk, in input
+    ### order if ordered, else as each chunk completes
+    chunks = _chunks(systems, chunksize)
+    if max_workers == 0:
+        for start, chunk in chunks:
+            yield start, chunk, _solve_chunk(chunk, pivoting)
+        return
+    if multiprocessing is None:
+        raise Exception(NO_MULTIPROCESSING_MSG)
+    workers = max_workers or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers)
+    limit = max(1, workers*CHUNKS_IN_FLIGHT_PER_WORKER)
+    try:
+        pending = []
+        for start, chunk in chunks:
+            pending.append((start, chunk, pool.apply_async(_solve_chunk, (chunk, pivoting))))
+            while len(pending) >= limit:
+                for item in _take(pending, ordered):
+                    yield item
+        while pending:
+            for item in _take(pending, ordered):
+                yield item
+        pool.close()
+    finally:
+        ## also stops the workers if the caller gives up early or a
+        ## chunk raised
+        pool.terminate()
+        pool.join()
+
+
+def _take(pending, ordered):
+    ### Purpose: wait for and remove finished chunks from pending: the
+    ### oldest one if ordered, else every one that is done
+    ### AsyncResult.get re-raises an error from the worker.
+    if ordered:
+        start, chunk, result = pending.pop(0)
+        return [(start, chunk, result.get())]
+    while True:
+        finished = [p for p in pending if p[2].ready()]
+        if finished:
+            break
+        pending[0][2].wait(POLL_INTERVAL)
+    pending[:] = [p for p in pending if p not in finished]
+    return [(start, chunk, result.get()) for start, chunk, result in finished]
+
+
+def iter_solve(systems, max_workers=None, chunksize=DEFAULT_CHUNKSIZE, pivoting=FIRST_NONZERO_PIVOTING):
+    ### Purpose: solutions in input order, each as soon as it and every
+    ### solution before it are ready
+    ### max_workers: pool size, None for one per CPU, 0 to run serially
+    ### -> generator of Parametrization (or Exception for no solution)
+    for start, chunk, results in _run(systems, max_workers, chunksize, pivoting, True):
+        for packed, result in zip(chunk, results):
+            yield _unpack_result(result, packed[2])
+
+
+def iter_solve_unordered(systems, max_workers=None, chunksize=DEFAULT_CHUNKSIZE, pivoting=FIRST_NONZERO_PIVOTING):
+    ### Purpose: solutions in the order their chunks complete
+    ### -> generator of (input index, Parametrization or Exception)
+    for start, chunk, results in _run(systems, max_workers, chunksize, pivoting, False):
+        for i, (packed, result) in enumerate(zip(chunk, results)):
+            yield start + i, _unpack_result(result, packed[2])
+
+
+def solve_many(systems, max_workers=None, chunksize=DEFAULT_CHUNKSIZE, pivoting=FIRST_NONZERO_PIVOTING):
+    ### Purpose: list of solutions, in input order
+    return list(iter_solve(systems, max_workers, chunksize, pivoting))
+
+
+if __name__ == '__main__':
+
+    ## Pool and serial runs against solving each system directly
+    import random
+    from koku_linear_system import LinearSystem
+    random.seed(20)
+
+    def direct(packed):
+        rows, constants, backend = packed
+        planes = [Hyperplane(Vector(row, backend), c) for row, c in zip(rows, constants)]
+        try:
+            return LinearSystem(planes, backend).compute_solution()
+        except Exception as e:
+            return str(e)
+
+    def same(expected, got):
+        if isinstance(expected, str):
+            return isinstance(got, Exception) and str(got) == expected
+        return (isinstance(got, Parametrization) and got.base_pt == expected.base_pt and
+                got.lst_dir_vec == expected.lst_dir_vec)
+
+    systems = []
+    for k in xrange(100):
+        n = random.randint(1, 4)
+        rows = [[random.randint(-3, 3) for _ in xrange(n)] for _ in xrange(random.randint(1, 4))]
+        if k % 7 == 0:
+            rows.append(list(rows[0]))   # duplicate row, maybe inconsistent
+        constants = [random.randint(-3, 3) for _ in rows]
+        systems.append((rows, constants, random.choice(['fraction', 'float', None])))
+    expected = [direct(pack_system(s)) for s in systems]
+    if not any(isinstance(e, str) for e in expected):
+        print 'parallel test case 1 failed'
+
+    for max_workers in (0, 2):
+        got = solve_many(systems, max_workers=max_workers, chunksize=7)
+        if len(got) != len(systems) or not all(same(e, g) for e, g in zip(expected, got)):
+            print 'parallel test case 2 failed (max_workers %d)' % max_workers
+        ## a generator works, and unordered gives every index once
+        seen = {}
+        for i, sol in iter_solve_unordered((s for s in systems), max_workers=max_workers, chunksize=9):
+            seen[i] = sol
+        if sorted(seen) != range(len(systems)) or not all(same(expected[i], seen[i]) for i in seen):
+            print 'parallel test case 3 failed (max_workers %d)' % max_workers
+        ## an error that is not about the solutions is raised, not returned
+        bad = systems[:5] + [([[1, 2], [1]], [0, 0])] + systems[5:]
+        try:
+            solve_many(bad, max_workers=max_workers, chunksize=4)
+            print 'parallel test case 4 failed (max_workers %d)' % max_workers
+        except Exception as e:
+            if LinearSystem.ALL_PLANES_MUST_BE_IN_SAME_DIM_MSG not in e.args:
+                print 'parallel test case 4 failed (max_workers %d)' % max_workers
+
+    ## a LinearSystem packs to the same data
+    system = LinearSystem([Hyperplane(Vector(['1', '1']), '2'), Hyperplane(Vector(['1', '-1']), '0')])
+    sol = iter_solve([system], max_workers=2).next()
+    if sol.base_pt != system.compute_solution().base_pt:
+        print 'parallel test case 5 failed'
+    ## infinitely many solutions come back as a Parametrization
+    sol = solve_many([([[1, 1]], [2], 'fraction')], max_workers=0)[0]
+    if not (isinstance(sol, Parametrization) and len(sol.lst_dir_vec) == 1):
+        print 'parallel test case 6 failed'
@@ -1,11 +1,9 @@
-from decimal import Decimal, getcontext
+from decimal import Decimal
 from copy import deepcopy
 
 from koku_vector import Vector
 from koku_plane import Plane
 
-getcontext().prec = 30
-
 class MyDecimal(Decimal):
     def is_near_zero(self, eps=1E-10):
         return abs(float(self)) < eps
@@ -2,10 +2,10 @@
 Created on Jun 6, 2016
 #author: Saeran Vasanthakumar
 '''
-from decimal import Decimal, getcontext
+from decimal import Decimal
 from koku_vector import Vector
+from koku_numeric import get_backend, DECIMAL
 import sys
-getcontext().prec = 30
 
 
 class Plane(object):
@@ -15,44 +15,68 @@ class Plane(object):
     replaced by 'plane'. 
     """
     NO_NONZERO_ELTS_FOUND_MSG = 'No nonzero elements found'
-    def __init__(self, normal_vector=None, constant_term=None):
+    def __init__(self, normal_vector=None, constant_term=None, backend=None):
         self.dimension = 3
 
         if not normal_vector:
             all_zeros = ['0']*self.dimension
-            normal_vector = Vector(all_zeros)
+            normal_vector = Vector(all_zeros,backend)
+        elif backend is not None:
+            normal_vector = normal_vector.to_backend(backend)
         self.normal_vector = normal_vector
+        self.backend = normal_vector.backend
 
         if not constant_term:
-            constant_term = Decimal('0')
-            self.constant_term = constant_term
+            self.constant_term = self.backend.zero
         else:
-            self.constant_term = Decimal(constant_term)
+            self.constant_term = self.backend.convert(constant_term)
 
-        self.set_basepoint()
+        ## basepoint and pivot_index are computed on first access
 
     def set_basepoint(self):
+        n = self.normal_vector.coord
+        c = self.constant_term
+        ## Find the first scalar coefficient that is not zero
+        ## to use as divisor to find the value of x,y,z of
+        ## of basepoint
+        ## Ax + By + Cz = D
+        ## if A != 0; x = D/A, y = 0, z = 0
+        ## if B != 0; x = 0, y = D/B, z = 0
+        initial_index = self.pivot_index
+        if initial_index < 0:
+            self.basepoint = None
+            return
+        basepoint_coords = [self.backend.zero]*self.dimension
+        basepoint_coords[initial_index] = c/n[initial_index]
+        self.basepoint = Vector._from_trusted(tuple(basepoint_coords),self.backend)
+
+    @property
+    def basepoint(self):
+        ### Computed by set_basepoint on first access, then cached
         try:
-            n = self.normal_vector.coord
-            c = self.constant_term
-            basepoint_coords = ['0']*self.dimension
-            
-            ## Find the first scalar coefficient that is not zero
-            ## to use as divisor to find the value of x,y,z of
-            ## of basepoint
-            ## Ax + By + Cz = D
-            ## if A != 0; x = D/A, y = 0, z = 0
-            ## if B != 0; x = 0, y = D/B, z = 0
-            initial_index = Plane.first_nonzero_index(n)
-            initial_coefficient = n[initial_index]
-            basepoint_coords[initial_index] = c/initial_coefficient
-            # Now make the basepoint a vector
-            self.basepoint = Vector(basepoint_coords)
-        except Exception as e:
-            if str(e) == Plane.NO_NONZERO_ELTS_FOUND_MSG:
-                self.basepoint = None
-            else:
-                raise e
+            return self._basepoint
+        except AttributeError:
+            self.set_basepoint()
+            return self._basepoint
+    @basepoint.setter
+    def basepoint(self, value):
+        self._basepoint = value
+
+    @property
+    def pivot_index(self):
+        ### Index of the first nonzero coefficient of the normal vector,
+        ### -1 if there is none. Computed on first access, then cached.
+        try:
+            return self._pivot_index
+        except AttributeError:
+            try:
+                index = Plane.first_nonzero_index(self.normal_vector.coord,self.backend)
+            except Exception as e:
+                if str(e) != Plane.NO_NONZERO_ELTS_FOUND_MSG:
+                    raise e
+                index = -1
+            self._pivot_index = index
+            return index
     
     def __repr__(self):
         ### This function goves is the coefficients (A,B,C)
@@ -82,7 +106,7 @@ class Plane(object):
         
         n = self.normal_vector.coord
         try:
-            initial_index = Plane.first_nonzero_index(n)
+            initial_index = Plane.first_nonzero_index(n,self.backend)
             terms = []
             for i in range(self.dimension):
                 if True:#round(n[i], num_decimal_places) != 0:
@@ -107,12 +131,23 @@ class Plane(object):
         return output
         
     @staticmethod
-    def first_nonzero_index(iterable):
+    def first_nonzero_index(iterable, backend=None):
+        ### backend decides what counts as zero, defaults to the
+        ### 1e-10 tolerance of MyDecimal
+        is_near_zero = (backend or DECIMAL).is_near_zero
         for k, item in enumerate(iterable):
-            if not MyDecimal(item).is_near_zero():
+            if not is_near_zero(item):
                 return k
         raise Exception(Plane.NO_NONZERO_ELTS_FOUND_MSG)
     
+    def to_backend(self, backend):
+        ### Purpose: return this plane in another numeric backend
+        backend = get_backend(backend)
+        if backend is self.backend:
+            return self
+        return Plane(self.normal_vector.to_backend(backend),
+                  backend.convert(self.constant_term))
+    
     def is_parallel(self,p):
         """
         Planes are parallel when the normals are parallel.
@@ -142,7 +177,7 @@ class Plane(object):
                 # check too see if constant terms are equal
                 else:
                     diff = self.constant_term - p.constant_term
-                    return MyDecimal(diff).is_near_zero()
+                    return self.backend.is_near_zero(diff)
             # If self vector NOT zero vector, heck if other normal is zero
             elif p.normal_vector.is_zero():
                 return False
@@ -198,3 +233,26 @@ print '\ntest 4'
 print 'is eq', plane_1 == plane_0
 print 'is parallel', plane_1.is_parallel(plane_0)
 """
+
+
+if __name__ == '__main__':
+
+    ## Lazy basepoint tests
+    plane_0 = Plane(Vector(['0','0','5']),'10')
+    if '_basepoint' in plane_0.__dict__:
+        print 'basepoint test case 1 failed'
+    if not (plane_0.pivot_index == 2 and plane_0.basepoint == Vector(['0','0','2'])):
+        print 'basepoint test case 2 failed'
+    ## equal, parallel and neither
+    plane_0 = Plane(Vector(["-0.412","3.806","0.728"]),"-3.46")
+    plane_1 = Plane(Vector(["1.03","-9.515","-1.82"]),"8.65")
+    if not (plane_1.is_parallel(plane_0) and plane_1 == plane_0):
+        print 'basepoint test case 3 failed'
+    plane_0 = Plane(Vector(['2.611','5.528','0.283']),'4.6')
+    plane_1 = Plane(Vector(['7.715','8.306','5.342']),'3.76')
+    if plane_1.is_parallel(plane_0) or plane_1 == plane_0:
+        print 'basepoint test case 4 failed'
+    plane_0 = Plane(Vector(['-7.926','8.625','-7.212']),'-7.952')
+    plane_1 = Plane(Vector(['-2.642','2.875','-2.404']),'-2.443')
+    if not (plane_1.is_parallel(plane_0) and not plane_1 == plane_0):
+        print 'basepoint test case 5 failed'
@@ -0,0 +1,218 @@
+"""
+Opt-in profiling of elimination.
+
+Pass an EliminationProfile as profile= to LinearSystem.compute_solution,
+compute_triangular_form or compute_rref and it is filled in as the solve
+runs:
+
+    profile = EliminationProfile()
+    sol = system.compute_solution(profile=profile)
+    print profile
+
+It records the size of the system, the backend and pivoting used, counts
+of row swaps, row scalings and row additions, the Vectors and Hyperplanes
+built, the wall time of each phase, and the pivot growth factor: the
+largest coefficient magnitude seen during elimination over the largest in
+the original matrix. A large growth factor means float rounding was
+amplified, a sign the system needs partial pivoting or more precision.
+
+callback, if given, is called as callback(phase, seconds, profile) as
+each phase ends, i.e. to feed a metrics system. Phases are 'convert'
+(changing backend), 'triangular', 'rref' (scaling and clearing above),
+'to_system' (building Hyperplanes), 'solution' (reading off the
+Parametrization) and 'blocked_lu'. A phase run more than once adds up.
+
+Without a profile the elimination does one None check per row operation.
+"""
+import time
+from contextlib import contextmanager
+
+
+class EliminationProfile(object):
+    """
+    Counters and timings of one or more eliminations, see the module
+    docstring.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.num_rows = None
+        self.num_cols = None
+        self.backend = None
+        self.pivoting = None
+        self.swaps = 0
+        self.scalings = 0
+        self.additions = 0
+        self.vectors = 0
+        self.hyperplanes = 0
+        ## seconds per phase
+        self.timings = {}
+        self.initial_max = 0.
+        self.max_entry = 0.
+
+    @property
+    def growth_factor(self):
+        ### Purpose: largest magnitude during elimination over the largest
+        ### in the original matrix, 1 if nothing grew, None before a solve
+        if not self.initial_max:
+            return None
+        return self.max_entry/self.initial_max
+
+    @property
+    def total_time(self):
+        return sum(self.timings.values())
+
+    def start(self, matrix, pivoting):
+        ### Purpose: record the size and largest entry of an
+        ### AugmentedMatrix about to be eliminated
+        self.num_rows = matrix.num_rows
+        self.num_cols = matrix.num_cols
+        self.backend = matrix.backend.name
+        self.pivoting = pivoting
+        largest = max([max([abs(float(x)) for x in row] or [0.]) for row in matrix.rows] or [0.])
+        self.initial_max = max(self.initial_max, largest)
+        self.max_entry = max(self.max_entry, largest)
+
+    def observe(self, values):
+        ### Purpose: track the largest magnitude among values just written
+        if values:
+            largest = max([abs(float(x)) for x in values])
+            if largest > self.max_entry:
+                self.max_entry = largest
+
+    def as_dict(self):
+        return {
+            'num_rows': self.num_rows, 'num_cols': self.num_cols,
+            'backend': self.backend, 'pivoting': self.pivoting,
+            'swaps': self.swaps, 'scalings': self.scalings, 'additions': self.additions,
+            'vectors': self.vectors, 'hyperplanes': self.hyperplanes,
+            'timings': dict(self.timings), 'growth_factor': self.growth_factor,
+        }
+
+    def __repr__(self):
+        growth = self.growth_factor
+        lines = ['EliminationProfile: %sx%s, %s backend, %s pivoting' % (
+                     self.num_rows, self.num_cols, self.backend, self.pivoting),
+                 '  swaps %d, scalings %d, additions %d' % (self.swaps, self.scalings, self.additions),
+                 '  vectors %d, hyperplanes %d' % (self.vectors, self.hyperplanes),
+                 '  growth factor %s' % ('n/a' if growth is None else '%.3g' % growth)]
+        for name in sorted(self.timings):
+            lines.append('  %-10s %.6fs' % (name, self.timings[name]))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def phase(profile, name):
+    ### Purpose: time a block as phase name of profile, no-op for None
+    if profile is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        profile.timings[name] = profile.timings.get(name, 0.) + seconds
+        if profile.callback is not None:
+            profile.callback(name, seconds, profile)
+
+
+if __name__ == '__main__':
+
+    ## Profiling tests on solves with known row operations
+    from koku_vector import Vector
+    from koku_hyperplane import Hyperplane
+    from koku_linear_system import LinearSystem
+    from koku_matrix import AugmentedMatrix, SWAP_OP, SCALE_OP, ADD_OP, PARTIAL_PIVOTING
+
+    def system(rows, constants, backend='fraction'):
+        return LinearSystem([Hyperplane(Vector(row, backend), c) for row, c in zip(rows, constants)], backend)
+
+    ## before any solve
+    profile = EliminationProfile()
+    if profile.growth_factor is not None or profile.total_time != 0 or profile.as_dict()['swaps'] != 0:
+        print 'profiling test case 1 failed'
+
+    ## the counts are the row operations the elimination log records
+    s = system([[0, 1, 2], [1, 1, 1], [2, 1, 0]], [3, 3, 3])
+    profile = EliminationProfile()
+    matrix = AugmentedMatrix.from_system(s)
+    matrix.log = []
+    matrix.profile = profile
+    matrix.rref()
+    ops = [op for op, _, _, _ in matrix.log]
+    if not (profile.swaps == ops.count(SWAP_OP) == 1 and profile.scalings == ops.count(SCALE_OP) and
+            profile.additions == ops.count(ADD_OP) and profile.additions > 0):
+        print 'profiling test case 2 failed'
+    if not (profile.num_rows == 3 and profile.num_cols == 3 and profile.backend == 'fraction'):
+        print 'profiling test case 3 failed'
+
+    ## a full solve: every phase timed, the callback sees each one as it
+    ## ends, one Hyperplane per written row and one Vector per result
+    seen = []
+    profile = EliminationProfile(callback=lambda name, seconds, p: seen.append((name, seconds >= 0, p is profile)))
+    sol = system([[1, 1], [1, -1]], [2, 0]).compute_solution(profile=profile)
+    if sorted(profile.timings) != ['rref', 'solution', 'to_system', 'triangular']:
+        print 'profiling test case 4 failed'
+    if [name for name, _, _ in seen] != ['triangular', 'rref', 'to_system', 'solution'] or \
+            not all(ok and same for _, ok, same in seen):
+        print 'profiling test case 5 failed'
+    ## two rows written, so two new Hyperplanes and their normal Vectors,
+    ## plus the basepoint
+    if profile.hyperplanes != 2 or profile.vectors != 3 or sol.lst_dir_vec:
+        print 'profiling test case 6 failed'
+    ## changing backend adds a convert phase, phases add up over solves
+    s = system([[1, 1], [1, -1]], [2, 0])
+    s.compute_solution(backend='float', profile=profile)
+    if 'convert' not in profile.timings or profile.backend != 'float':
+        print 'profiling test case 7 failed'
+    ## the planes made by converting are counted too: without a backend a
+    ## 3x3 solve that writes every row makes 3 Hyperplanes and 3 + 1
+    ## Vectors, converting first adds 3 of each
+    s = system([[2, 1, 1], [1, 3, 1], [1, 1, 4]], [1, 2, 3])
+    counts = {}
+    for backend in (None, 'decimal', 'fraction'):
+        profile = EliminationProfile()
+        s.compute_solution(backend=backend, profile=profile)
+        counts[backend] = (profile.hyperplanes, profile.vectors)
+    if counts[None] != (3, 4) or counts['decimal'] != (6, 7):
+        print 'profiling test case 13 failed'
+    ## the system's own backend converts nothing
+    if counts['fraction'] != counts[None]:
+        print 'profiling test case 14 failed'
+
+    ## growth factor: eliminating [[1, 1], [1, -1]] makes a -2 from entries
+    ## of size 1
+    profile = EliminationProfile()
+    system([[1, 1], [1, -1]], [2, 0]).compute_triangular_form(PARTIAL_PIVOTING, profile)
+    if profile.growth_factor != 2. or profile.pivoting != PARTIAL_PIVOTING:
+        print 'profiling test case 8 failed'
+    ## partial pivoting keeps the growth of a tiny leading pivot down
+    growth = {}
+    for pivoting in ('first', PARTIAL_PIVOTING):
+        profile = EliminationProfile()
+        system([[1e-8, 1.], [1., 1.]], [1., 2.], 'float').compute_solution(pivoting=pivoting, profile=profile)
+        growth[pivoting] = profile.growth_factor
+    if not growth[PARTIAL_PIVOTING] < 10 < growth['first']:
+        print 'profiling test case 9 failed'
+
+    ## blocked LU, only through the opt-in method
+    s = system([[4., 1., 0.], [1., 4., 1.], [0., 1., 4.]], [1., 2., 3.], 'float')
+    profile = EliminationProfile()
+    s.compute_solution(pivoting=PARTIAL_PIVOTING, method='blocked', profile=profile)
+    if not ('blocked_lu' in profile.timings and 'rref' not in profile.timings and
+            profile.num_rows == 3 and profile.growth_factor >= 1.):
+        print 'profiling test case 10 failed'
+
+    ## phase without a profile does nothing, and still times on errors
+    with phase(None, 'rref'):
+        pass
+    profile = EliminationProfile()
+    try:
+        with phase(profile, 'rref'):
+            raise ValueError('stop')
+    except ValueError:
+        pass
+    if 'rref' not in profile.timings:
+        print 'profiling test case 11 failed'
+    if not repr(profile).startswith('EliminationProfile:') or 'rref' not in repr(profile):
+        print 'profiling test case 12 failed'
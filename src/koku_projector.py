@@ -0,0 +1,154 @@
+"""
+Reusable projection onto a fixed basis.
+
+Vector.component_projected_to normalizes the basis on every call. A
+Projector does the basis work once - normalizing a single basis vector or
+checking an orthonormal set - and then splits any number of vectors into
+the component parallel to the basis and the component orthogonal to it.
+
+    facade = Projector(Vector([1, 2, 0]))
+    par, orth = facade.decompose(v)
+    par_batch, orth_batch = facade.decompose_batch(point_cloud)
+"""
+from array import array
+
+from koku_vector import Vector, VectorBatch
+
+
+class Projector(object):
+    """
+    Projector onto the span of one basis vector or of an orthonormal set.
+    Vector inputs are projected in the basis' numeric backend; VectorBatch
+    inputs are projected in float over the flat coordinate array.
+    """
+    NOT_ORTHONORMAL_MSG = 'The basis vectors must be orthonormal'
+    ALL_VECTORS_MUST_BE_IN_SAME_DIM_MSG = 'All vectors should live in the same dimension'
+
+    def __init__(self, basis, tolerance=None):
+        ### basis: one Vector (any length, it is normalized here) or a
+        ### list of orthonormal Vectors spanning the target subspace
+        if isinstance(basis, Vector):
+            try:
+                self.basis = [basis.normalized()]
+            except Exception as e:
+                if Vector.CANNOT_NORMALIZE_ZERO_VECTOR_MSG in e.args:
+                    raise Exception(Vector.NO_UNIQUE_PARALLEL_COMPONENT_MSG)
+                raise e
+        else:
+            self.basis = list(basis)
+            if not self.basis:
+                raise Exception(Vector.NO_UNIQUE_PARALLEL_COMPONENT_MSG)
+            self._check_orthonormal(tolerance)
+        self.dim = self.basis[0].dim
+        self.backend = self.basis[0].backend
+        ## float copies of the basis for the batch path
+        self._float_basis = [array('d', map(float, u.coord)) for u in self.basis]
+
+    def _check_orthonormal(self, tolerance):
+        dim = self.basis[0].dim
+        for i, u in enumerate(self.basis):
+            if u.dim != dim:
+                raise Exception(self.ALL_VECTORS_MUST_BE_IN_SAME_DIM_MSG)
+            if not u.backend.is_near_zero(u.magnitude_squared() - 1, tolerance):
+                raise Exception(self.NOT_ORTHONORMAL_MSG)
+            for w in self.basis[:i]:
+                if not u.is_orthogonal(w, tolerance):
+                    raise Exception(self.NOT_ORTHONORMAL_MSG)
+
+    def coefficients(self, v):
+        ### Purpose: coordinates of the projection of v in the basis,
+        ### i.e. (u1*v, u2*v, ...)
+        return tuple([u.dot_product(v) for u in self.basis])
+
+    def parallel(self, v):
+        ### Purpose: component of v in the span of the basis
+        ### proj(v) = sum (ui*v) ui
+        if v.dim != self.dim:
+            raise Exception(self.ALL_VECTORS_MUST_BE_IN_SAME_DIM_MSG)
+        basis = self.basis
+        par = basis[0].times_scalar(basis[0].dot_product(v))
+        for u in basis[1:]:
+            par = par.plus(u.times_scalar(u.dot_product(v)))
+        return par
+
+    def orthogonal(self, v):
+        ### Purpose: component of v orthogonal to the basis, v - proj(v)
+        return v.minus(self.parallel(v))
+
+    def decompose(self, v):
+        ### Purpose: (parallel, orthogonal) components of v together,
+        ### sharing the one projection
+        par = self.parallel(v)
+        return par, v.minus(par)
+
+    def decompose_many(self, vectors):
+        ### Purpose: decompose a list of Vectors
+        ### returns ([parallel, ...], [orthogonal, ...])
+        pars, orths = [], []
+        for v in vectors:
+            par, orth = self.decompose(v)
+            pars.append(par)
+            orths.append(orth)
+        return pars, orths
+
+    def decompose_batch(self, batch):
+        ### Purpose: (parallel, orthogonal) components of every vector of
+        ### a VectorBatch, as two VectorBatches
+        if batch.dim != self.dim:
+            raise Exception(self.ALL_VECTORS_MUST_BE_IN_SAME_DIM_MSG)
+        par = None
+        for u in self._float_basis:
+            tiled = VectorBatch(u * batch.size, batch.dim)
+            dots = batch.dot_product(tiled)
+            term = tiled.times_scalar(dots)
+            par = term if par is None else par.plus(term)
+        return par, batch.minus(par)
+
+    def parallel_batch(self, batch):
+        return self.decompose_batch(batch)[0]
+
+    def orthogonal_batch(self, batch):
+        return self.decompose_batch(batch)[1]
+
+
+if __name__ == '__main__':
+
+    ## Projector tests
+    from koku_vector import Vector, VectorBatch
+    vector_0 = Vector([3.039,1.879],'float')
+    vector_1 = Vector([0.825,2.036],'float')
+    projector = Projector(vector_1)
+    ## same as the one-off Vector methods
+    par, orth = projector.decompose(vector_0)
+    if not (par.coord == vector_0.component_projected_to(vector_1).coord and
+            orth.coord == vector_0.component_orthogonal_to(vector_1).coord):
+        print 'projector test case 1 failed'
+    ## the parts add back up and the orthogonal part is orthogonal
+    if not (all(abs(a - b) < 1e-12 for a, b in zip(par.plus(orth).coord, vector_0.coord)) and orth.is_orthogonal(vector_1)):
+        print 'projector test case 2 failed'
+    ## orthonormal set: projection onto the xy plane drops z
+    plane = Projector([Vector([1,0,0]), Vector([0,1,0])])
+    par, orth = plane.decompose(Vector(['2','-3','5']))
+    if not (par == Vector([2,-3,0]) and orth == Vector([0,0,5]) and plane.coefficients(Vector([2,-3,5])) == (2,-3)):
+        print 'projector test case 3 failed'
+    try:
+        Projector([Vector([1,0,0]), Vector([1,1,0])])
+        print 'projector test case 4 failed'
+    except Exception as e:
+        if Projector.NOT_ORTHONORMAL_MSG not in e.args:
+            print 'projector test case 4 failed'
+    try:
+        Projector(Vector([0,0]))
+        print 'projector test case 5 failed'
+    except Exception as e:
+        if Vector.NO_UNIQUE_PARALLEL_COMPONENT_MSG not in e.args:
+            print 'projector test case 5 failed'
+    ## the batch path agrees with the Vector path
+    coords = [(1.,2.,3.), (-4.,0.5,2.), (0.,0.,1.)]
+    projector = Projector(Vector([1,1,0],'float'))
+    par_batch, orth_batch = projector.decompose_batch(VectorBatch.from_coords(coords))
+    pars, orths = projector.decompose_many([Vector(c,'float') for c in coords])
+    for i in range(len(coords)):
+        if not (all(abs(a - b) < 1e-12 for a, b in zip(par_batch.coord(i), pars[i].coord)) and
+                all(abs(a - b) < 1e-12 for a, b in zip(orth_batch.coord(i), orths[i].coord))):
+            print 'projector test case 6 failed'
@@ -0,0 +1,239 @@
+"""
+Batch solver for many small linear systems.
+
+A LinearSystem of Hyperplanes is the general tool, but intersecting two
+lines or three planes that way spends most of its time building Vectors
+and Hyperplanes. solve_small_systems takes any number of systems of the
+same small shape (at most 4 equations in at most 4 unknowns) packed into
+one flat float array and solves them all in one loop, with no objects per
+system:
+
+    data = [a00, a01, b0,  a10, a11, b1,     # system 0
+            c00, c01, d0,  c10, c11, d1,     # system 1
+            ...]
+    solutions, status = solve_small_systems(data, 2, 2)
+
+Each system is num_equations rows of dim coefficients followed by the
+constant term. solutions is a VectorBatch with one point per system and
+status an array of UNIQUE, NO_SOLUTION or INFINITE_SOLUTIONS per system.
+For INFINITE_SOLUTIONS the point is the basepoint compute_solution would
+give (free variables zero); for NO_SOLUTION it is all zeros.
+
+Square 2x2 and 3x3 systems are solved in closed form (Cramer's rule); a
+determinant that is near zero relative to the size of the coefficients
+sends the system to the general path, partial pivoting elimination
+unrolled over a flat list. Arithmetic is float64.
+"""
+from array import array
+
+from koku_vector import VectorBatch
+from koku_numeric import FLOAT
+
+## Status codes
+UNIQUE = 0
+NO_SOLUTION = 1
+INFINITE_SOLUTIONS = 2
+
+MAX_SMALL_DIM = 4
+SMALL_SYSTEM_TOO_LARGE_MSG = 'Small system solver handles at most 4 equations in 4 unknowns'
+DATA_NOT_WHOLE_SYSTEMS_MSG = 'Data length is not a whole number of systems'
+
+
+def pack_systems(systems):
+    ### Purpose: flatten [(rows, constants), ...] into the layout
+    ### solve_small_systems takes
+    ### -> (array of floats, num_equations, dim)
+    data = array('d')
+    num_equations = dim = None
+    for rows, constants in systems:
+        if num_equations is None:
+            num_equations, dim = len(rows), len(rows[0])
+        for row, c in zip(rows, constants):
+            data.extend(map(float, row))
+            data.append(float(c))
+    return data, num_equations, dim
+
+
+def solve_small_systems(data, num_equations, dim, tolerance=None):
+    ### Purpose: solve every system packed in data
+    ### tolerance: a pivot or determinant counts as zero when it is below
+    ### tolerance times the largest coefficient of its system (raised to
+    ### dim for determinants), defaults to the float backend's tolerance
+    ### -> (VectorBatch of solutions, array('b') of status codes)
+    if not (0 < num_equations <= MAX_SMALL_DIM and 0 < dim <= MAX_SMALL_DIM):
+        raise ValueError(SMALL_SYSTEM_TOO_LARGE_MSG)
+    if tolerance is None:
+        tolerance = FLOAT.tolerance
+    if not isinstance(data, array):
+        data = array('d', map(float, data))
+    width = dim + 1
+    stride = num_equations*width
+    if len(data) % stride:
+        raise ValueError(DATA_NOT_WHOLE_SYSTEMS_MSG)
+    count = len(data) // stride
+
+    out = array('d', [0.])*(count*dim)
+    status = array('b', [UNIQUE])*count
+    if num_equations == dim == 2:
+        closed_form = _cramer_2x2
+    elif num_equations == dim == 3:
+        closed_form = _cramer_3x3
+    else:
+        closed_form = None
+
+    for s in xrange(count):
+        ## the closed forms read the system straight out of data, only
+        ## the elimination fallback works on its own copy
+        if closed_form is not None and closed_form(data, s*stride, out, s*dim, tolerance):
+            continue
+        a = data[s*stride:(s+1)*stride]
+        status[s] = _eliminate(a, num_equations, dim, out, s*dim, tolerance)
+    return VectorBatch(out, dim), status
+
+
+def _scale(a, i, stride, width):
+    ### Purpose: largest coefficient magnitude of the system at
+    ### a[i:i+stride], constant terms left out
+    return max([abs(a[k]) for k in xrange(i, i+stride) if (k - i) % width != width - 1])
+
+
+def _cramer_2x2(a, i, out, o, tolerance):
+    ### Purpose: closed form solve of the 2x2 system at a[i:i+6], writes
+    ### the solution to out[o:o+2] and returns True, or False if it is
+    ### near singular
+    a00, a01, b0 = a[i], a[i+1], a[i+2]
+    a10, a11, b1 = a[i+3], a[i+4], a[i+5]
+    det = a00*a11 - a01*a10
+    scale = _scale(a, i, 6, 3)
+    if abs(det) <= tolerance*scale*scale:
+        return False
+    out[o] = (b0*a11 - a01*b1)/det
+    out[o+1] = (a00*b1 - b0*a10)/det
+    return True
+
+
+def _cramer_3x3(a, i, out, o, tolerance):
+    ### Purpose: closed form solve of the 3x3 system at a[i:i+12], writes
+    ### the solution to out[o:o+3] and returns True, or False if it is
+    ### near singular
+    a00, a01, a02, b0 = a[i], a[i+1], a[i+2], a[i+3]
+    a10, a11, a12, b1 = a[i+4], a[i+5], a[i+6], a[i+7]
+    a20, a21, a22, b2 = a[i+8], a[i+9], a[i+10], a[i+11]
+    ## cofactors of the first column
+    c0 = a11*a22 - a12*a21
+    c1 = a02*a21 - a01*a22
+    c2 = a01*a12 - a02*a11
+    det = a00*c0 + a10*c1 + a20*c2
+    scale = _scale(a, i, 12, 4)
+    if abs(det) <= tolerance*scale*scale*scale:
+        return False
+    inv = 1./det
+    out[o] = (b0*c0 + b1*c1 + b2*c2)*inv
+    out[o+1] = (a00*(b1*a22 - a12*b2) + a10*(a02*b2 - b0*a22) + a20*(b0*a12 - a02*b1))*inv
+    out[o+2] = (a00*(a11*b2 - b1*a21) + a10*(b0*a21 - a01*b2) + a20*(a01*b1 - b0*a11))*inv
+    return True
+
+
+def _eliminate(a, m, n, out, o, tolerance):
+    ### Purpose: reduce one flat m x (n+1) augmented matrix to RREF in
+    ### place with partial pivoting, write the basepoint to out[o:o+n]
+    ### -> status code
+    width = n + 1
+    eps = tolerance*_scale(a, 0, m*width, width)
+    pivots = []
+    row = 0
+    for col in xrange(n):
+        if row == m:
+            break
+        ## partial pivoting: largest entry in col at or below row
+        best, best_abs = row, abs(a[row*width + col])
+        for r in xrange(row+1, m):
+            v = abs(a[r*width + col])
+            if v > best_abs:
+                best, best_abs = r, v
+        if best_abs <= eps:
+            continue
+        if best != row:
+            i, j = row*width, best*width
+            a[i:i+width], a[j:j+width] = a[j:j+width], a[i:i+width]
+        p = row*width
+        inv = 1./a[p + col]
+        for k in xrange(col, width):
+            a[p + k] *= inv
+        for r in xrange(m):
+            if r == row:
+                continue
+            q = r*width
+            f = a[q + col]
+            if f:
+                for k in xrange(col, width):
+                    a[q + k] -= f*a[p + k]
+                a[q + col] = 0.
+        pivots.append(col)
+        row += 1
+
+    ## Rows without a pivot read 0 = constant
+    for r in xrange(row, m):
+        if abs(a[r*width + n]) > eps:
+            for k in xrange(n):
+                out[o + k] = 0.
+            return NO_SOLUTION
+    for k in xrange(n):
+        out[o + k] = 0.
+    for r, col in enumerate(pivots):
+        out[o + col] = a[r*width + n]
+    return UNIQUE if len(pivots) == n else INFINITE_SOLUTIONS
+
+
+if __name__ == '__main__':
+
+    ## Small system tests against LinearSystem.compute_solution
+    import random
+    from koku_vector import Vector
+    from koku_hyperplane import Hyperplane
+    from koku_linear_system import LinearSystem
+    random.seed(15)
+
+    def reference(rows, constants):
+        ### -> (status, basepoint) from the general solver
+        system = LinearSystem([Hyperplane(Vector(r,'float'), c) for r, c in zip(rows, constants)])
+        try:
+            sol = system.compute_solution(pivoting='partial')
+        except Exception as e:
+            if str(e) != LinearSystem.NO_SOLUTIONS_MSG:
+                raise
+            return NO_SOLUTION, None
+        return (INFINITE_SOLUTIONS if sol.lst_dir_vec else UNIQUE), sol.base_pt.coord
+
+    for m, n in ((2, 2), (3, 3), (2, 3), (3, 2), (4, 4)):
+        systems = []
+        for k in range(30):
+            rows = [[float(random.randint(-4, 4)) for _ in range(n)] for _ in range(m)]
+            if k % 5 == 0:
+                rows[-1] = [2*x for x in rows[0]]   # dependent row
+            systems.append((rows, [float(random.randint(-4, 4)) for _ in range(m)]))
+        data, num_equations, dim = pack_systems(systems)
+        copy = array('d', data)
+        solutions, status = solve_small_systems(data, num_equations, dim)
+        if data != copy:
+            print 'small system test case 1 failed'
+        for i, (rows, constants) in enumerate(systems):
+            expected_status, point = reference(rows, constants)
+            if status[i] != expected_status:
+                print 'small system test case 2 failed (%dx%d system %d)' % (m, n, i)
+            elif point is not None and not all(abs(a - b) < 1e-9 for a, b in zip(solutions.coord(i), point)):
+                print 'small system test case 3 failed (%dx%d system %d)' % (m, n, i)
+    ## two lines meeting at (1, 2), flat list input
+    solutions, status = solve_small_systems([1., 1., 3., 1., -1., -1.], 2, 2)
+    if not (list(status) == [UNIQUE] and solutions.coord(0) == (1., 2.)):
+        print 'small system test case 4 failed'
+    try:
+        solve_small_systems([1., 2., 3.], 2, 2)
+        print 'small system test case 5 failed'
+    except ValueError:
+        pass
+    try:
+        solve_small_systems([0.]*30, 5, 5)
+        print 'small system test case 6 failed'
+    except ValueError:
+        pass
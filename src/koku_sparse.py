@@ -0,0 +1,419 @@
+"""
+Sparse linear systems.
+
+A Hyperplane stores every coefficient of its normal vector, so a system
+with thousands of unknowns and a handful of nonzeros per equation costs
+O(n^2) memory and O(n^3) dense elimination. SparseLinearSystem stores only
+the nonzero coefficients in compressed sparse row (CSR) form:
+
+    indptr[i]:indptr[i+1]  - slice of indices/data that holds row i
+    indices, data          - column and value of each nonzero
+
+and eliminates on rows held as {column: value} dicts, touching only
+nonzeros. The pivot of each step is picked by the Markowitz rule: the
+entry of least cost (r-1)(c-1), with r and c the nonzeros left in its row
+and column, which bounds the fill-in that step can create. An entry only
+qualifies if it is not too small next to the largest in its column
+(threshold pivoting, skipped for exact backends). The search looks at the
+columns and rows in order of count and stops as soon as no entry not yet
+seen can be cheaper (Duff and Reid), so it rarely scans every nonzero.
+
+compute_solution gives the same Parametrization as LinearSystem.compute_ge:
+a unique solution does not depend on the elimination order. When there
+are free variables, the Markowitz order leaves other columns free than
+the dense RREF, which takes pivots left to right. The direction vectors
+are then recombined so that the free variables are the ones the dense
+RREF picks, and the basepoint and direction vectors match.
+"""
+from koku_vector import Vector
+from koku_parametrization import Parametrization
+from koku_numeric import get_backend
+
+
+class SparseLinearSystem(object):
+    """
+    Linear system with CSR coefficient storage.
+    rows: one entry per equation, each a {column: value} dict or a list
+    of (column, value) pairs; constant_terms: one value per equation;
+    dimension: number of unknowns.
+    """
+    NO_SOLUTIONS_MSG = 'No solutions'
+    INF_SOLUTIONS_MSG = 'Infinitely many solutions'
+    COLUMN_OUT_OF_RANGE_MSG = 'Coefficient column outside the dimension of the system'
+    WRONG_NUMBER_OF_CONSTANTS_MSG = 'Need one constant term per equation'
+
+    ## Threshold pivoting: a pivot must be at least this fraction of the
+    ## largest remaining entry in its column
+    PIVOT_THRESHOLD = 0.1
+
+    def __init__(self, rows, constant_terms, dimension, backend=None):
+        self.backend = backend = get_backend(backend)
+        convert = backend.convert
+        is_zero = backend.zero.__eq__
+        self.dimension = dimension
+        indptr, indices, data = [0], [], []
+        for row in rows:
+            items = row.items() if isinstance(row, dict) else row
+            for col, value in sorted(items):
+                if not 0 <= col < dimension:
+                    raise Exception(self.COLUMN_OUT_OF_RANGE_MSG)
+                value = convert(value)
+                if is_zero(value):
+                    continue
+                indices.append(col)
+                data.append(value)
+            indptr.append(len(indices))
+        self.indptr, self.indices, self.data = indptr, indices, data
+        self.constant_terms = [convert(c) for c in constant_terms]
+        if len(self.constant_terms) != len(indptr) - 1:
+            raise Exception(self.WRONG_NUMBER_OF_CONSTANTS_MSG)
+
+    @classmethod
+    def from_system(cls, system):
+        ### Purpose: sparse copy of a dense LinearSystem
+        rows = [[(j, x) for j, x in enumerate(p.normal_vector.coord) if x]
+                for p in system.planes]
+        return cls(rows, [p.constant_term for p in system.planes],
+                   system.dimension, system.backend)
+
+    def to_system(self):
+        ### Purpose: dense LinearSystem with the same equations
+        ## imported here, koku_linear_system is the heavier module
+        from koku_hyperplane import Hyperplane
+        from koku_linear_system import LinearSystem
+        backend = self.backend
+        planes = []
+        for i in xrange(len(self)):
+            coord = [backend.zero]*self.dimension
+            for j, x in self.row(i).items():
+                coord[j] = x
+            planes.append(Hyperplane(Vector._from_trusted(tuple(coord), backend),
+                                     self.constant_terms[i]))
+        return LinearSystem(planes, backend)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def row(self, i):
+        ### Purpose: the nonzero coefficients of equation i as a dict
+        start, stop = self.indptr[i], self.indptr[i+1]
+        return dict(zip(self.indices[start:stop], self.data[start:stop]))
+
+    def __repr__(self):
+        return 'SparseLinearSystem: %d equations, %d unknowns, %d nonzeros' % (
+            len(self), self.dimension, self.nnz)
+
+    def compute_solution(self):
+        ### Purpose: sparse Gaussian elimination, then back substitution
+        ### self -> Parametrization, raises NO_SOLUTIONS_MSG like
+        ### LinearSystem.compute_solution
+        with self.backend.activate():
+            pivots, rows, rhs = self._eliminate()
+            return self._parametrize(pivots, rows, rhs)
+
+    def _eliminate(self):
+        ### Purpose: forward elimination on dict rows in Markowitz order
+        ### -> ([(row, col) of each pivot, in order], rows, rhs)
+        backend = self.backend
+        is_near_zero = backend.is_near_zero
+        threshold = None if backend.exact else self.PIVOT_THRESHOLD
+        rows = [self.row(i) for i in xrange(len(self))]
+        rhs = list(self.constant_terms)
+        ## Near zero entries are dropped up front and as they appear, the
+        ## dense elimination skips them too
+        for row in rows:
+            for j in [j for j, a in row.iteritems() if is_near_zero(a)]:
+                del row[j]
+        ## col_rows[j]: active rows with a nonzero in column j
+        col_rows = [set() for _ in xrange(self.dimension)]
+        for i, row in enumerate(rows):
+            for j in row:
+                col_rows[j].add(i)
+        active_rows = set(xrange(len(rows)))
+        ## by_col[k], by_row[k]: columns and active rows with k nonzeros,
+        ## updated only for the rows and columns a step touches
+        by_col, by_row, counts = {}, {}, {}
+
+        def place(buckets, key, count):
+            old = counts.pop(key, 0)
+            if old:
+                buckets[old].discard(key)
+                if not buckets[old]:
+                    del buckets[old]
+            if count:
+                buckets.setdefault(count, set()).add(key)
+                counts[key] = count
+
+        for j, entries in enumerate(col_rows):
+            place(by_col, ('c', j), len(entries))
+        for i, row in enumerate(rows):
+            place(by_row, ('r', i), len(row))
+        pivots = []
+
+        while True:
+            best = self._markowitz_pivot(rows, col_rows, by_col, by_row, threshold)
+            if best is None:
+                break
+            p, col = best
+            pivot_row = rows[p]
+            pivot = pivot_row[col]
+            active_rows.discard(p)
+            for j in pivot_row:
+                col_rows[j].discard(p)
+            updated = col_rows[col]
+            for i in updated:
+                row = rows[i]
+                f = row.pop(col)/pivot
+                for j, a in pivot_row.iteritems():
+                    if j == col:
+                        continue
+                    if j in row:
+                        value = row[j] - f*a
+                        if is_near_zero(value):
+                            del row[j]
+                            col_rows[j].discard(i)
+                        else:
+                            row[j] = value
+                    else:
+                        row[j] = -f*a
+                        col_rows[j].add(i)
+                rhs[i] = rhs[i] - f*rhs[p]
+            col_rows[col] = set()
+            pivots.append((p, col))
+            place(by_row, ('r', p), 0)
+            for i in updated:
+                place(by_row, ('r', i), len(rows[i]))
+            for j in pivot_row:
+                place(by_col, ('c', j), len(col_rows[j]))
+
+        ## Every equation without a pivot now reads 0 = constant
+        for i in active_rows:
+            if not is_near_zero(rhs[i]):
+                raise Exception(self.NO_SOLUTIONS_MSG)
+        return pivots, rows, rhs
+
+    def _markowitz_pivot(self, rows, col_rows, by_col, by_row, threshold):
+        ### Purpose: (row, col) of the qualifying entry of least Markowitz
+        ### cost, or None once no active entries are left
+        ### Columns and rows are visited by count k = 1, 2, ...; after the
+        ### columns and rows of count up to k every unseen entry costs at
+        ### least k*k, after the columns alone at least k*(k-1)
+        backend = self.backend
+        if not by_col:
+            return None
+        col_max = {}
+        best = [None, None]
+
+        def consider(i, j):
+            if threshold is not None:
+                if j not in col_max:
+                    col_max[j] = max([abs(backend.to_float(rows[r][j])) for r in col_rows[j]])
+                if abs(backend.to_float(rows[i][j])) < threshold*col_max[j]:
+                    return
+            ## ties go to the lowest column, then the lowest row
+            key = ((len(rows[i]) - 1)*(len(col_rows[j]) - 1), j, i)
+            if best[0] is None or key < best[0]:
+                best[0] = key
+                best[1] = (i, j)
+
+        for k in xrange(1, max(max(by_col), max(by_row)) + 1):
+            for _, j in sorted(by_col.get(k, ())):
+                for i in col_rows[j]:
+                    consider(i, j)
+            if best[0] is not None and best[0][0] <= k*(k-1):
+                break
+            for _, i in sorted(by_row.get(k, ())):
+                for j in rows[i]:
+                    consider(i, j)
+            if best[0] is not None and best[0][0] <= k*k:
+                break
+        return best[1]
+
+    def _parametrize(self, pivots, rows, rhs):
+        ### Purpose: basepoint and direction vectors by back substitution,
+        ### free variables zero for the basepoint and one at a time set to
+        ### one for the direction vectors (in column order)
+        backend = self.backend
+        pivot_cols = set(col for _, col in pivots)
+        free_cols = [j for j in xrange(self.dimension) if j not in pivot_cols]
+
+        def back_substitute(x, constants):
+            for p, col in reversed(pivots):
+                row = rows[p]
+                total = constants(p)
+                for j, a in row.iteritems():
+                    if j != col:
+                        total = total - a*x[j]
+                x[col] = total/row[col]
+            return x
+
+        basept = back_substitute([backend.zero]*self.dimension, rhs.__getitem__)
+        direction_vectors = []
+        for f in free_cols:
+            x = [backend.zero]*self.dimension
+            x[f] = backend.one
+            back_substitute(x, lambda p: backend.zero)
+            direction_vectors.append(x)
+        if direction_vectors:
+            basept, direction_vectors = self._dense_free_variables(basept, direction_vectors)
+        direction_vectors = [Vector._from_trusted(tuple(x), backend) for x in direction_vectors]
+        return Parametrization(Vector._from_trusted(tuple(basept), backend), direction_vectors)
+
+    def _dense_free_variables(self, basept, direction_vectors):
+        ### Purpose: the same solution set with the free variables the
+        ### dense RREF picks
+        ### Its pivot columns are the first independent ones from the left,
+        ### so its free columns are the first ones from the right on which
+        ### the direction vectors are independent. Gauss-Jordan on the
+        ### direction vectors taking pivot columns right to left leaves each
+        ### with a one in its own free column and zeros in the others.
+        backend = self.backend
+        to_float = backend.to_float
+        dirs = [list(d) for d in direction_vectors]
+        free = []
+        for j in xrange(self.dimension - 1, -1, -1):
+            k = len(free)
+            if k == len(dirs):
+                break
+            p = max(xrange(k, len(dirs)), key=lambda r: abs(to_float(dirs[r][j])))
+            if backend.is_near_zero(dirs[p][j]):
+                continue
+            dirs[k], dirs[p] = dirs[p], dirs[k]
+            pivot = dirs[k][j]
+            d = dirs[k] = [a/pivot for a in dirs[k]]
+            d[j] = backend.one
+            for r in xrange(len(dirs)):
+                f = dirs[r][j]
+                if r != k and f:
+                    dirs[r] = [a - f*b for a, b in zip(dirs[r], d)]
+                    dirs[r][j] = backend.zero
+            free.append(j)
+        for d, j in zip(dirs, free):
+            f = basept[j]
+            if f:
+                basept = [a - f*b for a, b in zip(basept, d)]
+                basept[j] = backend.zero
+        ## direction vectors in order of their free column, like the RREF
+        order = sorted(xrange(len(free)), key=free.__getitem__)
+        return basept, [dirs[k] for k in order]
+
+
+if __name__ == '__main__':
+
+    ## Sparse elimination tests against the dense LinearSystem
+    import random
+    from fractions import Fraction
+    random.seed(17)
+
+    def dense_solution(system):
+        ### -> Parametrization from compute_solution, None if no solutions
+        try:
+            return system.to_system().compute_solution()
+        except Exception as e:
+            if str(e) != SparseLinearSystem.NO_SOLUTIONS_MSG:
+                raise
+            return None
+
+    def sparse_solution(system):
+        try:
+            return system.compute_solution()
+        except Exception as e:
+            if str(e) != SparseLinearSystem.NO_SOLUTIONS_MSG:
+                raise
+            return None
+
+    def arrow(n, backend):
+        ### dense first row and column plus the diagonal: pivoting on
+        ### (0, 0) first fills every row, the Markowitz order fills nothing
+        rows = [dict((j, 1) for j in xrange(n))]
+        for i in xrange(1, n):
+            rows.append({0: 1, i: i + 1})
+        return SparseLinearSystem(rows, range(n), n, backend)
+
+    ## exact: same basepoint and direction vectors, free variables included
+    for case in xrange(200):
+        m, n = random.randint(1, 6), random.randint(1, 6)
+        rows = [dict((j, Fraction(random.randint(-3, 3))) for j in random.sample(xrange(n), random.randint(0, n)))
+                for _ in xrange(m)]
+        if case % 4 == 0 and m > 1:
+            rows[-1] = dict((j, 2*a) for j, a in rows[0].items())   # dependent row
+        system = SparseLinearSystem(rows, [random.randint(-3, 3) for _ in xrange(m)], n, 'fraction')
+        expected, got = dense_solution(system), sparse_solution(system)
+        if (expected is None) != (got is None):
+            print 'sparse test case 1 failed (case %d)' % case
+        elif expected is not None and (
+                got.base_pt.coord != expected.base_pt.coord or
+                [v.coord for v in got.lst_dir_vec] != [v.coord for v in expected.lst_dir_vec]):
+            print 'sparse test case 2 failed (case %d)' % case
+
+    ## Markowitz order: no fill-in on the arrow matrix, the dense column
+    ## is not taken first
+    system = arrow(8, 'fraction')
+    pivots, rows, rhs = system._eliminate()
+    if sum(len(r) for r in rows) > system.nnz or pivots[0][1] == 0:
+        print 'sparse test case 3 failed'
+    if len(pivots) != 8:
+        print 'sparse test case 4 failed'
+
+    ## free variables keep the fill-reducing order: an extra unknown that
+    ## only appears in the dense row is the one free variable the dense
+    ## RREF picks, although the Markowitz order leaves another one free
+    rows = [dict((j, 1) for j in xrange(9))]
+    for i in xrange(1, 8):
+        rows.append({0: 1, i: i + 1})
+    system = SparseLinearSystem(rows, range(8), 9, 'fraction')
+    pivots, _, _ = system._eliminate()
+    if 8 not in [col for _, col in pivots]:
+        print 'sparse test case 5 failed'
+    expected, got = dense_solution(system), sparse_solution(system)
+    if (got.base_pt.coord != expected.base_pt.coord or
+            [v.coord for v in got.lst_dir_vec] != [v.coord for v in expected.lst_dir_vec]):
+        print 'sparse test case 6 failed'
+
+    ## float with threshold pivoting: close to the dense solution
+    for case in xrange(50):
+        n = random.randint(2, 8)
+        rows = [dict((j, random.uniform(-1, 1)) for j in random.sample(xrange(n), random.randint(1, min(n, 3))))
+                for _ in xrange(n)]
+        for i in xrange(n):
+            rows[i][i] = rows[i].get(i, 0.) + 4.   # diagonally dominant
+        system = SparseLinearSystem(rows, [random.uniform(-1, 1) for _ in xrange(n)], n, 'float')
+        expected, got = dense_solution(system), sparse_solution(system)
+        if got.lst_dir_vec or not all(abs(a - b) < 1e-9 for a, b in zip(got.base_pt.coord, expected.base_pt.coord)):
+            print 'sparse test case 7 failed (case %d)' % case
+
+    ## a tiny leading entry is not taken as pivot
+    system = SparseLinearSystem([{0: 1e-8, 1: 1.}, {0: 1., 1: 1.}], [1., 2.], 2, 'float')
+    pivots, _, _ = system._eliminate()
+    if pivots[0] != (1, 0):
+        print 'sparse test case 8 failed'
+
+    ## no solutions
+    system = SparseLinearSystem([{0: 1, 1: 1}, {0: 2, 1: 2}], [1, 3], 2, 'fraction')
+    if sparse_solution(system) is not None:
+        print 'sparse test case 9 failed'
+
+    ## input checks
+    try:
+        SparseLinearSystem([{2: 1}], [0], 2)
+        print 'sparse test case 10 failed'
+    except Exception as e:
+        if str(e) != SparseLinearSystem.COLUMN_OUT_OF_RANGE_MSG:
+            print 'sparse test case 10 failed'
+    try:
+        SparseLinearSystem([{0: 1}], [0, 1], 2)
+        print 'sparse test case 11 failed'
+    except Exception as e:
+        if str(e) != SparseLinearSystem.WRONG_NUMBER_OF_CONSTANTS_MSG:
+            print 'sparse test case 11 failed'
+
+    ## CSR storage skips zeros and round-trips through the dense system
+    system = SparseLinearSystem([[(1, 2), (0, 0)], {0: 3}], [1, 2], 3, 'fraction')
+    if system.indptr != [0, 1, 2] or system.indices != [1, 0] or system.nnz != 2:
+        print 'sparse test case 12 failed'
+    if SparseLinearSystem.from_system(system.to_system()).data != system.data:
+        print 'sparse test case 13 failed'
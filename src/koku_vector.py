@@ -2,69 +2,143 @@
 #Created on Jun 6, 2016
 #author: Saeran Vasanthakumar
 '''
-from math import acos,pi
-from decimal import Decimal, getcontext
+from math import acos,pi,sqrt,fsum
+from decimal import Decimal
+from array import array
+from operator import add, sub, mul
 
-## Set the decimal precision to 30 places.
-getcontext().prec = 30
+from koku_numeric import get_backend, FLOAT
+
+## Vectors are immutable, so attributes are only ever written through this
+_set = object.__setattr__
 
 class Vector(object):
-    
+    """
+    Immutable n-dimensional vector. Coordinates are stored as a tuple in the
+    number type of the vector's koku_numeric backend. __slots__ keeps the
+    per-vector footprint small and derived vectors are built through
+    _from_trusted, which skips re-validating and re-converting coordinates
+    the library computed itself.
+    Because a vector never changes, its squared magnitude, magnitude and
+    unit vector are computed on first use and kept in the _mag2,
+    _magnitude and _unit slots (unset until then).
+    """
+    __slots__ = ('coord', 'dim', 'backend', '_mag2', '_magnitude', '_unit')
+
+    VECTOR_IS_IMMUTABLE_MSG = 'Vector is immutable'
     CANNOT_NORMALIZE_ZERO_VECTOR_MSG = 'Cannot normalize zero vector'
     NO_UNIQUE_PARALLEL_COMPONENT_MSG = 'No unique parallel component'
     NO_UNIQUE_ORTHOGONAL_COMPONENT_MSG = 'No unique orthogonal component'
     ONLY_DEFINED_IN_TWO_THREE_DIM_MSG = 'Cross product is limited to 2 or 3 dimensions'
+    COORDINATES_MUST_BE_NONEMPTY_MSG = 'The coordinates must be nonempty'
     
-    def __init__(self, coord):
+    def __init__(self, coord, backend=None):
+        ### backend: name or instance of a koku_numeric backend,
+        ### defaults to the backend currently in use
+        ### An unknown backend or a coordinate the backend cannot
+        ### convert raises ValueError with its own message
+        if not coord:
+            ## instantiate a custom instance of ValueError class with cust arg
+            raise ValueError(self.COORDINATES_MUST_BE_NONEMPTY_MSG)
+        backend = get_backend(backend)
         try:
-            if not coord:
-                raise ValueError
-            self.coord = tuple(map(lambda c: Decimal(c),coord))
-            self.dim = len(coord)
-            
+            coord = tuple(map(backend.convert,coord))
+            _set(self, 'backend', backend)
+            _set(self, 'coord', coord)
+            _set(self, 'dim', len(coord))
+
         except ValueError:
-            ## instantiate a custom instance of ValueError class with cust arg
-            raise ValueError('The coordinates must be nonempty')
+            raise
         except Exception as e: #TypeError:
             print str(e)
             #raise TypeError('The coordinates must be an iterable')
+    @classmethod
+    def _from_trusted(cls, coord, backend):
+        ### Purpose: internal constructor for coordinates the library
+        ### produced itself. coord must be a nonempty tuple already in
+        ### backend's number type, so no validation or conversion is done.
+        v = object.__new__(cls)
+        _set(v, 'backend', backend)
+        _set(v, 'coord', coord)
+        _set(v, 'dim', len(coord))
+        return v
+    def __setattr__(self, name, value):
+        raise AttributeError(self.VECTOR_IS_IMMUTABLE_MSG)
+    def __delattr__(self, name):
+        raise AttributeError(self.VECTOR_IS_IMMUTABLE_MSG)
+    def __reduce__(self):
+        ## slots + immutability need an explicit recipe for pickle/deepcopy
+        return (self.__class__, (self.coord, self.backend))
     def __repr__(self):
         return str([round(float(c),4) for c in self.coord])
     def __eq__(self, v):
         return self.coord == v.coord
+    def __ne__(self, v):
+        return not self.__eq__(v)
+    def __hash__(self):
+        return hash(self.coord)
+    def to_backend(self,backend):
+        ### Purpose: return this vector in another numeric backend
+        backend = get_backend(backend)
+        if backend is self.backend:
+            return self
+        return Vector(self.coord,backend)
+    def _same_backend(self,v):
+        ### Purpose: bring v into this vector's backend so mixed
+        ### operations (i.e. float + Decimal) work and keep self's type
+        if v.backend is self.backend:
+            return v
+        return v.to_backend(self.backend)
     def plus(self,v):
-        newv = map(lambda x: x[0]+x[1],zip(self.coord,v.coord))
-        return Vector(newv)
+        v = self._same_backend(v)
+        return Vector._from_trusted(tuple(map(add,self.coord,v.coord)),self.backend)
     def minus(self,v):
-        newv = map(lambda x: x[0]-x[1],zip(self.coord,v.coord))
-        return Vector(newv)
+        v = self._same_backend(v)
+        return Vector._from_trusted(tuple(map(sub,self.coord,v.coord)),self.backend)
     def times_scalar(self,scalar):
-        scalar = Decimal(scalar)
-        newv = map(lambda i: i*scalar,self.coord)
-        return Vector(newv)
+        scalar = self.backend.convert(scalar)
+        newv = tuple([c*scalar for c in self.coord])
+        return Vector._from_trusted(newv,self.backend)
+    def magnitude_squared(self):
+        ### Purpose: v*v, memoized
+        try:
+            return self._mag2
+        except AttributeError:
+            mag2 = sum(map(mul,self.coord,self.coord))
+            _set(self, '_mag2', mag2)
+            return mag2
     def magnitude(self):
         ### Purpose: find the magnitude of a vector.
         ### find square root of sum of square of 
         ### change in all coordinates
-        mag_lst = map(lambda c: c*c,self.coord) 
-        sum_ = reduce(lambda i,j: i+j, mag_lst)
-        return sum_**Decimal('.5')
+        try:
+            return self._magnitude
+        except AttributeError:
+            mag = self.backend.sqrt(self.magnitude_squared())
+            _set(self, '_magnitude', mag)
+            return mag
     def normalized(self):
         ### Purpose: find the direction of vector aka 
         ### return the unit vector
         ### divide the vector coordinates by the magnitde
         ### of the vector
+        try:
+            return self._unit
+        except AttributeError:
+            pass
         try:
             magnitude = self.magnitude()
-            return self.times_scalar(Decimal('1.')/magnitude)
+            unit = self.times_scalar(self.backend.one/magnitude)
         except ZeroDivisionError:
             ## raise genertic Exception class with custom arg
             raise Exception(self.CANNOT_NORMALIZE_ZERO_VECTOR_MSG)
+        _set(self, '_unit', unit)
+        return unit
     def dot_product(self,v):
         ### Purpose: Return dot product of two vectors
         ### v*w = v1*w1 + v2*w2 + .... + vn*wn
-        prod_lst = map(lambda i: i[0]*i[1], zip(self.coord,v.coord))
-        return reduce(lambda i,j: i+j, prod_lst)
+        v = self._same_backend(v)
+        return sum(map(mul,self.coord,v.coord))
     def angle(self,v,units='deg'):
         ### Purpse: Return angle between two vectors in degrees
         ### theta = arcos(v*w / ||v|*||w||)
@@ -72,9 +146,12 @@ class Vector(object):
         ### theta = arcos(normalized(v)*normalized(w))
         try:
             unitdotprod = self.normalized().dot_product(v.normalized())
+            #clamp rounding error so acos stays in its domain
+            unitdotprod = max(-1., min(1., float(unitdotprod)))
             rad = acos(unitdotprod)
             deg = str(rad*(180./pi)) #because 180 deg == pi
-            angle = Decimal(rad) if units == 'rad' else Decimal(deg)
+            convert = self.backend.convert
+            angle = convert(rad) if units == 'rad' else convert(deg)
             return angle
         except Exception as e:
             ## Pass generic Exception type as e variable 
@@ -87,23 +164,51 @@ class Vector(object):
             else:
                 print 'def angle error', str(e)
         
-    def is_zero(self,tolerance=Decimal(str(1e-10))):
-        return self.magnitude() < tolerance
-    def is_parallel(self,v):
+    def is_zero(self,tolerance=None):
+        return self.backend.is_near_zero(self.magnitude(),tolerance)
+    def parallel_orientation(self,v,tolerance=None):
+        ### Purpose: Checks if vector is parallel and which way it points
+        ### returns 1 if v points the same way (angle 0),
+        ### -1 if v points the opposite way (angle 180),
+        ### 0 if not parallel or if either vector is zero.
+        ### tolerance: largest angle (radians) still counted as parallel,
+        ### defaults to the backend's angle_tolerance (1e-10 for
+        ### Decimal, 1e-7 for float, exact for Fraction)
+        ### The angle check is done as sin(theta)^2 <= tolerance^2, where
+        ### sin^2 = 1 - (v*w)^2/(|v|^2|w|^2). That needs no sqrt or
+        ### acos, so it holds up in float and stays exact for Fraction,
+        ### and it only costs one dot product on top of the memoized
+        ### squared magnitudes.
+        ### self -> int
+        if self.is_zero() or v.is_zero():
+            return 0
+        v = self._same_backend(v)
+        if tolerance is None:
+            tolerance = self.backend.angle_tolerance
+        dot = self.dot_product(v)
+        sin2 = 1 - dot*dot/(self.magnitude_squared()*v.magnitude_squared())
+        if not self.backend.is_near_zero(sin2,tolerance*tolerance):
+            return 0
+        return 1 if dot > 0 else -1
+    def is_parallel(self,v,tolerance=None):
         ### Purpose: Checks if vector is parallel
         ### examines if either vector is zero vector (returns True),
         ### checks if abs angle is 0 or 180
         ### returns True; else if all False returns False.
         ### self -> boolean
-        return self.is_zero() or v.is_zero()\
-        or self.angle(v) == Decimal('0.') \
-        or self.angle(v) == Decimal('180.')
-    def is_orthogonal(self,v,tolerance=Decimal(str(1e-10))):
+        return self.is_zero() or v.is_zero() \
+        or self.parallel_orientation(v,tolerance) != 0
+    def is_antiparallel(self,v,tolerance=None):
+        ### Purpose: Checks if vector is parallel and points the
+        ### opposite way (angle of 180)
+        ### self -> boolean
+        return self.parallel_orientation(v,tolerance) == -1
+    def is_orthogonal(self,v,tolerance=None):
         ### Purpose: Checks if vector is perpendicular
         ### examines if dot product == 0. (cos(theta) == 0
         ### returns True or False
         ### self -> boolean
-        return abs(self.dot_product(v)) < tolerance
+        return self.backend.is_near_zero(self.dot_product(v),tolerance)
     def component_projected_to(self,basis):
         ### Purpose: projects self.vector onto basis
         ### vector b; returns projected vector
@@ -124,7 +229,7 @@ class Vector(object):
         ### projection on the basis vector
         ### vector - vector_parrallel = vector_perpendicular
         try:
-            vector_parrallel = self.component_parallel_to(basis)
+            vector_parrallel = self.component_projected_to(basis)
             vector_perpendicular = self.minus(vector_parrallel)
             return vector_perpendicular
         except Exception as e:
@@ -143,15 +248,19 @@ class Vector(object):
         ###  [-(x1z2 - x2z1)]
         ###  [y2x1 - y1x2]]
         try:
+            w = self._same_backend(w)
             if self.dim == 2:
-                self, w = Vector(self.coord.append(0)), Vector(w.coord.append(0))
+                #treat 2d vectors as lying in the z = 0 plane
+                zero = (self.backend.zero,)
+                self = Vector._from_trusted(self.coord + zero, self.backend)
+                w = Vector._from_trusted(w.coord + zero, self.backend)
             x1,y1,z1 = self.coord
             x2,y2,z2 = w.coord
             if self.dim == 3:
-                new_coord = [ y1*z2 - y2*z1,
+                new_coord = ( y1*z2 - y2*z1,
                             -(x1*z2 - x2*z1),
-                              x1*y2 - x2*y1]
-                return Vector(new_coord)
+                              x1*y2 - x2*y1)
+                return Vector._from_trusted(new_coord,self.backend)
         except ValueError as e:
             print self.ONLY_DEFINED_IN_TWO_THREE_DIM_MSG
             raise e
@@ -167,18 +276,250 @@ class Vector(object):
         ### Purpose: Input two vectors in three or two dim
         ### and output the area of triangle defined by both
         ### Formula: ||v x w|| = |v||w||sin(theta) = area of parallelogram
-        return self.area_of_parallelogram(w)/Decimal('2.0')
+        return self.area_of_parallelogram(w)/2
     def __getitem__(self, i):
         return self.coord[i]
-    def __setitem__(self, i, x):
-        #x is vector coordinate we are swapping
-        self.coord[i] = x
     
+class VectorAccumulator(object):
+    """
+    Mutable running vector for hot loops (centroids, force accumulation).
+    += v, -= v and *= k update the coordinates in place, so summing N
+    vectors allocates no intermediate Vectors. Call to_vector() to get an
+    immutable Vector back out.
+    count is the number of vectors in the running sum: += and add_scaled
+    add one, -= takes one away, so mean() is the centroid of what is left.
+    """
+    DIMENSIONS_MUST_MATCH_MSG = 'Cannot accumulate vectors of different dimension'
+
+    def __init__(self, dim, backend=None):
+        self.backend = get_backend(backend)
+        self.dim = dim
+        self.coord = [self.backend.zero]*dim
+        self.count = 0
+    @classmethod
+    def from_vector(cls, v):
+        acc = cls(v.dim, v.backend)
+        acc.coord[:] = v.coord
+        acc.count = 1
+        return acc
+    def __repr__(self):
+        return 'VectorAccumulator(%s)' % str([round(float(c),4) for c in self.coord])
+    def _coord_of(self, v):
+        if v.dim != self.dim:
+            raise ValueError(self.DIMENSIONS_MUST_MATCH_MSG)
+        if v.backend is not self.backend:
+            v = v.to_backend(self.backend)
+        return v.coord
+    def __iadd__(self, v):
+        coord = self.coord
+        for i, w in enumerate(self._coord_of(v)):
+            coord[i] += w
+        self.count += 1
+        return self
+    def __isub__(self, v):
+        coord = self.coord
+        for i, w in enumerate(self._coord_of(v)):
+            coord[i] -= w
+        self.count -= 1
+        return self
+    def __imul__(self, scalar):
+        scalar = self.backend.convert(scalar)
+        self.coord[:] = [c*scalar for c in self.coord]
+        return self
+    def add_scaled(self, v, scalar):
+        ### Purpose: self += scalar*v without building scalar*v
+        scalar = self.backend.convert(scalar)
+        coord = self.coord
+        for i, w in enumerate(self._coord_of(v)):
+            coord[i] += scalar*w
+        self.count += 1
+        return self
+    def reset(self):
+        self.coord[:] = [self.backend.zero]*self.dim
+        self.count = 0
+    def to_vector(self):
+        return Vector._from_trusted(tuple(self.coord), self.backend)
+    def mean(self):
+        ### Purpose: the running sum divided by count
+        if self.count <= 0:
+            raise ValueError('Cannot take the mean of an empty accumulator')
+        return self.to_vector().times_scalar(self.backend.one/self.count)
+
+
+def sum_vectors(vectors, backend=None):
+    ### Purpose: sum a sequence of Vectors in one pass, summing each
+    ### coordinate column at once instead of building N-1 partial sums
+    ### backend defaults to the backend of the first vector
+    ### VectorBatch input is summed in float
+    if isinstance(vectors, VectorBatch):
+        d = vectors.dim
+        return Vector([fsum(vectors.data[i::d]) for i in xrange(d)], 'float')
+    vectors = list(vectors)
+    if not vectors:
+        raise ValueError('Cannot sum an empty sequence of vectors')
+    backend = get_backend(backend or vectors[0].backend)
+    dim = vectors[0].dim
+    coords = []
+    for v in vectors:
+        if v.dim != dim:
+            raise ValueError(VectorAccumulator.DIMENSIONS_MUST_MATCH_MSG)
+        if v.backend is not backend:
+            v = v.to_backend(backend)
+        coords.append(v.coord)
+    zero = backend.zero
+    return Vector._from_trusted(tuple([sum(col, zero) for col in zip(*coords)]), backend)
+
+
+def centroid(vectors, backend=None):
+    ### Purpose: the average of a sequence of Vectors (or a VectorBatch)
+    if isinstance(vectors, VectorBatch):
+        if not vectors.size:
+            raise ValueError('Cannot take the centroid of an empty batch')
+        return sum_vectors(vectors).times_scalar(1./vectors.size)
+    vectors = list(vectors)
+    total = sum_vectors(vectors, backend)
+    return total.times_scalar(total.backend.one/len(vectors))
+
+class VectorBatch(object):
+    """
+    Structure-of-arrays container for N vectors of the same dimension.
+    The coordinates live in one contiguous array('d') laid out as
+    [v0_0, v0_1, ... v0_d, v1_0, v1_1, ...], so bulk operations loop
+    over flat floats instead of building a Vector (and re-wrapping every
+    coordinate in Decimal) per point.
+    """
+    DIMENSIONS_MUST_MATCH_MSG = 'All vectors in the batch must have the same dimension'
+    BATCH_SIZES_MUST_MATCH_MSG = 'Batches must have the same size and dimension'
+    DATA_MUST_FIT_DIM_MSG = 'The length of the data must be a multiple of the dimension'
+
+    def __init__(self, data, dim):
+        if dim < 1 or len(data) % dim:
+            raise ValueError(self.DATA_MUST_FIT_DIM_MSG)
+        if isinstance(data, array) and data.typecode == 'd':
+            self.data = data
+        else:
+            self.data = array('d', data)
+        self.dim = dim
+        self.size = len(self.data) // dim
+
+    @classmethod
+    def from_vectors(cls, vectors):
+        ### Purpose: pack a sequence of Vectors into one batch
+        vectors = list(vectors)
+        if not vectors:
+            raise ValueError('The batch must contain at least one vector')
+        dim = vectors[0].dim
+        data = array('d')
+        for v in vectors:
+            if v.dim != dim:
+                raise ValueError(cls.DIMENSIONS_MUST_MATCH_MSG)
+            data.extend(map(float, v.coord))
+        return cls(data, dim)
+
+    @classmethod
+    def from_coords(cls, coords):
+        ### Purpose: pack a sequence of coordinate sequences
+        ### (i.e. [(x,y,z), (x,y,z), ...]) into one batch
+        coords = list(coords)
+        if not coords:
+            raise ValueError('The batch must contain at least one vector')
+        dim = len(coords[0])
+        data = array('d')
+        for c in coords:
+            if len(c) != dim:
+                raise ValueError(cls.DIMENSIONS_MUST_MATCH_MSG)
+            data.extend(map(float, c))
+        return cls(data, dim)
+
+    def __len__(self):
+        return self.size
+    def __repr__(self):
+        return 'VectorBatch(size=%d, dim=%d)' % (self.size, self.dim)
+    def coord(self, i):
+        ### Purpose: return the coordinates of the i-th vector as a tuple
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError('VectorBatch index out of range')
+        return tuple(self.data[i*self.dim:(i+1)*self.dim])
+    def __getitem__(self, i):
+        ### The batch holds float64, so each item is a float Vector
+        return Vector._from_trusted(self.coord(i), FLOAT)
+    def __iter__(self):
+        for i in xrange(self.size):
+            yield self[i]
+    def to_vectors(self, backend=None):
+        ### backend: None for float Vectors, like indexing, or the
+        ### backend to convert to
+        if backend is None:
+            return list(self)
+        return [Vector(self.coord(i),backend) for i in xrange(self.size)]
+
+    def _other_data(self, v):
+        ### Purpose: return flat data matching self.data for either
+        ### another batch of the same shape or a single Vector,
+        ### which is broadcast across the whole batch
+        if isinstance(v, VectorBatch):
+            if v.dim != self.dim or v.size != self.size:
+                raise ValueError(self.BATCH_SIZES_MUST_MATCH_MSG)
+            return v.data
+        if len(v.coord) != self.dim:
+            raise ValueError(self.DIMENSIONS_MUST_MATCH_MSG)
+        return array('d', map(float, v.coord)) * self.size
+    def _row_sums(self, flat):
+        ### Purpose: sum each run of dim values in a flat sequence
+        d = self.dim
+        if d == 2:
+            return array('d', map(add, flat[0::2], flat[1::2]))
+        if d == 3:
+            return array('d', map(lambda a,b,c: a+b+c,
+                                  flat[0::3], flat[1::3], flat[2::3]))
+        return array('d', [sum(flat[i:i+d]) for i in xrange(0, len(flat), d)])
+    def _repeat_per_coord(self, values):
+        ### Purpose: repeat one value per vector dim times so it lines
+        ### up with self.data
+        d = self.dim
+        if d == 1:
+            return values
+        r = range(d)
+        return [x for x in values for _ in r]
+
+    def plus(self, v):
+        return VectorBatch(array('d', map(add, self.data, self._other_data(v))), self.dim)
+    def minus(self, v):
+        return VectorBatch(array('d', map(sub, self.data, self._other_data(v))), self.dim)
+    def times_scalar(self, scalar):
+        ### Purpose: scale every vector by one scalar, or the i-th vector
+        ### by scalar[i] when a sequence of per-vector scalars is given
+        try:
+            scalars = list(map(float, scalar))
+        except TypeError:
+            s = float(scalar)
+            return VectorBatch(array('d', [x*s for x in self.data]), self.dim)
+        if len(scalars) != self.size:
+            raise ValueError(self.BATCH_SIZES_MUST_MATCH_MSG)
+        return VectorBatch(array('d', map(mul, self.data, self._repeat_per_coord(scalars))), self.dim)
+    def dot_product(self, v):
+        ### Purpose: Return the dot product of each vector with the
+        ### matching vector of v (or with v itself if v is a Vector)
+        return self._row_sums(map(mul, self.data, self._other_data(v)))
+    def magnitude(self):
+        data = self.data
+        return array('d', map(sqrt, self._row_sums(map(mul, data, data))))
+    def normalized(self):
+        ### Purpose: return a batch of unit vectors
+        ### Raises the same error as Vector.normalized if any vector is zero
+        try:
+            inv = [1./m for m in self.magnitude()]
+        except ZeroDivisionError:
+            raise Exception(Vector.CANNOT_NORMALIZE_ZERO_VECTOR_MSG)
+        return VectorBatch(array('d', map(mul, self.data, self._repeat_per_coord(inv))), self.dim)
+
 class MyDecimal(Decimal):
     def is_near_zero(self, eps=1E-10):
         return abs(float(self)) < eps
 
-if True:
+if __name__ == '__main__':
     
     ### Vector Tests
     #"""
@@ -279,4 +620,196 @@ if True:
     print vm
     """
 
-        
\ No newline at end of file
+        
+    ## VectorBatch tests
+    ## every batch operation matches the same operation on single Vectors
+    batch_0 = VectorBatch.from_coords([(1,2,3),(-4,5,0.5),(0,0,2)])
+    batch_1 = VectorBatch.from_vectors([Vector([2,0,1],'float'),Vector([1,1,1],'float'),Vector([3,-2,0],'float')])
+    vecs_0 = batch_0.to_vectors('float')
+    vecs_1 = batch_1.to_vectors('float')
+    if not (len(batch_0) == 3 and batch_0.coord(1) == (-4.,5.,0.5) and batch_0.coord(-1) == (0.,0.,2.)):
+        print 'VectorBatch test case 1 failed'
+    if not [batch_0.plus(batch_1).coord(i) for i in range(3)] == [v.plus(w).coord for v,w in zip(vecs_0,vecs_1)]:
+        print 'VectorBatch test case 2 failed'
+    if not [batch_0.minus(batch_1).coord(i) for i in range(3)] == [v.minus(w).coord for v,w in zip(vecs_0,vecs_1)]:
+        print 'VectorBatch test case 3 failed'
+    if not list(batch_0.dot_product(batch_1)) == [v.dot_product(w) for v,w in zip(vecs_0,vecs_1)]:
+        print 'VectorBatch test case 4 failed'
+    if not all(abs(m - v.magnitude()) < 1e-12 for m,v in zip(batch_0.magnitude(),vecs_0)):
+        print 'VectorBatch test case 5 failed'
+    unit = batch_0.normalized()
+    if not all(abs(a - b) < 1e-12 for i,v in enumerate(vecs_0) for a,b in zip(unit.coord(i),v.normalized().coord)):
+        print 'VectorBatch test case 6 failed'
+    ## a single Vector is broadcast, per-vector scalars line up
+    if not [batch_0.plus(Vector([1,1,1],'float')).coord(i) for i in range(3)] == [(2.,3.,4.),(-3.,6.,1.5),(1.,1.,3.)]:
+        print 'VectorBatch test case 7 failed'
+    if not [batch_0.times_scalar([1,2,-1]).coord(i) for i in range(3)] == [(1.,2.,3.),(-8.,10.,1.),(0.,0.,-2.)]:
+        print 'VectorBatch test case 8 failed'
+    ## shape errors
+    try:
+        batch_0.plus(VectorBatch.from_coords([(1,2,3)]))
+        print 'VectorBatch test case 9 failed'
+    except ValueError:
+        pass
+    try:
+        VectorBatch.from_coords([(1,0,0),(0,0)]).normalized()
+        print 'VectorBatch test case 10 failed'
+    except ValueError:
+        pass
+    try:
+        VectorBatch.from_coords([(1,0,0),(0,0,0)]).normalized()
+        print 'VectorBatch test case 11 failed'
+    except Exception as e:
+        if Vector.CANNOT_NORMALIZE_ZERO_VECTOR_MSG not in e.args:
+            print 'VectorBatch test case 11 failed'
+    ## items are float Vectors without conversion, to_vectors converts
+    ## only when given a backend
+    item = batch_0[1]
+    if not (item.backend is FLOAT and item.coord == (-4., 5., 0.5) and batch_0[-1].coord == (0., 0., 2.)):
+        print 'VectorBatch test case 12 failed'
+    if not all(v.backend is FLOAT for v in batch_0) or \
+            [v.coord for v in batch_0.to_vectors()] != [batch_0.coord(i) for i in xrange(3)]:
+        print 'VectorBatch test case 13 failed'
+    if not all(v.backend is get_backend('fraction') for v in batch_0.to_vectors('fraction')):
+        print 'VectorBatch test case 14 failed'
+
+    ## Numeric backend tests
+    from fractions import Fraction
+    from koku_numeric import UNKNOWN_BACKEND_MSG
+    ## an unknown backend is reported as such, not as empty coordinates
+    try:
+        Vector([1,2], backend='quad')
+        print 'backend test case 1 failed'
+    except ValueError as e:
+        if UNKNOWN_BACKEND_MSG not in str(e):
+            print 'backend test case 1 failed'
+    try:
+        Vector([])
+        print 'backend test case 2 failed'
+    except ValueError as e:
+        if str(e) != Vector.COORDINATES_MUST_BE_NONEMPTY_MSG:
+            print 'backend test case 2 failed'
+    try:
+        Vector(['x'], 'float')
+        print 'backend test case 3 failed'
+    except ValueError as e:
+        if str(e) == Vector.COORDINATES_MUST_BE_NONEMPTY_MSG:
+            print 'backend test case 3 failed'
+    ## derived vectors keep their backend, mixed operations take self's
+    vector_f = Vector([1,2,3],'float')
+    vector_q = Vector([Fraction(1,3),0,1],'fraction')
+    if not (type(vector_f.plus(vector_q).coord[0]) is float and vector_q.plus(vector_f).coord[0] == Fraction(4,3)):
+        print 'backend test case 4 failed'
+    if not vector_q.times_scalar(3).coord == (1,0,3):
+        print 'backend test case 5 failed'
+    ## is_parallel: angle tolerance in radians, from the backend
+    vector_0 = Vector([1,0],'float')
+    if not (vector_0.is_parallel(Vector([1,1E-9],'float')) and not vector_0.is_parallel(Vector([1,1E-6],'float'))):
+        print 'backend test case 6 failed'
+    if not (Vector([1,0]).is_parallel(Vector([1,'1E-11'])) and not Vector([1,0]).is_parallel(Vector([1,'1E-9']))):
+        print 'backend test case 7 failed'
+    if Vector([1,0],'fraction').is_parallel(Vector([1,Fraction(1,10**20)],'fraction')):
+        print 'backend test case 8 failed'
+    if not (vector_0.is_parallel(Vector([1,1E-6],'float'), tolerance=1E-5) and
+            Vector([-7.579,-7.88],'float').is_antiparallel(Vector([22.737,23.64],'float'))):
+        print 'backend test case 9 failed'
+
+    ## Immutable Vector tests
+    import copy, pickle
+    vector_0 = Vector(['1.5','2','-3'])
+    try:
+        vector_0.coord = (0,0,0)
+        print 'immutable test case 1 failed'
+    except AttributeError:
+        pass
+    try:
+        del vector_0.dim
+        print 'immutable test case 2 failed'
+    except AttributeError:
+        pass
+    if hasattr(vector_0, '__dict__'):
+        print 'immutable test case 3 failed'
+    ## pickle and deepcopy go through __reduce__ and keep the backend
+    for vector_1 in (pickle.loads(pickle.dumps(vector_0)), copy.deepcopy(vector_0)):
+        if not (vector_1 == vector_0 and vector_1.backend is vector_0.backend and vector_1.dim == 3):
+            print 'immutable test case 4 failed'
+    vector_f = Vector([1,2],'float')
+    if not pickle.loads(pickle.dumps(vector_f, 2)).backend is vector_f.backend:
+        print 'immutable test case 5 failed'
+    ## hashable, equal vectors hash alike
+    if not len(set([Vector([1,2]), Vector(['1','2']), Vector([2,1])])) == 2:
+        print 'immutable test case 6 failed'
+    ## derived vectors are built without re-conversion but are the same
+    ## as converting from scratch
+    if not (vector_0.plus(vector_0) == Vector(['3','4','-6']) and
+            vector_0.times_scalar(2) == Vector([3,4,-6]) and
+            vector_0.minus(vector_0).coord == (0,0,0)):
+        print 'immutable test case 7 failed'
+    if not Vector._from_trusted((1.,2.), vector_f.backend) == vector_f:
+        print 'immutable test case 8 failed'
+
+    ## Cached magnitude and unit vector tests
+    vector_0 = Vector([3,4],'float')
+    if hasattr(vector_0, '_magnitude') or hasattr(vector_0, '_unit'):
+        print 'cache test case 1 failed'
+    if not (vector_0.magnitude() == 5. and vector_0._magnitude == 5. and vector_0.magnitude_squared() == 25.):
+        print 'cache test case 2 failed'
+    unit = vector_0.normalized()
+    if not (unit is vector_0.normalized() and abs(unit.coord[0] - 0.6) < 1e-15 and abs(unit.coord[1] - 0.8) < 1e-15):
+        print 'cache test case 3 failed'
+    ## derived vectors start with an empty cache
+    if hasattr(vector_0.times_scalar(2), '_magnitude') or not vector_0.times_scalar(2).magnitude() == 10.:
+        print 'cache test case 4 failed'
+    ## the zero vector raises every time and caches no unit vector
+    vector_z = Vector([0,0],'float')
+    for _ in range(2):
+        try:
+            vector_z.normalized()
+            print 'cache test case 5 failed'
+        except Exception as e:
+            if Vector.CANNOT_NORMALIZE_ZERO_VECTOR_MSG not in e.args:
+                print 'cache test case 5 failed'
+    if hasattr(vector_z, '_unit'):
+        print 'cache test case 6 failed'
+
+    ## VectorAccumulator, sum_vectors and centroid tests
+    points = [Vector([1,2,3]), Vector(['0.5','-1','2']), Vector([-3,0,'1.5'])]
+    acc = VectorAccumulator(3)
+    for p in points:
+        acc += p
+    if not (acc.to_vector() == sum_vectors(points) == Vector(['-1.5','1','6.5']) and acc.count == 3):
+        print 'accumulator test case 1 failed'
+    if not acc.mean() == centroid(points):
+        print 'accumulator test case 2 failed'
+    ## -= takes a vector back out of the running sum and the mean
+    acc -= points[2]
+    if not (acc.count == 2 and acc.mean() == centroid(points[:2])):
+        print 'accumulator test case 3 failed'
+    ## in place: the coordinate list is updated, not replaced
+    coord = acc.coord
+    acc += points[2]
+    acc.add_scaled(points[0], -2)
+    if not (acc.coord is coord and acc.to_vector() == sum_vectors(points).minus(points[0].times_scalar(2))):
+        print 'accumulator test case 4 failed'
+    acc *= 0
+    if not acc.to_vector().coord == (0,0,0):
+        print 'accumulator test case 5 failed'
+    acc.reset()
+    try:
+        acc.mean()
+        print 'accumulator test case 6 failed'
+    except ValueError:
+        pass
+    try:
+        acc += Vector([1,2])
+        print 'accumulator test case 7 failed'
+    except ValueError:
+        pass
+    ## float vectors are converted into the accumulator's backend
+    acc = VectorAccumulator.from_vector(Vector([1,1],'fraction'))
+    acc += Vector([0.5,0.25],'float')
+    if not (acc.to_vector().backend.name == 'fraction' and acc.mean() == Vector(['0.75','0.625'],'fraction')):
+        print 'accumulator test case 8 failed'
+    batch = VectorBatch.from_coords([p.coord for p in points])
+    if not all(abs(a - float(b)) < 1e-12 for a, b in zip(centroid(batch).coord, centroid(points).coord)):
+        print 'accumulator test case 9 failed'